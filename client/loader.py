@@ -3,12 +3,25 @@
 #
 # The data is de-normalized and some of the fields don't match, but it's good
 # enough to populate the models with some reasonable-looking data.
+#
+# This loads through the API, e.g. to a remote deployment. For a local database, `./manage.py import_catalog`
+# is much faster. Courses are posted --concurrency at a time over keep-alive connections, authorized with an
+# OAuth2 --token (or $ACCESS_TOKEN) or, for a local dev server, --basic user:password:
+#
+# $ client/loader.py --url https://example.com/v1/operations/ --token $ACCESS_TOKEN --concurrency 8 ods-courses.json
 
-import json
-from pprint import pprint
-import requests
+import argparse
 import base64
 import copy
+import json
+import os
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+import requests
+from requests.adapters import HTTPAdapter
+from urllib3.util.retry import Retry
 
 # what a jsonapi GET/POST response/request should look like
 COURSE_POST = {
@@ -47,16 +60,7 @@ COURSE_TERM_POST = {
     }
 }
 
-# work around inability to directly PATCH the relationships with the course and/or term
-# by separately updating the course relationship
-COURSE_TERM_REL_PATCH = {
-    "data": [
-        {
-            "type": "course_terms",
-            "id": "e724c43c-f443-4246-8947-a8bb8953699c"
-        }
-    ]
-}
+ATOMIC = 'application/vnd.api+json; ext="https://jsonapi.org/ext/atomic"'
 
 
 def basic_auth(user,password):
@@ -66,19 +70,43 @@ def basic_auth(user,password):
 HEADERS = {
     "Accept": "application/vnd.api+json",
     "Content-Type": "application/vnd.api+json",
-    "Authorization": "Basic " + basic_auth("admin", "admin123")
 }
 
+# response status codes that are retried, with exponential backoff (honoring Retry-After): the server
+# turned the request away without performing it. A POST isn't idempotent, so a 500, 502 or 504 or a read
+# timeout, after which the operations may or may not have been committed, isn't retried: the retried adds
+# would fail on the unique course and term identifiers.
+RETRY_STATUS = (429, 503)
+
+_local = threading.local()
 
-def post_course(url, data):
+
+def session(args):
+    """
+    :return: this thread's keep-alive session, which retries POSTs on connect errors (the request wasn't sent)
+        and RETRY_STATUS but not on read errors.
     """
-    add a course first. NB the opendataservice data is not 1:1 with this schema. Just fake it.
-    :param url: url to post to
+    if not hasattr(_local, "session"):
+        retry = Retry(total=args.retries, read=0, other=0, backoff_factor=args.backoff,
+                      status_forcelist=RETRY_STATUS, allowed_methods=frozenset(["POST"]), raise_on_status=False)
+        _local.session = requests.Session()
+        _local.session.mount("https://", HTTPAdapter(max_retries=retry))
+        _local.session.mount("http://", HTTPAdapter(max_retries=retry))
+        _local.session.headers.update(HEADERS)
+        if args.token:
+            _local.session.headers["Authorization"] = "Bearer " + args.token
+        elif args.basic:
+            _local.session.headers["Authorization"] = "Basic " + basic_auth(*args.basic.split(":", 1))
+    return _local.session
+
+
+def course_attributes(data):
+    """
+    NB the opendataservice data is not 1:1 with this schema. Just fake it.
     :param data: item from ods-courses
-    :return: id of newly-created course or None
+    :return: course attributes
     """
-
-    cdata = COURSE_POST["data"]["attributes"]
+    cdata = copy.deepcopy(COURSE_POST["data"]["attributes"])
     cdata["school_bulletin_prefix_code"] = data["BulletinFlags"]
     cdata["suffix_two"] = "00"
     cdata["subject_area_code"] = data["DepartmentCode"]
@@ -87,74 +115,97 @@ def post_course(url, data):
     cdata["course_name"] = data["CourseTitle"]
     cdata["course_description"] = data["CourseSubtitle"]
     cdata["last_mod_user_name"] = "loader"
+    return cdata
 
-    response = requests.post(url, data=json.dumps(COURSE_POST), headers=HEADERS)
-    if response.status_code == 201:
-        return json.loads(response.content)["data"]["id"]
-    else:
-        print("post_course error {}: {} {}".format(response.status_code, cdata["course_identifier"], json.loads(response.content)))
-        return None
 
-
-def post_term(url, cid, data):
+def term_attributes(data):
     """
-    add a course-term mapping, but can't add the relationship in a single POST due to a bug
-    See https://gitlab.cc.columbia.edu/ac45/django-training/issues/1
-    TODO: confirm if this is still a bug
-
-    :param url: url to post to
-    :param cid: course id to link back to
-    :param data: item from ods-course
-    :return: URL to newly created term or None
+    :param data: item from ods-courses
+    :return: course_term attributes
     """
-
-    cdata = COURSE_TERM_POST["data"]["attributes"]
-    cdata["term_identifier"] = "{:<5}{:<9}".format(data["Term"], data["Course"])
+    cdata = copy.deepcopy(COURSE_TERM_POST["data"]["attributes"])
+    cdata["term_identifier"] = "{:<5}{:<9}".format(data["Term"], data["Course"][:9])  # chop off the section.
     cdata["audit_permitted_code"] = 0
     cdata["exam_credit_flag"] = False
-    cdata["last_mod_user_name"] =  "loader"
-    response = requests.post(url, data=json.dumps(COURSE_TERM_POST), headers=HEADERS)
-    if response.status_code == 201:
-        return json.loads(response.content)["data"]["id"]
-    else:
-        print("post_term error {}: {} {}".format(response.status_code, cid, json.loads(response.content)))
-        return None
+    cdata["last_mod_user_name"] = "loader"
+    return cdata
 
 
-def patch_course_term_relationship(url, cid, tid):
+def post_course_and_term(args, data):
     """
-    update the given course (cid) by PATCHing a course_terms (tid) relationship
-    :param url: baseurl for courses
-    :param cid: course ID
-    :param tid: term ID
-    :return: cid or None
+    add a course and its course_term in one request using the {json:api} Atomic Operations extension:
+    the course_term's relationship to the course is set with the course's local id (lid).
+
+    :param args: command line arguments: the operations url to post to, etc.
+    :param data: item from ods-courses
+    :return: (course id, course_term id) or None
     """
-    rel = COURSE_TERM_REL_PATCH["data"][0]
-    rel["id"] = tid
-    response = requests.patch(url + cid + "/relationships/course_terms/", data=json.dumps(COURSE_TERM_REL_PATCH), headers=HEADERS)
+    operations = {
+        "atomic:operations": [
+            {"op": "add", "data": {"type": "courses", "lid": "course", "attributes": course_attributes(data)}},
+            {"op": "add", "data": {"type": "course_terms", "attributes": term_attributes(data),
+                                   "relationships": {"course": {"data": {"type": "courses", "lid": "course"}}}}},
+        ]
+    }
+    headers = {"Accept": ATOMIC, "Content-Type": ATOMIC}
+    try:
+        response = session(args).post(args.url, data=json.dumps(operations), headers=headers, timeout=args.timeout)
+    except requests.RequestException as e:
+        print("post_course_and_term error: {} {}".format(data["Course"][:9], e))
+        return None
     if response.status_code == 200:
-        return json.loads(response.content)["data"][0]["id"]
+        results = json.loads(response.content)["atomic:results"]
+        return results[0]["data"]["id"], results[1]["data"]["id"]
     else:
-        print("patch_course_term_relationship error {}: {} {}".format(response.status_code, cid, json.loads(response.content)))
+        print("post_course_and_term error {}: {} {}".format(response.status_code, data["Course"][:9],
+                                                             response.text))
         return None
 
 
-infile = open('ods-courses.json')
-j = json.load(infile)
-infile.close()
-lastcourse = ""
-i = 0
-for item in j:
-    # need to check for sections of the same course and only add the first.
-    if item["Course"][:9] != lastcourse:
-        cid = post_course("http://localhost:8000/v1/courses/", item)
-        if cid:
-            tid = post_term("http://localhost:8000/v1/course_terms/", cid, item)
-            if tid:
-                patch_course_term_relationship("http://localhost:8000/v1/courses/", cid, tid)
-        lastcourse = item["Course"][:9]
-        i += 1
-
-print("{} courses added".format(i))
-
-
+def first_sections(items):
+    """
+    need to check for sections of the same course and only add the first.
+    """
+    seen = set()
+    for item in items:
+        if item["Course"][:9] not in seen:
+            seen.add(item["Course"][:9])
+            yield item
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Load ODS courses through the {json:api} operations endpoint.")
+    parser.add_argument("file", nargs="?", default="ods-courses.json", help="ODS courses JSON file")
+    parser.add_argument("--url", default="http://localhost:8000/v1/operations/", help="operations endpoint")
+    parser.add_argument("--token", default=os.environ.get("ACCESS_TOKEN"),
+                        help="OAuth2 bearer access token (default $ACCESS_TOKEN)")
+    parser.add_argument("--basic", help="user:password for Basic auth instead of a token (local dev server)")
+    parser.add_argument("--concurrency", type=int, default=8, help="requests in flight at a time")
+    parser.add_argument("--retries", type=int, default=5, help="retries on connect errors and 429/503")
+    parser.add_argument("--backoff", type=float, default=0.5, help="retry backoff factor (seconds)")
+    parser.add_argument("--timeout", type=float, default=30, help="request timeout (seconds)")
+    parser.add_argument("--progress", type=int, default=100, help="report progress every this many courses")
+    args = parser.parse_args()
+    if not (args.token or args.basic):
+        parser.error("--token (or $ACCESS_TOKEN) or --basic is required")
+
+    with open(args.file) as infile:
+        items = list(first_sections(json.load(infile)))
+
+    added = done = 0
+    start = time.monotonic()
+    # the executor queues all the courses but only --concurrency are posted at a time.
+    with ThreadPoolExecutor(max_workers=args.concurrency) as executor:
+        for result in executor.map(lambda item: post_course_and_term(args, item), items):
+            done += 1
+            added += result is not None
+            if done % args.progress == 0 or done == len(items):
+                elapsed = time.monotonic() - start
+                print("{}/{} courses posted, {} added: {:.1f} courses/sec".format(
+                    done, len(items), added, done / elapsed if elapsed else 0))
+
+    print("{} courses added in {:.1f}s".format(added, time.monotonic() - start))
+
+
+if __name__ == "__main__":
+    main()
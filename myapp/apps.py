@@ -1,4 +1,5 @@
 from django.apps import AppConfig
+from django.db.models.signals import post_migrate
 
 
 class MyappConfig(AppConfig):
@@ -7,3 +8,10 @@ class MyappConfig(AppConfig):
     def ready(self):
         # bring in the drf-spectacular schema extensions
         import myapp.django_oauth_toolkit  # noqa: E402, F401
+        # connect the fragment cache invalidation signals
+        import myapp.fragments  # noqa: E402, F401
+        # compile `iexact` so that it uses the Upper() indexes
+        import myapp.lookups  # noqa: E402, F401
+        # keep the SQLite full-text indexes' triggers in place (importing it connects the search document signals)
+        from myapp.search import ensure_full_text_indexes
+        post_migrate.connect(ensure_full_text_indexes, sender=self, dispatch_uid="myapp.search.ensure")
@@ -0,0 +1,102 @@
+from django import forms
+from django.db.models import Q
+from django.utils import timezone
+from django_filters import rest_framework as filters
+from drf_spectacular.utils import extend_schema_field
+from rest_framework_json_api.django_filters import DjangoFilterBackend as JSONAPIDjangoFilterBackend
+
+from myapp.models import CommonModel
+
+
+def effective_on(date):
+    """
+    :return: a `Q` for the :py:class:`myapp.models.CommonModel` rows that are effective on `date`: those that
+        became valid by then (or have no start date) and haven't yet become invalid (or have no end date).
+
+    The condition is an `OR` of the four start/end combinations, each of which is a range on one of the
+    `effective_*` indexes, rather than `(start IS NULL OR ...) AND (end IS NULL OR ...)`, which can't use them.
+    """
+    return (
+        Q(effective_start_date__isnull=True, effective_end_date__isnull=True)
+        | Q(effective_start_date__isnull=True, effective_end_date__gt=date)
+        | Q(effective_start_date__lte=date, effective_end_date__isnull=True)
+        | Q(effective_start_date__lte=date, effective_end_date__gt=date)
+    )
+
+
+#: `filter[effective_on]` value for all the rows, whether effective or not
+ALL = "all"
+#: `filter[effective_on]` description
+EFFECTIVE_ON_HELP = "effective on this date (YYYY-MM-DD, today or all); lists default to today"
+
+
+class EffectiveDateField(forms.DateField):
+    """
+    A date, `today` or `all`.
+    """
+
+    def to_python(self, value):
+        if isinstance(value, str) and value.strip().lower() == "today":
+            return timezone.localdate()
+        if isinstance(value, str) and value.strip().lower() == ALL:
+            return ALL
+        return super().to_python(value)
+
+
+@extend_schema_field({"type": "string", "description": EFFECTIVE_ON_HELP})  # not just a date
+class EffectiveOnFilter(filters.DateFilter):
+    """
+    `filter[effective_on]=<date>` or `filter[effective_on]=today`: the rows that are effective on that date.
+    `filter[effective_on]=all` is all the rows. See :py:class:`DjangoFilterBackend` for the default.
+    """
+
+    field_class = EffectiveDateField
+
+    def filter(self, qs, value):
+        if value in (None, "", ALL):
+            return qs
+        return qs.filter(effective_on(value))
+
+
+class EffectiveDateFilterSet(filters.FilterSet):
+    """
+    Extend class `django_filters.rest_framework.FilterSet` with `filter[effective_on]` for models with
+    effective dates.
+    """
+
+    #: `filter[effective_on]` is the rows effective on a date (`today` for today) or `all` of them
+    effective_on = EffectiveOnFilter(label=EFFECTIVE_ON_HELP)
+
+
+class DjangoFilterBackend(JSONAPIDjangoFilterBackend):
+    """
+    The {json:api} `filter[<field>]` backend with `filter[effective_on]` on every ViewSet of a
+    :py:class:`myapp.models.CommonModel`, including those with no other `filterset_fields`.
+    ViewSets with a `filterset_class` get it by extending :py:class:`EffectiveDateFilterSet`.
+
+    A list without `filter[effective_on]` is of the rows effective today; `filter[effective_on]=all` lists them
+    all. Other actions (retrieve, update, ...) find a row whatever its effective dates.
+    """
+
+    filterset_base = EffectiveDateFilterSet
+    #: the `filter[effective_on]` of a list that doesn't give one
+    effective_on_default = "today"
+
+    def get_filterset_kwargs(self, request, queryset, view):
+        kwargs = super().get_filterset_kwargs(request, queryset, view)
+        if getattr(view, "action", None) == "list" and "effective_on" not in kwargs["data"] and issubclass(
+                queryset.model, CommonModel):
+            kwargs["data"]["effective_on"] = self.effective_on_default
+        return kwargs
+
+    def get_filterset_class(self, view, queryset=None):
+        filterset_class = super().get_filterset_class(view, queryset)
+        if filterset_class is None and queryset is not None and issubclass(queryset.model, CommonModel):
+
+            class AutoFilterSet(self.filterset_base):
+                class Meta:
+                    model = queryset.model
+                    fields = []
+
+            return AutoFilterSet
+        return filterset_class
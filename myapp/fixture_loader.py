@@ -0,0 +1,266 @@
+import hashlib
+import logging
+import os
+import sqlite3
+from collections import defaultdict
+
+import yaml
+from django.apps import apps
+from django.conf import settings
+from django.core.management.color import no_style
+from django.core.serializers.base import DeserializationError
+from django.core.serializers.json import Deserializer as JSONDeserializer
+from django.core.serializers.python import Deserializer as PythonDeserializer
+from django.db import DEFAULT_DB_ALIAS, connections, transaction
+from django.db.migrations.loader import MigrationLoader
+from django.db.models.constants import OnConflict
+
+from myapp.fragments import invalidate_linked
+from myapp.search import search_documents
+
+log = logging.getLogger(__name__)
+
+#: libyaml's C parser if PyYAML was built with it
+YAMLLoader = getattr(yaml, "CSafeLoader", yaml.SafeLoader)
+
+
+class FixtureLoader(object):
+    """
+    A faster `loaddata` for large fixtures like `myapp/fixtures/courseterm.yaml`:
+
+    - YAML is parsed with libyaml's C loader.
+    - The objects are grouped by model and inserted (or replaced, like `loaddata`, where the database supports
+      upserts) in batches rather than saved one at a time. ManyToMany rows are inserted once all the objects are.
+    - Like `loaddata`, field values are stored as-is (`auto_now` fields aren't touched), constraints are checked
+      once at the end and sequences are reset. Unlike it, signals aren't sent; the objects' search documents are
+      updated in bulk instead.
+
+    Optionally, for the test suite, the loaded rows can be snapshotted in a SQLite database in
+    `settings.FIXTURE_LOADER['SNAPSHOT_DIR']`, keyed by a hash of the fixtures and the migrations, and the next
+    SQLite test run inserts them from the snapshot without deserializing the fixtures at all.
+    """
+
+    def __init__(self, using=DEFAULT_DB_ALIAS, snapshot_dir=None):
+        self.using = using
+        self.snapshot_dir = snapshot_dir
+
+    @classmethod
+    def from_settings(cls, using=DEFAULT_DB_ALIAS):
+        """
+        Instantiate from `settings.FIXTURE_LOADER`
+        """
+        conf = getattr(settings, "FIXTURE_LOADER", {})
+        return cls(using=using, snapshot_dir=conf.get("SNAPSHOT_DIR", None))
+
+    @property
+    def connection(self):
+        return connections[self.using]
+
+    @staticmethod
+    def find(fixture):
+        """
+        :param fixture: a fixture path or, like `loaddata`, a name to find in the apps' `fixtures` directories
+            and `settings.FIXTURE_DIRS`.
+        :return: the fixture's path
+        """
+        if os.path.isfile(fixture):
+            return fixture
+        dirs = [os.path.join(app.path, "fixtures") for app in apps.get_app_configs()] + list(settings.FIXTURE_DIRS)
+        for directory in dirs:
+            for ext in ("", ".yaml", ".yml", ".json"):
+                path = os.path.join(directory, fixture + ext)
+                if os.path.isfile(path):
+                    return path
+        raise FileNotFoundError("No fixture named '{}' found.".format(fixture))
+
+    def deserialize(self, path):
+        """
+        :return: iterator of :py:class:`django.core.serializers.base.DeserializedObject`
+        """
+        with open(path, encoding="utf-8") as stream:
+            if path.endswith(".json"):
+                return list(JSONDeserializer(stream, using=self.using))
+            try:
+                objects = yaml.load(stream, Loader=YAMLLoader)  # nosec B506
+            except yaml.YAMLError as exc:
+                raise DeserializationError("{}: {}".format(path, exc))
+        return PythonDeserializer(objects or [], using=self.using)
+
+    def load(self, *fixtures):
+        """
+        Load the fixtures in one transaction.
+
+        :return: the number of objects loaded
+        """
+        paths = [self.find(fixture) for fixture in fixtures]
+        snapshot = self.snapshot_path(paths)
+        with transaction.atomic(using=self.using):
+            if snapshot and os.path.isfile(snapshot):
+                count = self.restore(snapshot)
+                self.update_search_documents()
+                return count
+            with self.connection.constraint_checks_disabled():
+                objects, tables = self.insert([obj for path in paths for obj in self.deserialize(path)])
+            self.connection.check_constraints(table_names=tables)
+            self.reset_sequences()
+            self.update_search_documents()
+            if snapshot:
+                self.save_snapshot(snapshot, tables)
+        return objects
+
+    def insert(self, deserialized):
+        """
+        Insert (or replace) the objects a model at a time and then their ManyToMany rows.
+
+        :return: (number of objects, the tables inserted into)
+        """
+        by_model, m2m = defaultdict(list), defaultdict(list)
+        for obj in deserialized:
+            by_model[type(obj.object)].append(obj.object)
+            for name, pks in (obj.m2m_data or {}).items():
+                m2m[obj.object._meta.get_field(name)].extend((obj.object.pk, pk) for pk in pks)
+        self.models = list(by_model)
+        self.pks = {model: [instance.pk for instance in instances] for model, instances in by_model.items()}
+        tables = []
+        for model, instances in by_model.items():
+            self.bulk_insert(model, instances, replace=True)
+            invalidate_linked(instances)
+            tables.append(model._meta.db_table)
+        for field, pairs in m2m.items():
+            through = field.remote_field.through
+            source = through._meta.get_field(field.m2m_field_name()).attname
+            target = through._meta.get_field(field.m2m_reverse_field_name()).attname
+            # replace the instances' ManyToMany rows, like setting the field does.
+            through._base_manager.using(self.using).filter(
+                **{"{}__in".format(source): {pk for pk, _ in pairs}}).delete()
+            self.bulk_insert(through, [through(**{source: pk, target: related}) for pk, related in pairs])
+            tables.append(through._meta.db_table)
+        return sum(len(instances) for instances in by_model.values()), tables
+
+    def bulk_insert(self, model, instances, replace=False):
+        """
+        Insert `instances` in batches with the same raw insert that `Model.save_base(raw=True)` does, so
+        fields are stored as-is. If `replace`, existing rows (by primary key) are updated if the database
+        supports that.
+        """
+        # ManyToMany rows have no primary key yet.
+        fields = [f for f in model._meta.local_concrete_fields
+                  if not (f.primary_key and getattr(instances[0], f.attname) is None)]
+        options = {}
+        if replace and self.connection.features.supports_update_conflicts_with_target:
+            update_fields = [f for f in fields if not f.primary_key]
+            if update_fields:
+                options = {"on_conflict": OnConflict.UPDATE, "unique_fields": [model._meta.pk],
+                           "update_fields": update_fields}
+        queryset = model._base_manager.using(self.using)
+        batch_size = max(self.connection.ops.bulk_batch_size(fields, instances), 1)
+        for start in range(0, len(instances), batch_size):
+            queryset._insert(instances[start:start + batch_size], fields=fields, raw=True, **options)
+        for instance in instances:
+            instance._state.adding, instance._state.db = False, self.using
+
+    def update_search_documents(self):
+        """
+        Update the search documents of the objects loaded since no signals were sent.
+        """
+        for model, pks in self.pks.items():
+            search_documents.update_related(model, pks)
+
+    def reset_sequences(self):
+        statements = self.connection.ops.sequence_reset_sql(no_style(), self.models)
+        if statements:
+            with self.connection.cursor() as cursor:
+                for statement in statements:
+                    cursor.execute(statement)
+
+    def snapshot_path(self, paths):
+        """
+        :return: the snapshot's path or None if snapshots are disabled or this isn't SQLite.
+        """
+        if not self.snapshot_dir or self.connection.vendor != "sqlite":
+            return None
+        digest = hashlib.sha256()
+        for path in paths:
+            with open(path, "rb") as stream:
+                digest.update(hashlib.sha256(stream.read()).digest())
+        for node in sorted(MigrationLoader(self.connection, ignore_no_migrations=True).graph.leaf_nodes()):
+            digest.update(repr(node).encode())
+        return os.path.join(self.snapshot_dir, "fixtures-{}.sqlite3".format(digest.hexdigest()))
+
+    def save_snapshot(self, snapshot, tables):
+        """
+        Copy the rows of `tables` into a new SQLite snapshot database.
+        """
+        os.makedirs(self.snapshot_dir, exist_ok=True)
+        partial = "{}.{}".format(snapshot, os.getpid())
+        target = sqlite3.connect(partial)
+        try:
+            with self.connection.cursor() as cursor, target:
+                for table in dict.fromkeys(tables):
+                    cursor.execute("SELECT * FROM {}".format(self.connection.ops.quote_name(table)))  # nosec B608
+                    columns = [self.connection.ops.quote_name(c[0]) for c in cursor.description]
+                    target.execute("CREATE TABLE {} ({})".format(  # nosec B608
+                        self.connection.ops.quote_name(table), ", ".join(columns)))
+                    target.executemany("INSERT INTO {} VALUES ({})".format(  # nosec B608
+                        self.connection.ops.quote_name(table), ", ".join("?" * len(columns))), cursor.fetchall())
+        finally:
+            target.close()
+        os.replace(partial, snapshot)
+
+    def restore(self, snapshot):
+        """
+        Insert the rows from a snapshot. The primary keys of the rows are remembered, by model, for
+        :py:meth:`update_search_documents`.
+
+        :return: the number of rows inserted.
+        """
+        count = 0
+        models = {model._meta.db_table: model for model in apps.get_models(include_auto_created=True)}
+        self.pks = {}
+        source = sqlite3.connect("file:{}?mode=ro".format(snapshot), uri=True)
+        try:
+            tables = [row[0] for row in source.execute(
+                "SELECT name FROM sqlite_master WHERE type='table' ORDER BY rowid")]
+            with self.connection.constraint_checks_disabled(), self.connection.cursor() as cursor:
+                for table in tables:
+                    rows = source.execute("SELECT * FROM {}".format(self.connection.ops.quote_name(table)))  # nosec
+                    columns = [self.connection.ops.quote_name(c[0]) for c in rows.description]
+                    rows = rows.fetchall()
+                    # upsert rather than INSERT OR REPLACE, whose deletes don't fire triggers (e.g. full-text indexes).
+                    pk = self.connection.ops.quote_name(
+                        self.connection.introspection.get_primary_key_column(cursor, table))
+                    upsert = "INSERT INTO {} ({}) VALUES ({}) ON CONFLICT ({}) DO UPDATE SET {}".format(  # nosec B608
+                        self.connection.ops.quote_name(table), ", ".join(columns), ", ".join(["%s"] * len(columns)),
+                        pk, ", ".join("{0} = excluded.{0}".format(c) for c in columns if c != pk))
+                    cursor.executemany(upsert, rows)
+                    if table in models:
+                        self.pks[models[table]] = [row[columns.index(pk)] for row in rows]
+                    count += len(rows)
+            self.connection.check_constraints(table_names=tables)
+        finally:
+            source.close()
+        log.debug("restored %d rows from %s", count, snapshot)
+        return count
+
+
+def load_fixtures(*fixtures, using=DEFAULT_DB_ALIAS):
+    """
+    Load fixtures with :py:class:`FixtureLoader`.
+    """
+    return FixtureLoader.from_settings(using=using).load(*fixtures)
+
+
+class FixtureLoaderMixIn(object):
+    """
+    Load large `bulk_fixtures` for a :py:class:`django.test.TestCase` class with :py:class:`FixtureLoader`
+    rather than `fixtures`'s `loaddata`.
+    """
+
+    #: fixtures to load once for the TestCase class
+    bulk_fixtures = ()
+
+    @classmethod
+    def setUpTestData(cls):
+        super().setUpTestData()
+        for using in cls._databases_names(include_mirrors=False):
+            FixtureLoader.from_settings(using=using).load(*cls.bulk_fixtures)
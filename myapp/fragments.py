@@ -0,0 +1,244 @@
+import hashlib
+import json
+import logging
+import uuid
+
+from django.conf import settings
+from django.core.cache import caches
+from django.db import transaction
+from django.db.models.signals import m2m_changed, post_delete, post_save, pre_delete, pre_save
+from rest_framework.permissions import SAFE_METHODS
+from rest_framework_json_api.utils import get_resource_type_from_serializer
+
+from myapp.models import Course, CourseTerm, Grade, Instructor, Person
+
+log = logging.getLogger(__name__)
+
+#: models whose rendered resource objects are cached and invalidated
+FRAGMENT_MODELS = (Course, CourseTerm, Instructor, Person, Grade)
+
+
+class FragmentCache(object):
+    """
+    Write-through cache of rendered {json:api} resource objects, keyed by model, id, and a digest of what
+    else determines the rendering: the serializer, the `fields[type]` sparse fieldset, the `include` set
+    and the base URL for hyperlinks.
+
+    Each resource has a version (a random token) in the cache; invalidating the resource just deletes
+    its version so its cached renderings are never looked up again and simply expire.
+    The serializers look up (a page of) resources before serializing them, skipping the serialization
+    of those that are found, and :py:class:`myapp.renderers.JSONRenderer` stores the ones it renders.
+    Signals on the :py:data:`FRAGMENT_MODELS` invalidate a resource when it changes along with the resources
+    whose linkage to it changes.
+
+    Disabled unless `settings.JSONAPI_FRAGMENT_CACHE['CACHE_ALIAS']` is set. That cache must be shared by all
+    workers, else one worker's invalidations won't be seen by the others.
+    """
+
+    def __init__(self, cache_alias=None, timeout=300):
+        self.cache_alias = cache_alias
+        self.timeout = timeout
+
+    @classmethod
+    def from_settings(cls):
+        """
+        Instantiate from `settings.JSONAPI_FRAGMENT_CACHE`
+        """
+        conf = getattr(settings, "JSONAPI_FRAGMENT_CACHE", {})
+        return cls(cache_alias=conf.get("CACHE_ALIAS", None), timeout=conf.get("TIMEOUT", 300))
+
+    @property
+    def cache(self):
+        return caches[self.cache_alias]
+
+    @staticmethod
+    def version_key(model, pk):
+        return "myapp.fragments.version:{}:{}".format(model._meta.label, pk)
+
+    def cacheable(self, serializer, instance):
+        """
+        Renderings are only cached for GET/HEAD of the :py:data:`FRAGMENT_MODELS`.
+        """
+        request = serializer.context.get("request")
+        return (
+            self.cache_alias is not None
+            and request is not None
+            and request.method in SAFE_METHODS
+            and isinstance(instance, FRAGMENT_MODELS)
+            and instance.pk is not None
+        )
+
+    def signature(self, serializer, request):
+        """
+        Digest of what, besides the resource itself, determines its rendering.
+        """
+        fieldset = request.query_params.get("fields[{}]".format(get_resource_type_from_serializer(serializer)))
+        signature = [
+            "{}.{}".format(serializer.__class__.__module__, serializer.__class__.__qualname__),
+            fieldset,
+            sorted(request.query_params.get("include", "").split(",")),
+            request.build_absolute_uri("/"),
+        ]
+        return hashlib.sha256(json.dumps(signature).encode()).hexdigest()
+
+    def prefetch(self, serializer, instances):
+        """
+        Look up the cached renderings of `instances` in two round trips: their versions and then the renderings.
+        They are memoized in the serializer context for :py:meth:`lookup` and the renderer.
+        """
+        instances = [i for i in instances if self.cacheable(serializer, i)]
+        if not instances:
+            return
+        memo = serializer.context.setdefault("fragments", {})
+        signature = self.signature(serializer, serializer.context["request"])
+        version_keys = {self.version_key(type(i), i.pk): i for i in instances}
+        versions = self.cache.get_many(list(version_keys))
+        missing = {key: uuid.uuid4().hex for key in version_keys if key not in versions}
+        if missing:
+            self.cache.set_many(missing, None)
+            versions.update(missing)
+        keys = {}
+        for version_key, instance in version_keys.items():
+            key = "myapp.fragments:{}:{}:{}".format(version_key.split(":", 1)[1], versions[version_key], signature)
+            keys[key] = instance
+            memo[(type(instance), instance.pk, signature)] = key
+        found = self.cache.get_many([key for key in keys if key not in memo])
+        for key in keys:
+            memo.setdefault(key, found.get(key))
+
+    def lookup(self, serializer, instance):
+        """
+        :return: (key, cached {"resource": representation, "object": resource object} or None if not cached)
+            or (None, None) if not cacheable.
+        """
+        if not self.cacheable(serializer, instance):
+            return None, None
+        memo = serializer.context.setdefault("fragments", {})
+        signature = self.signature(serializer, serializer.context["request"])
+        if (type(instance), instance.pk, signature) not in memo:
+            self.prefetch(serializer, [instance])
+        key = memo[(type(instance), instance.pk, signature)]
+        return key, memo[key]
+
+    def store(self, serializer, key, resource, resource_object):
+        """
+        Cache a rendering.
+        """
+        entry = {"resource": plain(resource), "object": plain(resource_object)}
+        serializer.context.setdefault("fragments", {})[key] = entry
+        self.cache.set(key, entry, self.timeout)
+
+    def invalidate(self, model, pks):
+        """
+        Invalidate the renderings of the `model` instances with primary keys `pks`, now and when the
+        transaction commits (a concurrent request may have cached what it read before the commit).
+        """
+        if self.cache_alias is None or not pks:
+            return
+        keys = [self.version_key(model, pk) for pk in pks if pk is not None]
+        self.cache.delete_many(keys)
+        transaction.on_commit(lambda: self.cache.delete_many(keys))
+
+
+def plain(value):
+    """
+    Reduce a representation to plain JSON types so it can be cached without pulling in model instances
+    (e.g. the one a :py:class:`rest_framework.relations.Hyperlink` refers to) or str subclasses that
+    don't pickle.
+    """
+    if isinstance(value, str):
+        return str(value)
+    if isinstance(value, dict):
+        return {k: plain(v) for k, v in value.items()}
+    if isinstance(value, (list, tuple)):
+        return [plain(v) for v in value]
+    return value
+
+
+#: the process-wide fragment cache
+fragment_cache = FragmentCache.from_settings()
+
+
+def _linked(instance):
+    """
+    The (model, pk) of the :py:data:`FRAGMENT_MODELS` instances linked to by `instance`'s foreign keys.
+    """
+    for field in instance._meta.concrete_fields:
+        if field.is_relation and issubclass(field.related_model, FRAGMENT_MODELS):
+            yield field.related_model, getattr(instance, field.attname)
+
+
+def invalidate_linked(instances):
+    """
+    Invalidate `instances` and what they link to, for when they were saved without signals (`bulk_create()`).
+    """
+    if fragment_cache.cache_alias is None:
+        return
+    for instance in instances:
+        fragment_cache.invalidate(type(instance), [instance.pk])
+        for model, pk in _linked(instance):
+            fragment_cache.invalidate(model, [pk])
+
+
+def _pre_save(sender, instance, raw=False, **kwargs):
+    # remember what the instance was linked to before the save.
+    if fragment_cache.cache_alias is None or instance._state.adding:
+        return
+    attnames = [f.attname for f in instance._meta.concrete_fields
+                if f.is_relation and issubclass(f.related_model, FRAGMENT_MODELS)]
+    if attnames:
+        instance._fragment_linked = list(
+            sender._default_manager.filter(pk=instance.pk).values_list(*attnames).first() or [])
+
+
+def _post_save(sender, instance, raw=False, **kwargs):
+    fragment_cache.invalidate(sender, [instance.pk])
+    old = instance.__dict__.pop("_fragment_linked", [])
+    for i, (model, pk) in enumerate(_linked(instance)):
+        previous = old[i] if i < len(old) else None
+        if pk != previous:
+            fragment_cache.invalidate(model, [pk, previous])
+
+
+def _pre_delete(sender, instance, **kwargs):
+    # everything that links to the instance (or is linked from it) loses that linkage.
+    if fragment_cache.cache_alias is None:
+        return
+    fragment_cache.invalidate(sender, [instance.pk])
+    for model, pk in _linked(instance):
+        fragment_cache.invalidate(model, [pk])
+    for relation in instance._meta.related_objects:  # reverse FK, OneToOne and ManyToMany
+        if issubclass(relation.related_model, FRAGMENT_MODELS):
+            pks = relation.related_model._default_manager.filter(**{relation.field.name: instance.pk})
+            fragment_cache.invalidate(relation.related_model, list(pks.values_list("pk", flat=True)))
+    for field in instance._meta.many_to_many:
+        if issubclass(field.related_model, FRAGMENT_MODELS):
+            pks = getattr(instance, field.name).values_list("pk", flat=True)
+            fragment_cache.invalidate(field.related_model, list(pks))
+
+
+def _post_delete(sender, instance, **kwargs):
+    fragment_cache.invalidate(sender, [instance.pk])
+
+
+def _m2m_changed(sender, instance, action, reverse, model, pk_set, **kwargs):
+    if fragment_cache.cache_alias is None:
+        return
+    if action == "pre_clear":
+        # find out what's about to be cleared.
+        accessor = next(f.name if f.concrete else f.get_accessor_name() for f in instance._meta.get_fields()
+                        if f.many_to_many and (f.remote_field.through if f.concrete else f.through) is sender)
+        pk_set = set(getattr(instance, accessor).values_list("pk", flat=True))
+    elif action not in ("post_add", "post_remove", "post_clear"):
+        return
+    fragment_cache.invalidate(type(instance), [instance.pk])
+    if pk_set and issubclass(model, FRAGMENT_MODELS):
+        fragment_cache.invalidate(model, list(pk_set))
+
+
+for fragment_model in FRAGMENT_MODELS:
+    pre_save.connect(_pre_save, sender=fragment_model, dispatch_uid="myapp.fragments.pre_save")
+    post_save.connect(_post_save, sender=fragment_model, dispatch_uid="myapp.fragments.post_save")
+    pre_delete.connect(_pre_delete, sender=fragment_model, dispatch_uid="myapp.fragments.pre_delete")
+    post_delete.connect(_post_delete, sender=fragment_model, dispatch_uid="myapp.fragments.post_delete")
+m2m_changed.connect(_m2m_changed, sender=Instructor.course_terms.through, dispatch_uid="myapp.fragments.m2m")
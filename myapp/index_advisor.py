@@ -0,0 +1,274 @@
+import re
+from collections import OrderedDict
+
+from django.conf import settings
+from django.core.exceptions import FieldDoesNotExist
+from django.db import DEFAULT_DB_ALIAS, connections
+from django.db.backends.utils import names_digest
+from django.db.models import Index, TextField
+from django.db.models.constants import LOOKUP_SEP
+from django.db.models.functions import Upper
+from rest_framework_json_api.utils import get_resource_type_from_model
+
+from myapp.filters import EffectiveOnFilter
+from myapp.search import FULL_TEXT_INDEXES, TRIGRAM_INDEXES, search_documents
+
+#: lookups that a b-tree index on the column serves
+BTREE_LOOKUPS = {"exact", "in", "lt", "lte", "gt", "gte", "range", "startswith", "isnull"}
+#: case-insensitive lookups that an index on `UPPER(column)` can serve
+CASE_INSENSITIVE_LOOKUPS = {"iexact", "istartswith"}
+#: `SearchFilter` search field prefixes and the lookups they use
+SEARCH_LOOKUPS = {"^": "istartswith", "=": "iexact", "@": "search", "$": "iregex"}
+#: EXPLAIN output that shows a full table scan (SQLite, PostgreSQL, MySQL)
+TABLE_SCAN = re.compile(r"\bSCAN (TABLE )?\w+\b(?! USING)|\bSeq Scan\b|\btype: ALL\b|'type': 'ALL'")
+#: ...or a full scan of a table or index, which a filter shouldn't need
+FULL_SCAN = re.compile(r"\bSCAN (TABLE )?\w+\b|\bSeq Scan\b|\btype: (ALL|index)\b|'type': '(ALL|index)'")
+
+
+def viewset_classes(base):
+    """
+    :return: the concrete (model-backed) subclasses of ViewSet `base`
+    """
+    found = []
+    for viewset in base.__subclasses__():
+        queryset = getattr(viewset, "queryset", None)
+        if queryset is not None and queryset.model._meta.managed:
+            found.append(viewset)
+        found.extend(viewset_classes(viewset))
+    return found
+
+
+class IndexRequirement(object):
+    """
+    An index that the declared filters, sorts or searches of one or more viewsets need: on `columns`
+    of `model`, or on `UPPER(column)` if `case_insensitive`.
+    """
+
+    def __init__(self, model, fields, case_insensitive=False):
+        self.model = model
+        self.fields = tuple(fields)
+        self.case_insensitive = case_insensitive
+        #: [(resource type, query parameter, lookup path, lookup)] that need the index
+        self.sources = []
+
+    @property
+    def key(self):
+        return self.model, self.fields, self.case_insensitive
+
+    @property
+    def columns(self):
+        return tuple(self.model._meta.get_field(name).column for name in self.fields)
+
+    def index(self):
+        """
+        :return: the :py:class:`django.db.models.Index` to add
+        """
+        if self.case_insensitive:
+            table, column = self.model._meta.db_table, self.columns[0]
+            return Index(Upper(self.fields[0]), name="{}_{}_{}_ci".format(
+                table[:11], column[:7], names_digest(table, column, "upper", length=6)))
+        index = Index(fields=list(self.fields))
+        index.set_name_with_model(self.model)
+        return index
+
+    def __str__(self):
+        columns = ", ".join("UPPER({})".format(c) if self.case_insensitive else c for c in self.columns)
+        return "{}({})".format(self.model._meta.db_table, columns)
+
+
+class IndexAdvisor(object):
+    """
+    Work out which indexes the `CourseBaseViewSet`s' declared `filter[...]`s, `sort`s and `filter[search]`
+    fields need, compare them with the indexes the database and the models already have and report, with
+    EXPLAIN, how the database executes each of those queries:
+
+    - Filters on a column of the viewset's own model with `exact` or `in` get a composite index of the column
+      followed by the model's default ordering, so a filtered page is read in index order without a sort.
+    - Other b-tree-friendly lookups and sortable fields get a single-column index on the column at the end of
+      the path (the joins along the way use the ForeignKey indexes).
+    - `iexact` and `istartswith` get an `UPPER(column)` index.
+    - `contains`, `icontains`, `regex` etc. can't use a b-tree index; these are reported as such unless (on
+      PostgreSQL) a :py:class:`myapp.search.TrigramIndex` serves the `icontains`.
+    - `filter[effective_on]` is skipped: the `CommonModel.Meta.indexes` serve it.
+    - Search fields covered by a full-text index or search documents (see :py:mod:`myapp.search`) are skipped.
+    - An index is already there if an existing index's leading columns are the wanted ones, or an index with the
+      same name or the same expressions exists.
+    """
+
+    def __init__(self, viewsets, using=DEFAULT_DB_ALIAS):
+        self.viewsets = viewsets
+        self.using = using
+        self.requirements = OrderedDict()
+        #: [(resource type, query parameter, reason)] that no index can help or that can't be resolved
+        self.unindexable = []
+
+    @property
+    def connection(self):
+        return connections[self.using]
+
+    def advise(self):
+        """
+        :return: the needed :py:class:`IndexRequirement`\\s and, of those, the ones that no existing index covers
+        """
+        for viewset in self.viewsets:
+            model = viewset.queryset.model
+            for parameter, path, lookup in self.declarations(viewset):
+                self.require(model, parameter, path, lookup)
+        needed = []
+        for requirement in self.requirements.values():
+            # a composite index also serves queries on its leading columns.
+            wider = next((o for o in self.requirements.values() if o.model is requirement.model
+                          and o.case_insensitive == requirement.case_insensitive
+                          and len(o.fields) > len(requirement.fields)
+                          and o.fields[:len(requirement.fields)] == requirement.fields), None)
+            if wider is None:
+                needed.append(requirement)
+            else:
+                wider.sources.extend(requirement.sources)
+        return needed, [r for r in needed if not self.exists(r)]
+
+    def declarations(self, viewset):
+        """
+        Yield (query parameter, lookup path, lookup) for each filter, sort and search field of `viewset`.
+        """
+        filterset_class = getattr(viewset, "filterset_class", None)
+        if filterset_class is not None:
+            for name, declared in filterset_class.base_filters.items():
+                # served by the CommonModel.Meta.indexes
+                if isinstance(declared, EffectiveOnFilter):
+                    continue
+                yield "filter[{}]".format(name), declared.field_name, declared.lookup_expr
+        else:
+            for path, lookups in (getattr(viewset, "filterset_fields", None) or {}).items():
+                for lookup in lookups:
+                    parameter = path.replace(LOOKUP_SEP, ".") + ("" if lookup == "exact" else "." + lookup)
+                    yield "filter[{}]".format(parameter), path, lookup
+        ordering_fields = getattr(viewset, "ordering_fields", None)
+        if isinstance(ordering_fields, (list, tuple)):
+            for path in ordering_fields:
+                yield "sort={}".format(path), path, None
+        search_fields = getattr(viewset, "search_fields", None) or ()
+        model = viewset.queryset.model
+        index = FULL_TEXT_INDEXES.get(model)
+        if (index is not None and set(search_fields) == set(index.columns)) or search_documents.covers(
+                model, search_fields):
+            return
+        for field in search_fields:
+            lookup = SEARCH_LOOKUPS.get(field[:1], "icontains")
+            yield "filter[search]", field.lstrip("".join(SEARCH_LOOKUPS)), lookup
+
+    def resolve(self, model, path):
+        """
+        :return: (model, field name) of the column at the end of the lookup `path`
+        """
+        field = None
+        for part in path.split(LOOKUP_SEP):
+            if field is not None:
+                if not field.is_relation:
+                    raise FieldDoesNotExist("{} has no field named '{}'".format(field, part))
+                model = field.related_model
+            field = model._meta.pk if part == "pk" else model._meta.get_field(part)
+        if not field.concrete or field.many_to_many:
+            raise FieldDoesNotExist("{} is not a column".format(path))
+        return model, field.name
+
+    def require(self, viewset_model, parameter, path, lookup):
+        resource_type = get_resource_type_from_model(viewset_model)
+        try:
+            model, name = self.resolve(viewset_model, path)
+        except FieldDoesNotExist as exc:
+            self.unindexable.append((resource_type, parameter, "can't be resolved: {}".format(exc)))
+            return
+        field = model._meta.get_field(name)
+        if field.primary_key:
+            return
+        if isinstance(field, TextField):
+            self.unindexable.append((resource_type, parameter, "{} is a TextField".format(path)))
+            return
+        if lookup in CASE_INSENSITIVE_LOOKUPS:
+            requirement = IndexRequirement(model, (name,), case_insensitive=True)
+        elif lookup is None or lookup in BTREE_LOOKUPS:
+            fields = (name,)
+            ordering = [o.lstrip("-") for o in model._meta.ordering if isinstance(o, str)]
+            if (model is viewset_model and lookup in ("exact", "in") and not field.unique and ordering
+                    and ordering[0] != name):
+                fields += tuple(o for o in ordering if o != name)
+            requirement = IndexRequirement(model, fields)
+        else:
+            trigram = next((t for t in TRIGRAM_INDEXES.get(model, ()) if t.column == field.column), None)
+            if lookup != "icontains" or trigram is None:
+                reason = "{} can't use a b-tree index".format(lookup)
+            elif self.connection.vendor in trigram.vendors:
+                return
+            else:
+                reason = "icontains can't use a b-tree index (a trigram index serves it on PostgreSQL)"
+            self.unindexable.append((resource_type, parameter, reason))
+            return
+        requirement = self.requirements.setdefault(requirement.key, requirement)
+        requirement.sources.append((resource_type, parameter, path, lookup))
+
+    def existing(self, model):
+        """
+        :return: (leading column tuples, index names, index expressions) of the indexes `model` already has
+        """
+        with self.connection.cursor() as cursor:
+            constraints = self.connection.introspection.get_constraints(cursor, model._meta.db_table)
+        columns = {tuple(c["columns"]) for c in constraints.values()
+                   if (c["index"] or c["unique"] or c["primary_key"]) and c["columns"] and None not in c["columns"]}
+        names = set(constraints)
+        expressions = []
+        for index in model._meta.indexes:
+            names.add(index.name)
+            if index.fields:
+                columns.add(tuple(model._meta.get_field(f.lstrip("-")).column for f in index.fields))
+            else:
+                expressions.append(tuple(index.expressions))
+        for field in model._meta.local_concrete_fields:
+            if field.unique or field.db_index:
+                columns.add((field.column,))
+        return columns, names, expressions
+
+    def exists(self, requirement):
+        columns, names, expressions = self.existing(requirement.model)
+        index = requirement.index()
+        if index.name in names:
+            return True
+        if requirement.case_insensitive:
+            return tuple(index.expressions) in expressions
+        return any(c[:len(requirement.columns)] == requirement.columns for c in columns)
+
+    def explain(self, requirement):
+        """
+        EXPLAIN a representative query for each source of `requirement`.
+
+        :return: [(resource type, query parameter, True if the index is used rather than a full scan, the plan)]
+        """
+        report = []
+        field = requirement.model._meta.get_field(requirement.fields[0])
+        for resource_type, parameter, path, lookup in requirement.sources:
+            viewset_model = next(v.queryset.model for v in self.viewsets
+                                 if get_resource_type_from_model(v.queryset.model) == resource_type)
+            queryset = viewset_model._default_manager.using(self.using)
+            if lookup is None:
+                queryset = queryset.order_by(path)
+            else:
+                queryset = queryset.filter(**{"{}__{}".format(path, lookup): self.sample(field, lookup)})
+            page_size = settings.REST_FRAMEWORK.get("PAGE_SIZE") or 10
+            plan = " / ".join(line.strip() for line in queryset[:page_size].explain().splitlines() if line.strip())
+            scan = TABLE_SCAN if lookup is None else FULL_SCAN
+            report.append((resource_type, parameter, not scan.search(plan), plan))
+        return report
+
+    def sample(self, field, lookup):
+        """
+        :return: a value of `field` to EXPLAIN a `lookup` with: one from the table, else the field's default
+        """
+        value = field.model._default_manager.using(self.using).exclude(**{"{}__isnull".format(field.name): True}) \
+            .values_list(field.name, flat=True).first()
+        if value is None:
+            value = field.get_default()
+        if value is None:
+            value = field.to_python("1970-01-01") if field.get_internal_type().startswith("Date") else "a"
+        if lookup == "isnull":
+            return True
+        return [value] if lookup == "in" else (value, value) if lookup == "range" else value
@@ -0,0 +1,17 @@
+from django.db.models import CharField, lookups
+from django.db.models.functions import Upper
+
+
+@CharField.register_lookup
+class UpperIExact(lookups.IExact):
+    """
+    `iexact` compiled as `UPPER(column) = UPPER(value)` on SQLite, as Django already does on PostgreSQL, so that
+    it can use an `Upper()` functional index rather than the `LIKE` that SQLite can't. Elsewhere (e.g. MySQL,
+    whose case-insensitive collations serve `iexact` from a plain index) it is unchanged.
+    """
+
+    def as_sqlite(self, compiler, connection):
+        lhs_sql, lhs_params = compiler.compile(Upper(self.lhs))
+        # the value is compared, not LIKE-matched, so it's not escaped for LIKE as `iexact` otherwise is.
+        rhs_sql, rhs_params = super(lookups.IExact, self).process_rhs(compiler, connection)
+        return "{} = UPPER({})".format(lhs_sql, rhs_sql), (*lhs_params, *rhs_params)
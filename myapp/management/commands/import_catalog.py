@@ -0,0 +1,190 @@
+import itertools
+import json
+import time
+from datetime import date
+
+from django.core.exceptions import ValidationError
+from django.core.management.base import BaseCommand, CommandError
+from django.db import connections, router, transaction
+
+from myapp.fragments import fragment_cache
+from myapp.models import Course, CourseTerm
+from myapp.search import search_documents
+
+#: Course columns that an import overwrites
+COURSE_FIELDS = ("school_bulletin_prefix_code", "suffix_two", "subject_area_code", "course_number", "course_name",
+                 "course_description", "last_mod_user_name", "last_mod_date", "row_version")
+#: CourseTerm columns that an import overwrites
+COURSE_TERM_FIELDS = ("audit_permitted_code", "exam_credit_flag", "course", "last_mod_user_name", "last_mod_date",
+                      "row_version")
+
+
+def iter_json_array(fp, chunk_size=1 << 16):
+    """
+    Yield the items of the JSON array in file `fp` one at a time, reading `chunk_size` characters at a time,
+    rather than loading the whole document.
+    """
+    decoder = json.JSONDecoder()
+    buffer, pos, eof = "", 0, False
+
+    def fill():
+        nonlocal buffer, pos, eof
+        chunk = fp.read(chunk_size)
+        eof = not chunk
+        buffer = buffer[pos:] + chunk
+        pos = 0
+
+    def skip(separators):
+        # skip whitespace and the expected separators and return the next significant character.
+        nonlocal pos
+        while True:
+            while pos < len(buffer) and (buffer[pos].isspace() or buffer[pos] in separators):
+                pos += 1
+            if pos < len(buffer) or eof:
+                return buffer[pos] if pos < len(buffer) else ""
+            fill()
+
+    fill()
+    if skip("") != "[":
+        raise ValueError("expected a JSON array")
+    pos += 1
+    while skip(",") != "]":
+        while True:
+            try:
+                item, end = decoder.raw_decode(buffer, pos)
+            except json.JSONDecodeError:
+                if eof:
+                    raise
+                fill()
+                continue
+            if end == len(buffer) and not eof:  # a number may continue in the next chunk
+                fill()
+                continue
+            break
+        pos = end
+        yield item
+
+
+class Command(BaseCommand):
+    help = "Import (upsert) courses and their course terms from an opendataservice.columbia.edu ODS courses feed."
+
+    def add_arguments(self, parser):
+        parser.add_argument("file", help="ODS courses JSON file, e.g. ods-courses.json")
+        parser.add_argument("--batch-size", type=int, default=1000, help="rows upserted per query")
+        parser.add_argument("--user", default="loader", help="last_mod_user_name of the imported rows")
+
+    def handle(self, *args, **options):
+        self.verbosity = options["verbosity"]
+        self.batch_size = options["batch_size"]
+        self.user = options["user"]
+        self.today = date.today()
+        self.counts = {"courses": 0, "course_terms": 0, "skipped": 0}
+        self.features = connections[router.db_for_write(Course)].features
+        if not self.features.supports_update_conflicts:
+            raise CommandError("The {} database doesn't support upserts (bulk_create(update_conflicts=True))."
+                               .format(router.db_for_write(Course)))
+        start = time.perf_counter()
+        try:
+            with open(options["file"], encoding="utf-8") as fp:
+                rows = self.dedupe(iter_json_array(fp))
+                while True:
+                    batch = list(itertools.islice(rows, self.batch_size))
+                    if not batch:
+                        break
+                    with transaction.atomic():
+                        self.upsert(batch)
+                    if self.verbosity > 1:
+                        self.stdout.write("{courses} courses, {course_terms} course terms".format(**self.counts))
+        except (OSError, ValueError) as exc:
+            raise CommandError("{}: {}".format(options["file"], exc))
+        elapsed = time.perf_counter() - start
+        rows = self.counts["courses"] + self.counts["course_terms"]
+        self.stdout.write(self.style.SUCCESS(
+            "{courses} courses and {course_terms} course terms upserted, {skipped} skipped, ".format(**self.counts)
+            + "in {:.2f}s ({:,.0f} rows/sec)".format(elapsed, rows / elapsed if elapsed else 0)))
+
+    def conflicts(self, unique_field):
+        """
+        :return: `bulk_create()` options to update the rows that conflict on `unique_field`: `ON CONFLICT
+            (unique_field) DO UPDATE` where the database takes a conflict target, else (MySQL) `ON DUPLICATE KEY
+            UPDATE`, which applies to any unique key.
+        """
+        if self.features.supports_update_conflicts_with_target:
+            return {"update_conflicts": True, "unique_fields": [unique_field]}
+        return {"update_conflicts": True}
+
+    def dedupe(self, items):
+        """
+        Only the first section of each course is imported.
+        """
+        seen = set()
+        for item in items:
+            # chop off the section. Malformed items are passed on to be skipped.
+            course_identifier = str(item.get("Course"))[:9] if isinstance(item, dict) else None
+            if course_identifier not in seen:
+                if course_identifier is not None:
+                    seen.add(course_identifier)
+                yield item
+
+    def course(self, item):
+        """
+        N.B. the ODS data is not 1:1 with this schema. Just fake it (like `client/loader.py` did).
+        """
+        return Course(
+            school_bulletin_prefix_code=item["BulletinFlags"],
+            suffix_two="00",
+            subject_area_code=item["DepartmentCode"],
+            course_number=item["CallNumber"],
+            course_identifier=item["Course"][:9],
+            course_name=item["CourseTitle"],
+            course_description=item["CourseSubtitle"],
+            last_mod_user_name=self.user,
+            last_mod_date=self.today,
+        )
+
+    def course_term(self, item):
+        return CourseTerm(
+            term_identifier="{:<5}{:<9}".format(item["Term"], item["Course"][:9]),
+            audit_permitted_code=0,
+            exam_credit_flag=False,
+            last_mod_user_name=self.user,
+            last_mod_date=self.today,
+        )
+
+    def upsert(self, items):
+        """
+        Upsert a batch of courses and then their course terms, linked to the courses, with one query each.
+        Rows that fail the models' field validators are skipped.
+        """
+        courses, terms = {}, {}
+        for item in items:
+            try:
+                course, term = self.course(item), self.course_term(item)
+                course.clean_fields(exclude=["id"])
+                term.clean_fields(exclude=["id", "course"])
+            except (KeyError, TypeError, AttributeError, ValidationError) as exc:
+                self.counts["skipped"] += 1
+                if self.verbosity > 1:
+                    self.stderr.write("skipped {!r}: {}".format(item, exc))
+                continue
+            courses[course.course_identifier] = course
+            terms[course.course_identifier] = term
+        if not courses:
+            return
+        Course.objects.bulk_create(courses.values(), update_fields=COURSE_FIELDS,
+                                   **self.conflicts("course_identifier"))
+        # on conflict the existing rows keep their ids, so look them up rather than trust the ones sent.
+        course_ids = dict(Course.objects.filter(course_identifier__in=courses).values_list("course_identifier", "id"))
+        for course_identifier, term in terms.items():
+            term.course_id = course_ids[course_identifier]
+        CourseTerm.objects.bulk_create(terms.values(), update_fields=COURSE_TERM_FIELDS,
+                                       **self.conflicts("term_identifier"))
+        self.counts["courses"] += len(courses)
+        self.counts["course_terms"] += len(terms)
+        # bulk_create() sends no signals.
+        term_ids = list(CourseTerm.objects.filter(
+            term_identifier__in=[term.term_identifier for term in terms.values()]).values_list("id", flat=True))
+        fragment_cache.invalidate(Course, list(course_ids.values()))
+        fragment_cache.invalidate(CourseTerm, term_ids)
+        search_documents.update_related(Course, list(course_ids.values()))
+        search_documents.update_related(CourseTerm, term_ids)
@@ -0,0 +1,65 @@
+import os
+
+from django.core.management.base import BaseCommand
+from django.db import DEFAULT_DB_ALIAS, migrations
+from django.db.migrations.autodetector import MigrationAutodetector
+from django.db.migrations.loader import MigrationLoader
+from django.db.migrations.writer import MigrationWriter
+
+from myapp.index_advisor import IndexAdvisor, viewset_classes
+from myapp.views import CourseBaseViewSet
+
+
+class Command(BaseCommand):
+    help = ("Compare the indexes that the viewsets' declared filters, sorts and searches need with the database's, "
+            "write a migration that adds the missing ones and report how each of those queries is executed.")
+
+    def add_arguments(self, parser):
+        parser.add_argument("--database", default=DEFAULT_DB_ALIAS, help="database to compare with and EXPLAIN on")
+        parser.add_argument("--name", default="index_advisor", help="name of the migration")
+        parser.add_argument("--dry-run", action="store_true", help="just report; don't write the migration")
+        parser.add_argument("--no-explain", dest="explain", action="store_false", help="skip the EXPLAIN report")
+
+    def handle(self, *args, **options):
+        advisor = IndexAdvisor(viewset_classes(CourseBaseViewSet), using=options["database"])
+        needed, missing = advisor.advise()
+        for requirement in needed:
+            status = self.style.WARNING("missing") if requirement in missing else self.style.SUCCESS("ok")
+            self.stdout.write("{} {}".format(status, requirement))
+            report = advisor.explain(requirement) if options["explain"] else ()
+            for resource_type, parameter, uses_index, plan in report:
+                verdict = "index" if uses_index else self.style.WARNING("scan")
+                self.stdout.write("    {} {}: {}".format(resource_type, parameter, verdict))
+                if options["verbosity"] > 1:
+                    self.stdout.write("        {}".format(plan))
+        for resource_type, parameter, reason in advisor.unindexable:
+            self.stdout.write("{} {} {}: {}".format(self.style.NOTICE("unindexable"), resource_type, parameter,
+                                                    reason))
+        if not missing:
+            self.stdout.write(self.style.SUCCESS("No missing indexes."))
+            return
+        migration = self.migration(options["name"], missing)
+        writer = MigrationWriter(migration)
+        if options["dry_run"]:
+            self.stdout.write(writer.as_string())
+        else:
+            with open(writer.path, "w", encoding="utf-8") as fp:
+                fp.write(writer.as_string())
+            self.stdout.write(self.style.SUCCESS("Wrote {}".format(os.path.relpath(writer.path))))
+        self.stdout.write("Add these to the models' Meta.indexes so the model state matches:")
+        for requirement in missing:
+            self.stdout.write("    {}: {},".format(requirement.model.__name__,
+                                                   MigrationWriter.serialize(requirement.index())[0]))
+
+    def migration(self, name, missing):
+        """
+        :return: a myapp migration, following the latest one, that adds the `missing` indexes
+        """
+        loader = MigrationLoader(None, ignore_no_migrations=True)
+        leaves = loader.graph.leaf_nodes("myapp")
+        number = max((MigrationAutodetector.parse_number(leaf[1]) or 0 for leaf in leaves), default=0) + 1
+        migration = migrations.Migration("{:04d}_{}".format(number, name), "myapp")
+        migration.dependencies = leaves
+        migration.operations = [migrations.AddIndex(model_name=r.model._meta.model_name, index=r.index())
+                                for r in missing]
+        return migration
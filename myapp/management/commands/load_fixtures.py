@@ -0,0 +1,24 @@
+import time
+
+from django.core.management.base import BaseCommand, CommandError
+from django.core.serializers.base import DeserializationError
+from django.db import DEFAULT_DB_ALIAS
+
+from myapp.fixture_loader import FixtureLoader
+
+
+class Command(BaseCommand):
+    help = "Load large fixtures much faster than loaddata, e.g. myapp/fixtures/courseterm.yaml."
+
+    def add_arguments(self, parser):
+        parser.add_argument("fixtures", nargs="+", help="fixture paths or names")
+        parser.add_argument("--database", default=DEFAULT_DB_ALIAS, help="database to load the fixtures into")
+
+    def handle(self, *args, **options):
+        start = time.perf_counter()
+        try:
+            count = FixtureLoader(using=options["database"]).load(*options["fixtures"])
+        except (OSError, DeserializationError) as exc:
+            raise CommandError(exc)
+        self.stdout.write(self.style.SUCCESS("Installed {} object(s) from {} fixture(s) in {:.2f}s".format(
+            count, len(options["fixtures"]), time.perf_counter() - start)))
@@ -0,0 +1,18 @@
+import time
+
+from django.core.management.base import BaseCommand
+from django.db import transaction
+
+from myapp.models import SearchDocument
+from myapp.search import search_documents
+
+
+class Command(BaseCommand):
+    help = "Rebuild the denormalized search documents, e.g. after changing rows with raw SQL."
+
+    def handle(self, *args, **options):
+        start = time.perf_counter()
+        with transaction.atomic():
+            search_documents.rebuild()
+        self.stdout.write(self.style.SUCCESS("Rebuilt {} search document(s) in {:.2f}s".format(
+            SearchDocument.objects.count(), time.perf_counter() - start)))
@@ -0,0 +1,53 @@
+# Generated by Django 5.1.15 on 2026-10-18 11:03
+
+from django.db import migrations, models
+from django.db.models.functions import Now
+
+
+def set_row_version(apps, schema_editor):
+    """
+    Existing rows get a row_version of now.
+    """
+    for model_name in ('Course', 'CourseTerm', 'Grade', 'Instructor', 'Person', 'Student'):
+        apps.get_model('myapp', model_name).objects.update(row_version=Now())
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('myapp', '0010_grade_student_grade_person'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='course',
+            name='row_version',
+            field=models.DateTimeField(auto_now=True, db_index=True, help_text='when this row was last changed', null=True),
+        ),
+        migrations.AddField(
+            model_name='courseterm',
+            name='row_version',
+            field=models.DateTimeField(auto_now=True, db_index=True, help_text='when this row was last changed', null=True),
+        ),
+        migrations.AddField(
+            model_name='grade',
+            name='row_version',
+            field=models.DateTimeField(auto_now=True, db_index=True, help_text='when this row was last changed', null=True),
+        ),
+        migrations.AddField(
+            model_name='instructor',
+            name='row_version',
+            field=models.DateTimeField(auto_now=True, db_index=True, help_text='when this row was last changed', null=True),
+        ),
+        migrations.AddField(
+            model_name='person',
+            name='row_version',
+            field=models.DateTimeField(auto_now=True, db_index=True, help_text='when this row was last changed', null=True),
+        ),
+        migrations.AddField(
+            model_name='student',
+            name='row_version',
+            field=models.DateTimeField(auto_now=True, db_index=True, help_text='when this row was last changed', null=True),
+        ),
+        migrations.RunPython(set_row_version, migrations.RunPython.noop),
+    ]
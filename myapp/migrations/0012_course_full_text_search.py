@@ -0,0 +1,67 @@
+from django.db import migrations
+
+# The full-text index DDL is copied here, not imported from myapp.search, so that later changes to
+# myapp.search.FullTextIndex (or FULL_TEXT_INDEXES) don't change what this migration does.
+COURSE_TABLE = "myapp_course"
+COURSE_COLUMNS = ("course_name", "course_description", "course_identifier", "course_number")
+
+
+def full_text_index(vendor, q, table, columns):
+    """
+    :return: ([create statements], [drop statements]) for a full-text index on `columns` of `table` as
+        myapp.search.FullTextIndex made it when this migration was written.
+    """
+    name = "{}_fts".format(table)
+    if vendor == "postgresql":
+        document = " || ' ' || ".join("coalesce({}, '')".format(q(c)) for c in columns)
+        return ([
+            "ALTER TABLE {} ADD COLUMN search_vector tsvector GENERATED ALWAYS AS "
+            "(to_tsvector('simple'::regconfig, {})) STORED".format(q(table), document),
+            "CREATE INDEX {} ON {} USING GIN (search_vector)".format(q(name), q(table)),
+        ], ["ALTER TABLE {} DROP COLUMN IF EXISTS search_vector".format(q(table))])
+    if vendor == "mysql":
+        return (["ALTER TABLE {} ADD FULLTEXT INDEX {} ({})".format(
+            q(table), q(name), ", ".join(q(c) for c in columns))],
+            ["ALTER TABLE {} DROP INDEX {}".format(q(table), q(name))])
+    if vendor == "sqlite":
+        names = {"fts": q(name), "table": q(table), "columns": ", ".join(q(c) for c in columns),
+                 "new": ", ".join("new.{}".format(q(c)) for c in columns),
+                 "old": ", ".join("old.{}".format(q(c)) for c in columns)}
+        delete = "INSERT INTO {fts} ({fts}, rowid, {columns}) VALUES ('delete', old.rowid, {old});"
+        insert = "INSERT INTO {fts} (rowid, {columns}) VALUES (new.rowid, {new});"
+        return ([s.format(**names) for s in (
+            "CREATE VIRTUAL TABLE {fts} USING fts5({columns}, content={table}, content_rowid='rowid')",
+            "CREATE TRIGGER " + q(name + "_ai") + " AFTER INSERT ON {table} BEGIN " + insert + " END",
+            "CREATE TRIGGER " + q(name + "_ad") + " AFTER DELETE ON {table} BEGIN " + delete + " END",
+            "CREATE TRIGGER " + q(name + "_au") + " AFTER UPDATE ON {table} BEGIN " + delete + " " + insert
+            + " END",
+            "INSERT INTO {fts} ({fts}) VALUES ('rebuild')",
+        )], ["DROP TRIGGER IF EXISTS {}".format(q(name + suffix)) for suffix in ("_ai", "_ad", "_au")]
+            + ["DROP TABLE IF EXISTS {}".format(q(name))])
+    return [], []
+
+
+def create_index(apps, schema_editor):
+    connection = schema_editor.connection
+    for statement in full_text_index(connection.vendor, connection.ops.quote_name, COURSE_TABLE, COURSE_COLUMNS)[0]:
+        schema_editor.execute(statement)
+
+
+def drop_index(apps, schema_editor):
+    connection = schema_editor.connection
+    for statement in full_text_index(connection.vendor, connection.ops.quote_name, COURSE_TABLE, COURSE_COLUMNS)[1]:
+        schema_editor.execute(statement)
+
+
+class Migration(migrations.Migration):
+    """
+    Full-text index for `filter[search]` on courses. See myapp.search.FullTextIndex.
+    """
+
+    dependencies = [
+        ('myapp', '0011_row_version'),
+    ]
+
+    operations = [
+        migrations.RunPython(create_index, drop_index),
+    ]
@@ -0,0 +1,105 @@
+# Generated by Django 5.1.15 on 2026-10-18 11:39
+
+from collections import defaultdict
+
+from django.db import migrations, models
+
+# The full-text index DDL and the document paths are copied here, not imported from myapp.search, so that
+# later changes to myapp.search (or the models it imports) don't change what this migration does.
+DOCUMENT_TABLE = "myapp_searchdocument"
+DOCUMENT_PATHS = {
+    "Person": ("name", "instructor__course_terms__course__course_name"),
+    "Instructor": ("person__name", "course_terms__course__course_name", "course_terms__course__course_identifier"),
+    "Grade": ("person__person__name", "course_term__course__course_name"),
+}
+
+
+def full_text_index(vendor, q, table, columns):
+    """
+    :return: ([create statements], [drop statements]) for a full-text index on `columns` of `table` as
+        myapp.search.FullTextIndex made it when this migration was written.
+    """
+    name = "{}_fts".format(table)
+    if vendor == "postgresql":
+        document = " || ' ' || ".join("coalesce({}, '')".format(q(c)) for c in columns)
+        return ([
+            "ALTER TABLE {} ADD COLUMN search_vector tsvector GENERATED ALWAYS AS "
+            "(to_tsvector('simple'::regconfig, {})) STORED".format(q(table), document),
+            "CREATE INDEX {} ON {} USING GIN (search_vector)".format(q(name), q(table)),
+        ], ["ALTER TABLE {} DROP COLUMN IF EXISTS search_vector".format(q(table))])
+    if vendor == "mysql":
+        return (["ALTER TABLE {} ADD FULLTEXT INDEX {} ({})".format(
+            q(table), q(name), ", ".join(q(c) for c in columns))],
+            ["ALTER TABLE {} DROP INDEX {}".format(q(table), q(name))])
+    if vendor == "sqlite":
+        names = {"fts": q(name), "table": q(table), "columns": ", ".join(q(c) for c in columns),
+                 "new": ", ".join("new.{}".format(q(c)) for c in columns),
+                 "old": ", ".join("old.{}".format(q(c)) for c in columns)}
+        delete = "INSERT INTO {fts} ({fts}, rowid, {columns}) VALUES ('delete', old.rowid, {old});"
+        insert = "INSERT INTO {fts} (rowid, {columns}) VALUES (new.rowid, {new});"
+        return ([s.format(**names) for s in (
+            "CREATE VIRTUAL TABLE {fts} USING fts5({columns}, content={table}, content_rowid='rowid')",
+            "CREATE TRIGGER " + q(name + "_ai") + " AFTER INSERT ON {table} BEGIN " + insert + " END",
+            "CREATE TRIGGER " + q(name + "_ad") + " AFTER DELETE ON {table} BEGIN " + delete + " END",
+            "CREATE TRIGGER " + q(name + "_au") + " AFTER UPDATE ON {table} BEGIN " + delete + " " + insert
+            + " END",
+            "INSERT INTO {fts} ({fts}) VALUES ('rebuild')",
+        )], ["DROP TRIGGER IF EXISTS {}".format(q(name + suffix)) for suffix in ("_ai", "_ad", "_au")]
+            + ["DROP TABLE IF EXISTS {}".format(q(name))])
+    return [], []
+
+
+def create_index(apps, schema_editor):
+    connection = schema_editor.connection
+    for statement in full_text_index(connection.vendor, connection.ops.quote_name, DOCUMENT_TABLE, ("document",))[0]:
+        schema_editor.execute(statement)
+
+
+def drop_index(apps, schema_editor):
+    connection = schema_editor.connection
+    for statement in full_text_index(connection.vendor, connection.ops.quote_name, DOCUMENT_TABLE, ("document",))[1]:
+        schema_editor.execute(statement)
+
+
+def build_documents(apps, schema_editor):
+    """
+    Build each instance's document: the distinct values of its paths, as myapp.search.SearchDocuments did.
+    """
+    db = schema_editor.connection.alias
+    SearchDocument = apps.get_model("myapp", "SearchDocument")
+    for name, paths in DOCUMENT_PATHS.items():
+        model = apps.get_model("myapp", name)
+        texts = defaultdict(dict)
+        for pk, *values in model._default_manager.using(db).values_list("pk", *paths).iterator():
+            texts[pk].update(dict.fromkeys(str(v) for v in values if v not in (None, "")))
+        SearchDocument._default_manager.using(db).bulk_create(
+            [SearchDocument(resource_model=model._meta.label, object_id=pk, document=" ".join(text))
+             for pk, text in texts.items()], batch_size=500)
+
+
+class Migration(migrations.Migration):
+    """
+    Denormalized search documents for `filter[search]` on people, instructors and grades.
+    See myapp.search.SearchDocuments.
+    """
+
+    dependencies = [
+        ('myapp', '0012_course_full_text_search'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='SearchDocument',
+            fields=[
+                ('id', models.BigAutoField(primary_key=True, serialize=False)),
+                ('resource_model', models.CharField(help_text='model label, e.g. myapp.Person', max_length=100)),
+                ('object_id', models.UUIDField(help_text="the resource's id")),
+                ('document', models.TextField(help_text='searchable text')),
+            ],
+            options={
+                'constraints': [models.UniqueConstraint(fields=('resource_model', 'object_id'), name='unique_search_document')],
+            },
+        ),
+        migrations.RunPython(create_index, drop_index),
+        migrations.RunPython(build_documents, migrations.RunPython.noop),
+    ]
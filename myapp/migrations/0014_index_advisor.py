@@ -0,0 +1,46 @@
+# Generated by Django 5.1.15 on 2026-10-18 11:44
+
+import django.db.models.functions.text
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('myapp', '0013_search_document'),
+    ]
+
+    operations = [
+        migrations.AddIndex(
+            model_name='course',
+            index=models.Index(fields=['subject_area_code', 'course_number'], name='myapp_cours_subject_21362b_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='course',
+            index=models.Index(fields=['course_name', 'course_number'], name='myapp_cours_course__7ffcbd_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='course',
+            index=models.Index(django.db.models.functions.text.Upper('course_name'), name='myapp_cours_course__19ffd3_ci'),
+        ),
+        migrations.AddIndex(
+            model_name='course',
+            index=models.Index(django.db.models.functions.text.Upper('course_identifier'), name='myapp_cours_course__0b4524_ci'),
+        ),
+        migrations.AddIndex(
+            model_name='course',
+            index=models.Index(fields=['course_number'], name='myapp_cours_course__ae79ae_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='course',
+            index=models.Index(fields=['school_bulletin_prefix_code', 'course_number'], name='myapp_cours_school__3217f2_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='courseterm',
+            index=models.Index(fields=['audit_permitted_code', 'term_identifier'], name='myapp_cours_audit_p_b64ae7_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='courseterm',
+            index=models.Index(fields=['exam_credit_flag', 'term_identifier'], name='myapp_cours_exam_cr_e0cab2_idx'),
+        ),
+    ]
@@ -0,0 +1,44 @@
+# Generated by Django 5.1.15 on 2026-10-18 11:47
+
+import django.db.models.functions.text
+from django.db import migrations, models
+
+# The trigram index DDL is copied here, not imported from myapp.search, so that later changes to
+# myapp.search.TrigramIndex (or TRIGRAM_INDEXES) don't change what this migration does.
+TRIGRAM_INDEXES = (("myapp_course", "course_name"), ("myapp_person", "name"))
+
+
+def create_indexes(apps, schema_editor):
+    if schema_editor.connection.vendor != "postgresql":
+        return
+    q = schema_editor.connection.ops.quote_name
+    schema_editor.execute("CREATE EXTENSION IF NOT EXISTS pg_trgm")
+    for table, column in TRIGRAM_INDEXES:
+        schema_editor.execute("CREATE INDEX {} ON {} USING GIN (UPPER({}) gin_trgm_ops)".format(
+            q("{}_{}_trgm".format(table, column)), q(table), q(column)))
+
+
+def drop_indexes(apps, schema_editor):
+    if schema_editor.connection.vendor != "postgresql":
+        return
+    q = schema_editor.connection.ops.quote_name
+    for table, column in TRIGRAM_INDEXES:
+        schema_editor.execute("DROP INDEX IF EXISTS {}".format(q("{}_{}_trgm".format(table, column))))
+
+
+class Migration(migrations.Migration):
+    """
+    Case-insensitive indexes for `iexact` and (PostgreSQL) `icontains` filters. See myapp.search.TrigramIndex.
+    """
+
+    dependencies = [
+        ('myapp', '0014_index_advisor'),
+    ]
+
+    operations = [
+        migrations.AddIndex(
+            model_name='person',
+            index=models.Index(django.db.models.functions.text.Upper('name'), name='myapp_perso_name_f31be5_ci'),
+        ),
+        migrations.RunPython(create_indexes, drop_indexes),
+    ]
@@ -0,0 +1,61 @@
+# Generated by Django 5.1.15 on 2026-10-18 11:50
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('myapp', '0015_case_insensitive_indexes'),
+    ]
+
+    operations = [
+        migrations.AddIndex(
+            model_name='course',
+            index=models.Index(fields=['effective_start_date', 'effective_end_date'], name='myapp_course_effective'),
+        ),
+        migrations.AddIndex(
+            model_name='course',
+            index=models.Index(condition=models.Q(('effective_start_date__isnull', True)), fields=['effective_end_date'], name='myapp_course_open_start'),
+        ),
+        migrations.AddIndex(
+            model_name='courseterm',
+            index=models.Index(fields=['effective_start_date', 'effective_end_date'], name='myapp_courseterm_effective'),
+        ),
+        migrations.AddIndex(
+            model_name='courseterm',
+            index=models.Index(condition=models.Q(('effective_start_date__isnull', True)), fields=['effective_end_date'], name='myapp_courseterm_open_start'),
+        ),
+        migrations.AddIndex(
+            model_name='grade',
+            index=models.Index(fields=['effective_start_date', 'effective_end_date'], name='myapp_grade_effective'),
+        ),
+        migrations.AddIndex(
+            model_name='grade',
+            index=models.Index(condition=models.Q(('effective_start_date__isnull', True)), fields=['effective_end_date'], name='myapp_grade_open_start'),
+        ),
+        migrations.AddIndex(
+            model_name='instructor',
+            index=models.Index(fields=['effective_start_date', 'effective_end_date'], name='myapp_instructor_effective'),
+        ),
+        migrations.AddIndex(
+            model_name='instructor',
+            index=models.Index(condition=models.Q(('effective_start_date__isnull', True)), fields=['effective_end_date'], name='myapp_instructor_open_start'),
+        ),
+        migrations.AddIndex(
+            model_name='person',
+            index=models.Index(fields=['effective_start_date', 'effective_end_date'], name='myapp_person_effective'),
+        ),
+        migrations.AddIndex(
+            model_name='person',
+            index=models.Index(condition=models.Q(('effective_start_date__isnull', True)), fields=['effective_end_date'], name='myapp_person_open_start'),
+        ),
+        migrations.AddIndex(
+            model_name='student',
+            index=models.Index(fields=['effective_start_date', 'effective_end_date'], name='myapp_student_effective'),
+        ),
+        migrations.AddIndex(
+            model_name='student',
+            index=models.Index(condition=models.Q(('effective_start_date__isnull', True)), fields=['effective_end_date'], name='myapp_student_open_start'),
+        ),
+    ]
@@ -2,6 +2,19 @@ import uuid
 
 from django.core import validators
 from django.db import models
+from django.db.models.functions import Upper
+from django.utils import timezone
+
+
+class CommonQuerySet(models.QuerySet):
+    """
+    A :class:`django.db.models.QuerySet` whose `update()` sets `row_version` as `save()` does (`auto_now`
+    doesn't apply to updates) so that the conditional GET validators notice bulk updates.
+    """
+
+    def update(self, **kwargs):
+        kwargs.setdefault("row_version", timezone.now())
+        return super().update(**kwargs)
 
 
 class CommonModel(models.Model):
@@ -39,9 +52,28 @@ class CommonModel(models.Model):
     """Who last modified this instance"""
     last_mod_date = models.DateField(auto_now=True, help_text="when they modified it")
     """Wheno they modified it"""
+    row_version = models.DateTimeField(
+        auto_now=True,
+        null=True,
+        db_index=True,
+        help_text="when this row was last changed",
+    )
+    """When this row was last changed: used for HTTP `ETag` and `Last-Modified` validators"""
+
+    objects = CommonQuerySet.as_manager()
 
     class Meta:
         abstract = True
+        #: for `filter[effective_on]` (see :py:func:`myapp.filters.effective_on`): rows with a start date
+        #: by (start, end) and those without one, which is most of them, by end date. Django doesn't create
+        #: the partial index at all on databases without partial indexes (MySQL); there the composite one's
+        #: `start IS NULL` prefix serves those rows.
+        indexes = [
+            models.Index(fields=["effective_start_date", "effective_end_date"],
+                         name="%(app_label)s_%(class)s_effective"),
+            models.Index(fields=["effective_end_date"], condition=models.Q(effective_start_date__isnull=True),
+                         name="%(app_label)s_%(class)s_open_start"),
+        ]
 
 
 class Course(CommonModel):
@@ -73,8 +105,18 @@ class Course(CommonModel):
     course_name = models.CharField(max_length=80, help_text="Course official title")
     course_description = models.TextField(help_text="Course description")
 
-    class Meta:
+    class Meta(CommonModel.Meta):
         ordering = ["course_number"]
+        #: for the declared filters and sorts; see the `index_advisor` management command.
+        indexes = CommonModel.Meta.indexes + [
+            models.Index(fields=["subject_area_code", "course_number"], name="myapp_cours_subject_21362b_idx"),
+            models.Index(fields=["course_name", "course_number"], name="myapp_cours_course__7ffcbd_idx"),
+            models.Index(Upper("course_name"), name="myapp_cours_course__19ffd3_ci"),
+            models.Index(Upper("course_identifier"), name="myapp_cours_course__0b4524_ci"),
+            models.Index(fields=["course_number"], name="myapp_cours_course__ae79ae_idx"),
+            models.Index(fields=["school_bulletin_prefix_code", "course_number"],
+                         name="myapp_cours_school__3217f2_idx"),
+        ]
 
     def __str__(self):
         return "%s,%s,%s,%s" % (
@@ -109,8 +151,13 @@ class CourseTerm(CommonModel):
         default=None,
     )
 
-    class Meta:
+    class Meta(CommonModel.Meta):
         ordering = ["term_identifier"]
+        #: for the declared filters and sorts; see the `index_advisor` management command.
+        indexes = CommonModel.Meta.indexes + [
+            models.Index(fields=["audit_permitted_code", "term_identifier"], name="myapp_cours_audit_p_b64ae7_idx"),
+            models.Index(fields=["exam_credit_flag", "term_identifier"], name="myapp_cours_exam_cr_e0cab2_idx"),
+        ]
 
     def __str__(self):
         return "%s,%s,%s" % (
@@ -129,9 +176,13 @@ class Person(CommonModel):
     # TODO: This might be a django-pyodbc-azure bug. Check it.
     name = models.CharField(max_length=100, unique=True)
 
-    class Meta:
+    class Meta(CommonModel.Meta):
         ordering = ["name"]
         verbose_name_plural = "people"
+        #: for the declared filters and sorts; see the `index_advisor` management command.
+        indexes = CommonModel.Meta.indexes + [
+            models.Index(Upper("name"), name="myapp_perso_name_f31be5_ci"),
+        ]
 
     def __str__(self):
         return "%s,%s" % (self.id, self.name)
@@ -153,7 +204,7 @@ class Instructor(CommonModel):
         "myapp.CourseTerm", related_name="instructors"
     )
 
-    class Meta:
+    class Meta(CommonModel.Meta):
         ordering = ["id"]
 
     def __str__(self):
@@ -175,7 +226,7 @@ class Student(CommonModel):
     #: grades includes all registered classes whether or not they have been completed
     grades = models.ManyToManyField("myapp.Grade", related_name="student")
 
-    class Meta:
+    class Meta(CommonModel.Meta):
         ordering = ["id"]
 
     def __str__(self):
@@ -213,6 +264,26 @@ class Grade(CommonModel):
         )
 
 
+class SearchDocument(models.Model):
+    """
+    Denormalized search text of a resource whose keyword search spans relationships: its own and its
+    related resources' searchable fields. See :py:class:`myapp.search.SearchDocuments`.
+    """
+
+    id = models.BigAutoField(primary_key=True)
+    resource_model = models.CharField(max_length=100, help_text="model label, e.g. myapp.Person")
+    object_id = models.UUIDField(help_text="the resource's id")
+    document = models.TextField(help_text="searchable text")
+
+    class Meta:
+        constraints = [
+            models.UniqueConstraint(fields=["resource_model", "object_id"], name="unique_search_document"),
+        ]
+
+    def __str__(self):
+        return "%s,%s" % (self.resource_model, self.object_id)
+
+
 class NonModel(CommonModel):
     """
     Make a concrete model that's not actually got a database under it.
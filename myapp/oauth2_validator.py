@@ -1,9 +1,80 @@
+import copy
+import hashlib
+import json
+import logging
+import threading
+import time
+from collections import OrderedDict
+from datetime import datetime, timezone
+
+from django.conf import settings
+from django.core.exceptions import ImproperlyConfigured
+from jwcrypto import jwt
+from oauth2_provider.models import get_access_token_model
 from oauth2_provider.oauth2_validators import OAuth2Validator
 
+from oauth import jwks
+from oauth.oauth2_introspection import introspection_flight
+
+log = logging.getLogger(__name__)
+
+AccessToken = get_access_token_model()
+
+
+class JWTUserCache(object):
+    """
+    Per-process LRU of up to `maxsize` users named by JWT access tokens, keyed by username, so that
+    validating a JWT doesn't query (or create) its user on every request. An entry lives for at most
+    `timeout` seconds so that changes to the user (e.g. `is_active`) are picked up.
+    Configure with `settings.OAUTH2_JWT_VALIDATION`.
+    """
+
+    def __init__(self, maxsize=1024, timeout=300):
+        self.maxsize = maxsize
+        self.timeout = timeout
+        self._lock = threading.Lock()
+        self._entries = OrderedDict()
+
+    @classmethod
+    def from_settings(cls):
+        """
+        Instantiate from `settings.OAUTH2_JWT_VALIDATION`
+        """
+        conf = getattr(settings, "OAUTH2_JWT_VALIDATION", {})
+        return cls(maxsize=conf.get("USER_CACHE_MAXSIZE", 1024), timeout=conf.get("USER_CACHE_TIMEOUT", 300))
+
+    def get(self, username, load):
+        """
+        :param username: the user's username
+        :param load: function of the username that returns the user, called on a miss
+        :return: a copy of the cached (or just loaded) user, as the caller may modify it
+        """
+        with self._lock:
+            entry = self._entries.get(username)
+            if entry is not None and entry[1] > time.monotonic():
+                self._entries.move_to_end(username)
+                return copy.copy(entry[0])
+        user = load(username)
+        with self._lock:
+            self._entries[username] = (user, time.monotonic() + self.timeout)
+            self._entries.move_to_end(username)
+            while len(self._entries) > self.maxsize:
+                self._entries.popitem(last=False)
+        return copy.copy(user)
+
+    def clear(self):
+        with self._lock:
+            self._entries.clear()
+
+
+#: the process-wide cache of JWT access tokens' users
+jwt_user_cache = JWTUserCache.from_settings()
+
 
 class CustomOAuth2Validator(OAuth2Validator):
     """
-    Extend the ID Token and Userinfo claims
+    Extend the ID Token and Userinfo claims.
+    Optionally validate JWT access tokens locally (see `settings.OAUTH2_JWT_VALIDATION`).
     """
     def get_additional_claims(self, request):
         """
@@ -43,3 +114,108 @@ class CustomOAuth2Validator(OAuth2Validator):
         request.scopes = request.access_token.scope.split()
         additional_claims = self.get_additional_claims(request)
         return {**claims, **additional_claims}
+
+    def _get_token_from_authentication_server(self, token, *args, **kwargs):
+        """
+        Coalesce concurrent introspection calls for the same (new) access token so that only one is made
+        and only one worker creates the AccessToken. The others share its result.
+        Args:
+            token: the access token string
+            *args, **kwargs: the introspection URL, token and credentials
+
+        Returns: AccessToken or None
+        """
+        key = "oauth.introspect:{}".format(hashlib.sha256(token.encode("utf-8")).hexdigest())
+        access_token = introspection_flight.do(
+            key,
+            lambda: super(CustomOAuth2Validator, self)._get_token_from_authentication_server(token, *args, **kwargs),
+            peek=lambda: self._peek_access_token(token),
+        )
+        # each request gets its own instance as HasClaim stashes the userinfo on it.
+        return copy.copy(access_token)
+
+    def _peek_access_token(self, token):
+        """
+        Look for the AccessToken that another worker's introspection of `token` has stored.
+        Args:
+            token: the access token string
+
+        Returns: AccessToken or None if it's not there yet or is the stale (expired or invalid) one that
+            got us introspecting in the first place.
+        """
+        access_token = self._load_access_token(token)
+        if access_token is None or not access_token.is_valid():
+            return None
+        return access_token
+
+    def _load_access_token(self, token):
+        """
+        If JWT validation is enabled and this looks like a JWT, validate it locally rather than
+        looking it up in the database (or introspecting it with the AS).
+        Args:
+            token: the access token string
+
+        Returns: AccessToken or None
+        """
+        if getattr(settings, "OAUTH2_JWT_VALIDATION", {}).get("ENABLED") and token.count(".") == 2:
+            access_token = self._validate_jwt(token)
+            if access_token is not None:
+                return access_token
+        return super()._load_access_token(token)
+
+    def _validate_jwt(self, token):
+        """
+        Verify the JWT access token's signature against the AS's cached JWKS along with its `typ` header
+        (RFC 9068 `at+jwt` so that e.g. an ID token isn't accepted), `exp` and `aud` and, if configured,
+        `iss` claims.
+        Args:
+            token: the access token string
+
+        Returns: an unsaved AccessToken with the token's claims as its userinfo, or None if not valid.
+        Raises: ImproperlyConfigured if no `AUDIENCE` is configured: any token that the AS signed, for
+            whichever resource server, would be accepted.
+        """
+        conf = settings.OAUTH2_JWT_VALIDATION
+        if not conf.get("AUDIENCE"):
+            raise ImproperlyConfigured("OAUTH2_JWT_VALIDATION requires an AUDIENCE when ENABLED.")
+        keyset = jwks.jwks_cache.get()
+        if keyset is None:
+            return None
+        check_claims = {"exp": None, "aud": conf["AUDIENCE"]}
+        if conf.get("ISSUER"):
+            check_claims["iss"] = conf["ISSUER"]
+        algs = conf.get("ALGORITHMS", ["RS256"])
+        try:
+            try:
+                validated = jwt.JWT(jwt=token, key=keyset, algs=algs, check_claims=check_claims)
+            except jwt.JWTMissingKey:
+                # the AS may have rotated its keys
+                if not jwks.jwks_cache.refresh(force=False):
+                    raise
+                validated = jwt.JWT(jwt=token, key=jwks.jwks_cache.keyset, algs=algs, check_claims=check_claims)
+        except Exception as e:
+            log.debug("JWT access token not valid: %r", e)
+            return None
+        typ = validated.token.jose_header.get("typ", "")
+        if typ.lower().removeprefix("application/") != conf.get("TYPE", "at+jwt").lower():
+            log.debug("JWT is not an access token: typ %r", typ)
+            return None
+        claims = json.loads(validated.claims)
+        username_claim = conf.get("USERNAME_CLAIM", "username")
+        if username_claim in claims:
+            user = jwt_user_cache.get(claims[username_claim],
+                                      lambda username: self.get_or_create_user_from_content({"username": username}))
+        else:
+            user = None
+        scope = claims.get("scope", "")
+        if isinstance(scope, list):
+            scope = " ".join(scope)
+        return AccessToken(
+            token=token,
+            token_checksum=hashlib.sha256(token.encode("utf-8")).hexdigest(),
+            user=user,
+            application=None,
+            scope=scope,
+            expires=datetime.fromtimestamp(claims["exp"], tz=timezone.utc),
+            userinfo=json.dumps(claims),
+        )
@@ -0,0 +1,204 @@
+import hashlib
+import json
+from functools import partial
+
+from django.core.cache import cache
+from django.core.paginator import Paginator as DjangoPaginator
+from django.db import connections
+from django.db.models import QuerySet
+from django.utils.functional import cached_property
+from drf_spectacular_jsonapi.schemas.pagination import JsonApiPageNumberPagination
+from rest_framework.pagination import CursorPagination
+from rest_framework.utils.urls import replace_query_param
+from rest_framework.views import Response
+
+
+class JsonApiCursorPagination(CursorPagination):
+    """
+    A {json:api} keyset (cursor) pagination: `page[cursor]` and `page[size]`.
+
+    Rather than `COUNT(*)` plus `OFFSET n`, each page is a `WHERE key > last_key ... LIMIT size` so
+    deep pages cost the same as the first. The key is the `?sort` ordering if given, else the model's
+    `Meta.ordering`. The cursor is opaque: clients just follow the `next` and `prev` links.
+    No total count is available so `meta.pagination` is omitted.
+
+    Use it for a given ViewSet with `pagination_class = JsonApiCursorPagination` or, per-request,
+    with :py:class:`JsonApiPageNumberOrCursorPagination`.
+    """
+
+    cursor_query_param = "page[cursor]"
+    cursor_query_description = "Opaque pagination cursor from a `next` or `prev` link. Empty for the first page."
+    page_size_query_param = "page[size]"
+    max_page_size = 100
+
+    def get_ordering(self, request, queryset, view):
+        """
+        Use the `?sort` ordering if provided, else the model's `Meta.ordering`, else the primary key.
+        """
+        ordering = None
+        for backend in getattr(view, "filter_backends", []):
+            if hasattr(backend, "get_ordering"):
+                ordering = backend().get_ordering(request, queryset, view)
+                break
+        if not ordering:
+            ordering = queryset.model._meta.ordering or ("pk",)
+        if isinstance(ordering, str):
+            return (ordering,)
+        return tuple(ordering)
+
+    def get_first_link(self):
+        """
+        The first page is requested with an empty cursor.
+        """
+        return replace_query_param(self.base_url, self.cursor_query_param, "")
+
+    def get_paginated_response(self, data):
+        return Response(
+            {
+                "results": data,
+                "links": {
+                    "first": self.get_first_link(),
+                    "next": self.get_next_link(),
+                    "prev": self.get_previous_link(),
+                },
+            }
+        )
+
+
+class CountingPaginator(DjangoPaginator):
+    """
+    A Django Paginator that gets its `count` from the pagination class's counting strategy.
+    """
+
+    def __init__(self, object_list, per_page, pagination=None, **kwargs):
+        self.pagination = pagination
+        super().__init__(object_list, per_page, **kwargs)
+
+    @cached_property
+    def count(self):
+        return self.pagination.get_count(self.object_list)
+
+
+class JsonApiCountingPageNumberPagination(JsonApiPageNumberPagination):
+    """
+    Page number pagination that avoids an exact `COUNT(*)` for `meta.pagination.count` where it can:
+
+    - unfiltered collections that the database's planner estimates at `count_estimate_threshold`
+      rows or more use that estimate (PostgreSQL and MySQL only).
+    - filtered collections cache their count for `count_cache_timeout` seconds, keyed by the
+      normalized `filter[...]` query parameters.
+    - otherwise the count is exact.
+
+    The strategy used is returned in `meta.pagination.count_strategy`: one of `exact`, `estimated` or `cached`.
+    """
+
+    #: unfiltered tables estimated at least this large use the planner's estimate.
+    count_estimate_threshold = 100000
+    #: how long, in seconds, to cache filtered counts.
+    count_cache_timeout = 60
+    #: set by :py:meth:`get_count`
+    count_strategy = "exact"
+
+    @property
+    def django_paginator_class(self):
+        return partial(CountingPaginator, pagination=self)
+
+    def get_count(self, queryset):
+        """
+        Count the (filtered) queryset using the cheapest strategy available.
+        """
+        if not isinstance(queryset, QuerySet):
+            self.count_strategy = "exact"
+            return len(queryset)
+        if not queryset.query.where:
+            estimate = self.get_estimated_count(queryset)
+            if estimate is not None and estimate >= self.count_estimate_threshold:
+                self.count_strategy = "estimated"
+                return estimate
+            self.count_strategy = "exact"
+            return queryset.count()
+        key = self.get_count_cache_key(queryset)
+        count = cache.get(key)
+        if count is not None:
+            self.count_strategy = "cached"
+            return count
+        count = queryset.count()
+        cache.set(key, count, self.count_cache_timeout)
+        self.count_strategy = "exact"
+        return count
+
+    def get_estimated_count(self, queryset):
+        """
+        Return the planner's row estimate for the queryset's table or None if not available.
+        """
+        connection = connections[queryset.db]
+        table = queryset.model._meta.db_table
+        if connection.vendor == "postgresql":
+            sql = "SELECT reltuples FROM pg_class WHERE relname = %s"
+        elif connection.vendor == "mysql":
+            sql = "SELECT table_rows FROM information_schema.tables WHERE table_schema = DATABASE() AND table_name = %s"
+        else:
+            return None
+        with connection.cursor() as cursor:
+            cursor.execute(sql, [table])
+            row = cursor.fetchone()
+        # PostgreSQL reports -1 for a table that has never been analyzed.
+        if row is None or row[0] is None or row[0] < 0:
+            return None
+        return int(row[0])
+
+    def get_count_cache_key(self, queryset):
+        """
+        Cache key for the count of `queryset` built from the model and normalized `filter[...]` parameters.
+        """
+        filters = sorted(
+            (key, sorted(v.strip() for v in values))
+            for key, values in self.request.query_params.lists()
+            if key.startswith("filter[")
+        )
+        digest = hashlib.sha256(json.dumps([queryset.model._meta.label, filters]).encode()).hexdigest()
+        return "myapp.pagination.count:{}".format(digest)
+
+    def get_paginated_response(self, data):
+        response = super().get_paginated_response(data)
+        response.data["meta"]["pagination"]["count_strategy"] = self.count_strategy
+        return response
+
+    def get_paginated_response_schema(self, schema):
+        response_schema = super().get_paginated_response_schema(schema)
+        response_schema["properties"]["meta"]["properties"]["pagination"]["properties"]["count_strategy"] = {
+            "type": "string",
+            "enum": ["exact", "estimated", "cached"],
+            "example": "exact",
+            "description": "How `count` was computed. `estimated` and `cached` counts may be approximate.",
+        }
+        return response_schema
+
+
+class JsonApiPageNumberOrCursorPagination(JsonApiCountingPageNumberPagination):
+    """
+    Page number pagination unless the client asks for cursor pagination by adding `page[cursor]`
+    (an empty value for the first page) to the request, in which case
+    :py:class:`JsonApiCursorPagination` is used. A list that isn't a QuerySet (e.g. `NonModelViewSet`'s) has
+    no keys to seek on so it is always paginated by page number.
+    """
+
+    #: the pagination class used when `page[cursor]` is present.
+    cursor_pagination_class = JsonApiCursorPagination
+
+    def paginate_queryset(self, queryset, request, view=None):
+        if self.cursor_pagination_class.cursor_query_param in request.query_params and isinstance(
+                queryset, QuerySet):
+            self.cursor_paginator = self.cursor_pagination_class()
+            return self.cursor_paginator.paginate_queryset(queryset, request, view)
+        self.cursor_paginator = None
+        return super().paginate_queryset(queryset, request, view)
+
+    def get_paginated_response(self, data):
+        if self.cursor_paginator is not None:
+            return self.cursor_paginator.get_paginated_response(data)
+        return super().get_paginated_response(data)
+
+    def get_schema_operation_parameters(self, view):
+        parameters = super().get_schema_operation_parameters(view)
+        return parameters + self.cursor_pagination_class().get_schema_operation_parameters(view)[:1]
@@ -0,0 +1,65 @@
+import orjson
+from django.conf import settings
+from rest_framework import parsers as drf_parsers
+from rest_framework.exceptions import ParseError
+from rest_framework_json_api import parsers
+
+
+class JSONParser(parsers.JSONParser):
+    """
+    :py:class:`rest_framework_json_api.parsers.JSONParser` that also accepts a list of resource objects as the
+    primary data of a POST to a collection, for :py:class:`myapp.views.BulkCreateMixIn`.
+    Each resource object is checked and parsed just like a single one.
+    """
+
+    def parse_data(self, result, parser_context):
+        from rest_framework_json_api.views import RelationshipView
+
+        data = result.get("data") if isinstance(result, dict) else None
+        request = (parser_context or {}).get("request")
+        view = (parser_context or {}).get("view")
+        if (isinstance(data, list) and request is not None and request.method == "POST"
+                and not isinstance(view, RelationshipView)):
+            return [super(JSONParser, self).parse_data({**result, "data": item}, parser_context) for item in data]
+        return super().parse_data(result, parser_context)
+
+
+class ORJSONBaseParser(drf_parsers.JSONParser):
+    """
+    Decode with orjson rather than the stdlib json. This sits between the {json:api} parser (which calls
+    `super().parse()` and then unwraps the document) and DRF's parser (which decodes it).
+
+    orjson only decodes UTF-8 so other request encodings fall back to the stdlib decoder.
+    Like `STRICT_JSON`, NaN and Infinity are rejected.
+    """
+
+    def parse(self, stream, media_type=None, parser_context=None):
+        encoding = (parser_context or {}).get("encoding", settings.DEFAULT_CHARSET)
+        if encoding.lower().replace("_", "-") not in ("utf-8", "utf8"):
+            return super().parse(stream, media_type, parser_context)
+        try:
+            return orjson.loads(stream.read())
+        except orjson.JSONDecodeError as exc:
+            raise ParseError("JSON parse error - %s" % str(exc))
+
+
+class ORJSONParser(JSONParser, ORJSONBaseParser):
+    """
+    :py:class:`JSONParser` decoded with orjson.
+    """
+    pass
+
+
+class AtomicOperationsParser(ORJSONBaseParser):
+    """
+    The {json:api} [Atomic Operations](https://jsonapi.org/ext/atomic/) extension media type: a document with
+    an `atomic:operations` list. See :py:class:`myapp.views.OperationsView`.
+    """
+
+    media_type = 'application/vnd.api+json; ext="https://jsonapi.org/ext/atomic"'
+
+    def parse(self, stream, media_type=None, parser_context=None):
+        result = super().parse(stream, media_type, parser_context)
+        if not isinstance(result, dict) or not isinstance(result.get("atomic:operations"), list):
+            raise ParseError("Received document does not contain an atomic:operations list")
+        return result
@@ -0,0 +1,148 @@
+import orjson
+from rest_framework import renderers as drf_renderers
+from rest_framework.settings import api_settings
+from rest_framework.utils.encoders import JSONEncoder
+from rest_framework_json_api import renderers
+from rest_framework_json_api.utils import get_resource_name, get_serializer_fields
+
+from myapp.fragments import fragment_cache
+
+
+class JSONRenderer(renderers.JSONRenderer):
+    """
+    The {json:api} renderer, caching each resource object it builds.
+    See :py:class:`myapp.fragments.FragmentCache`.
+    """
+
+    @classmethod
+    def build_json_resource_obj(cls, fields, resource, resource_instance, resource_name, serializer,
+                                force_type_resolution=False):
+        child = getattr(serializer, "child", serializer)
+        key, fragment = fragment_cache.lookup(child, resource_instance)
+        if fragment is not None:
+            return fragment["object"]
+        resource_object = super().build_json_resource_obj(
+            fields, resource, resource_instance, resource_name, serializer, force_type_resolution)
+        if key is not None:
+            fragment_cache.store(child, key, resource, resource_object)
+        return resource_object
+
+    def stream(self, chunks, accepted_media_type=None, renderer_context=None):
+        """
+        Render a collection document incrementally, one chunk of resources at a time, for a
+        :py:class:`django.http.StreamingHttpResponse`. See :py:class:`myapp.views.StreamingListMixIn`.
+
+        :param chunks: iterable of `many=True` serializer data, one per chunk of resources.
+        :return: generator of the document's bytes.
+        """
+        renderer_context = renderer_context or {}
+        request = renderer_context.get("request", None)
+        resource_name = get_resource_name(renderer_context)
+        links = {"self": request.build_absolute_uri()} if request is not None else {}
+        yield b'{"links":' + self.encode(links, accepted_media_type, renderer_context) + b',"data":['
+        count = 0
+        for data in chunks:
+            resource_objects = [self.encode(resource_object, accepted_media_type, renderer_context)
+                                for _, resource_object in self.resource_objects(data, resource_name)]
+            if resource_objects:
+                yield (b"," if count else b"") + b",".join(resource_objects)
+            count += len(resource_objects)
+        yield b'],"meta":' + self.encode({"count": count}, accepted_media_type, renderer_context) + b"}"
+
+    def resource_objects(self, data, resource_name):
+        """
+        Build the resource objects of `many=True` serializer data.
+
+        :return: generator of (instance, resource object)
+        """
+        serializer = data.serializer
+        fields = get_serializer_fields(serializer.child)
+        for position, resource in enumerate(data):
+            instance = serializer.instance[position]
+            yield instance, self.build_json_resource_obj(fields, resource, instance, resource_name, serializer)
+
+    def encode(self, data, accepted_media_type=None, renderer_context=None):
+        """
+        Encode `data` as-is: just the JSON encoding step of :py:meth:`render`.
+        """
+        return super(renderers.JSONRenderer, self).render(data, accepted_media_type, renderer_context)
+
+
+class NDJSONRenderer(drf_renderers.BaseRenderer):
+    """
+    Newline-delimited JSON: one {json:api} resource object per line, each with its `watermark_field`
+    in its `meta`. Resource objects are built and encoded by the first of the `DEFAULT_RENDERER_CLASSES`.
+    See :py:meth:`myapp.views.StreamingListMixIn.export`.
+    """
+
+    media_type = "application/x-ndjson"
+    format = "ndjson"
+    charset = None
+    #: model field added to each resource object's `meta` so that an export can be resumed from it
+    watermark_field = "row_version"
+
+    @property
+    def resource_renderer(self):
+        return api_settings.DEFAULT_RENDERER_CLASSES[0]()
+
+    def render(self, data, accepted_media_type=None, renderer_context=None):
+        # just errors: a {json:api} errors document on one line.
+        return self.resource_renderer.render(data, None, renderer_context)
+
+    def stream(self, chunks, accepted_media_type=None, renderer_context=None):
+        """
+        Render resources as lines, one chunk of resources at a time, for a
+        :py:class:`django.http.StreamingHttpResponse`.
+
+        :param chunks: iterable of `many=True` serializer data, one per chunk of resources.
+        :return: generator of bytes, one per chunk.
+        """
+        renderer_context = renderer_context or {}
+        renderer = self.resource_renderer
+        resource_name = get_resource_name(renderer_context)
+        for data in chunks:
+            lines = []
+            for instance, resource_object in renderer.resource_objects(data, resource_name):
+                meta = {**resource_object.get("meta", {}),
+                        self.watermark_field: getattr(instance, self.watermark_field, None)}
+                lines.append(renderer.encode({**resource_object, "meta": meta}, None, renderer_context) + b"\n")
+            if lines:
+                yield b"".join(lines)
+
+
+class ORJSONBaseRenderer(drf_renderers.JSONRenderer):
+    """
+    Encode with orjson rather than the stdlib json. This sits between the {json:api} renderer (which builds
+    the document and then calls `super().render()`) and DRF's renderer (which encodes it).
+
+    UUIDs are encoded natively; `OPT_PASSTHROUGH_DATETIME` sends dates, times and datetimes, along with
+    anything else orjson doesn't know (Decimal, lazy translation strings, ...), to DRF's encoder so the output
+    is the same as the stdlib renderer's.
+    Indented output (e.g. `; indent=4`) falls back to the stdlib encoder.
+    """
+
+    #: orjson options
+    orjson_option = orjson.OPT_PASSTHROUGH_DATETIME
+
+    def render(self, data, accepted_media_type=None, renderer_context=None):
+        if data is None:
+            return b""
+        if self.get_indent(accepted_media_type, renderer_context or {}):
+            return super().render(data, accepted_media_type, renderer_context)
+        return orjson.dumps(data, default=JSONEncoder().default, option=self.orjson_option)
+
+
+class ORJSONRenderer(JSONRenderer, ORJSONBaseRenderer):
+    """
+    :py:class:`JSONRenderer` encoded with orjson.
+    """
+    pass
+
+
+class AtomicOperationsRenderer(ORJSONRenderer):
+    """
+    The {json:api} [Atomic Operations](https://jsonapi.org/ext/atomic/) extension media type.
+    See :py:class:`myapp.views.OperationsView`.
+    """
+
+    media_type = 'application/vnd.api+json; ext="https://jsonapi.org/ext/atomic"'
@@ -0,0 +1,399 @@
+import logging
+import re
+from collections import defaultdict
+
+from django.db import DEFAULT_DB_ALIAS, connections, router
+from django.db.models import BooleanField, FloatField, OuterRef, Subquery
+from django.db.models.constants import LOOKUP_SEP
+from django.db.models.expressions import Expression
+from django.db.models.signals import m2m_changed, post_delete, post_save, pre_delete, pre_save
+from rest_framework.filters import SearchFilter
+from rest_framework_json_api.filters import OrderingFilter
+
+from myapp.models import Course, Grade, Instructor, Person, SearchDocument
+
+log = logging.getLogger(__name__)
+
+
+class FullTextIndex(object):
+    """
+    A database full-text index over some text `columns` of `table`, maintained by the database itself so that
+    every write (ORM, bulk, raw or `loaddata`) keeps it current:
+
+    - PostgreSQL: a generated `tsvector` column (`simple` configuration) with a GIN index.
+    - MySQL: an InnoDB `FULLTEXT` index on the columns.
+    - SQLite: an external content FTS5 table kept in sync by triggers.
+
+    Search terms are split into words and each word must match the start of a word in one of the columns.
+    Created by a migration with :py:meth:`create`.
+    """
+
+    #: the database vendors that have full-text indexes
+    vendors = ("postgresql", "mysql", "sqlite")
+
+    def __init__(self, table, columns):
+        self.table = table
+        self.columns = tuple(columns)
+
+    @property
+    def name(self):
+        return "{}_fts".format(self.table)
+
+    def create(self, schema_editor):
+        connection = schema_editor.connection
+        for statement in getattr(self, "_create_{}".format(connection.vendor), lambda q: [])(connection.ops.quote_name):
+            schema_editor.execute(statement)
+
+    def drop(self, schema_editor):
+        connection = schema_editor.connection
+        for statement in getattr(self, "_drop_{}".format(connection.vendor), lambda q: [])(connection.ops.quote_name):
+            schema_editor.execute(statement)
+
+    def ensure(self, connection):
+        """
+        Recreate the SQLite triggers (and reindex) if the index exists but they were lost: SQLite migrations
+        that alter a table rebuild it without its triggers and with new rowids.
+        """
+        if connection.vendor != "sqlite":
+            return
+        with connection.cursor() as cursor:
+            cursor.execute("SELECT type, count(*) FROM sqlite_master WHERE name = %s OR name LIKE %s GROUP BY type",
+                           [self.name, "{}_a_".format(self.name)])
+            found = dict(cursor.fetchall())
+            if not found.get("table") or found.get("trigger") == 3:
+                return
+            log.info("recreating the %s full-text index", self.table)
+            for statement in self._drop_sqlite(connection.ops.quote_name) + self._create_sqlite(
+                    connection.ops.quote_name):
+                cursor.execute(statement)
+
+    def _create_postgresql(self, q):
+        document = " || ' ' || ".join("coalesce({}, '')".format(q(c)) for c in self.columns)
+        return [
+            "ALTER TABLE {} ADD COLUMN search_vector tsvector GENERATED ALWAYS AS "
+            "(to_tsvector('simple'::regconfig, {})) STORED".format(q(self.table), document),
+            "CREATE INDEX {} ON {} USING GIN (search_vector)".format(q(self.name), q(self.table)),
+        ]
+
+    def _drop_postgresql(self, q):
+        return ["ALTER TABLE {} DROP COLUMN IF EXISTS search_vector".format(q(self.table))]
+
+    def _create_mysql(self, q):
+        return ["ALTER TABLE {} ADD FULLTEXT INDEX {} ({})".format(
+            q(self.table), q(self.name), ", ".join(q(c) for c in self.columns))]
+
+    def _drop_mysql(self, q):
+        return ["ALTER TABLE {} DROP INDEX {}".format(q(self.table), q(self.name))]
+
+    def _create_sqlite(self, q):
+        columns = ", ".join(q(c) for c in self.columns)
+        new = ", ".join("new.{}".format(q(c)) for c in self.columns)
+        old = ", ".join("old.{}".format(q(c)) for c in self.columns)
+        delete = "INSERT INTO {fts} ({fts}, rowid, {columns}) VALUES ('delete', old.rowid, {old});"
+        insert = "INSERT INTO {fts} (rowid, {columns}) VALUES (new.rowid, {new});"
+        names = {"fts": q(self.name), "table": q(self.table), "columns": columns, "new": new, "old": old}
+        return [s.format(**names) for s in (
+            "CREATE VIRTUAL TABLE {fts} USING fts5({columns}, content={table}, content_rowid='rowid')",
+            "CREATE TRIGGER " + q(self.name + "_ai") + " AFTER INSERT ON {table} BEGIN " + insert + " END",
+            "CREATE TRIGGER " + q(self.name + "_ad") + " AFTER DELETE ON {table} BEGIN " + delete + " END",
+            "CREATE TRIGGER " + q(self.name + "_au") + " AFTER UPDATE ON {table} BEGIN " + delete + " " + insert
+            + " END",
+            "INSERT INTO {fts} ({fts}) VALUES ('rebuild')",
+        )]
+
+    def _drop_sqlite(self, q):
+        return ["DROP TRIGGER IF EXISTS {}".format(q(self.name + suffix)) for suffix in ("_ai", "_ad", "_au")] + [
+            "DROP TABLE IF EXISTS {}".format(q(self.name))]
+
+    def search(self, queryset, words):
+        """
+        Filter `queryset` to the rows that match all the `words`, annotated with their `search_rank`
+        (higher is more relevant).
+        """
+        connection = connections[queryset.db]
+        q = connection.ops.quote_name
+        if connection.vendor == "postgresql":
+            query = " & ".join("{}:*".format(word) for word in words)
+            match = "{table}.search_vector @@ to_tsquery('simple'::regconfig, %s)"
+            rank = "ts_rank({table}.search_vector, to_tsquery('simple'::regconfig, %s))"
+        elif connection.vendor == "mysql":
+            query = " ".join("+{}*".format(word) for word in words)
+            columns = ", ".join("{table}." + q(c) for c in self.columns)
+            match = rank = "MATCH (" + columns + ") AGAINST (%s IN BOOLEAN MODE)"
+        else:
+            query = " ".join('"{}"*'.format(word) for word in words)
+            fts = q(self.name)
+            match = "{table}.rowid IN (SELECT rowid FROM " + fts + " WHERE " + fts + " MATCH %s)"  # nosec B608
+            # bm25() is lower for better matches.
+            rank = "(SELECT -bm25({fts}) FROM {fts} WHERE {fts} MATCH %s AND rowid = {{table}}.rowid)".format(  # nosec
+                fts=fts)
+        return queryset.filter(FullTextExpression(match, query, output_field=BooleanField())).annotate(
+            search_rank=FullTextExpression(rank, query, output_field=FloatField()))
+
+
+class FullTextExpression(Expression):
+    """
+    A :py:class:`FullTextIndex` match or rank of the query's table, whatever its alias (e.g. in a subquery).
+    Only quoted identifiers are formatted into the `sql`: the search `query` is a parameter.
+    """
+
+    def __init__(self, sql, query, output_field):
+        super().__init__(output_field=output_field)
+        self.sql = sql
+        self.query = query
+
+    def as_sql(self, compiler, connection):
+        table = compiler.quote_name_unless_alias(compiler.query.get_initial_alias())
+        return self.sql.format(table=table), [self.query]
+
+
+#: full-text indexes that cover a model's `search_fields`
+FULL_TEXT_INDEXES = {
+    Course: FullTextIndex("myapp_course", ("course_name", "course_description", "course_identifier", "course_number")),
+    SearchDocument: FullTextIndex("myapp_searchdocument", ("document",)),
+}
+
+
+class TrigramIndex(object):
+    """
+    A PostgreSQL `pg_trgm` GIN index on `UPPER(column)` of `table`. It serves `icontains` lookups, which Django
+    compiles to `UPPER(column::text) LIKE UPPER(%s)` and no b-tree index can, as well as `iexact`.
+    There is no such index for other databases. Created by a migration with :py:meth:`create`.
+    """
+
+    #: the database vendors that have trigram indexes
+    vendors = ("postgresql",)
+
+    def __init__(self, table, column):
+        self.table = table
+        self.column = column
+
+    @property
+    def name(self):
+        return "{}_{}_trgm".format(self.table, self.column)
+
+    def create(self, schema_editor):
+        if schema_editor.connection.vendor in self.vendors:
+            q = schema_editor.connection.ops.quote_name
+            schema_editor.execute("CREATE EXTENSION IF NOT EXISTS pg_trgm")
+            schema_editor.execute("CREATE INDEX {} ON {} USING GIN (UPPER({}) gin_trgm_ops)".format(
+                q(self.name), q(self.table), q(self.column)))
+
+    def drop(self, schema_editor):
+        if schema_editor.connection.vendor in self.vendors:
+            schema_editor.execute("DROP INDEX IF EXISTS {}".format(schema_editor.connection.ops.quote_name(self.name)))
+
+
+#: trigram indexes for `icontains` filters on a model's columns
+TRIGRAM_INDEXES = {
+    Course: (TrigramIndex("myapp_course", "course_name"),),
+    Person: (TrigramIndex("myapp_person", "name"),),
+}
+
+
+class SearchDocuments(object):
+    """
+    Maintain a denormalized :py:class:`myapp.models.SearchDocument` of each instance of the models whose
+    searchable fields span relationships (e.g. a person's name and the names of the courses they teach),
+    so a keyword search is a full-text match on one table rather than joins across several, with their
+    fan-out and `DISTINCT`.
+
+    The documents are updated incrementally by signals: saving, deleting or (un)linking any instance along
+    one of the `paths` refreshes the documents that include it. Bulk operations send no signals so they
+    call :py:meth:`update_related` themselves.
+    """
+
+    #: instances whose documents are (re)built per query
+    chunk_size = 500
+
+    def __init__(self, paths, document_model=SearchDocument):
+        """
+        :param paths: {model: (field lookup paths whose values are the searchable text)}
+        :param document_model: the SearchDocument model
+        """
+        self.paths = paths
+        self.document_model = document_model
+        #: {model: [(document model, lookup from the document model to that model's instances)]}
+        self.dependencies = defaultdict(list)
+        #: the ManyToMany fields along the paths
+        self.many_to_many = set()
+        for model, model_paths in paths.items():
+            self.dependencies[model].append((model, "pk"))
+            for path in model_paths:
+                parts, related = path.split(LOOKUP_SEP), model
+                for i, part in enumerate(parts[:-1]):
+                    field = related._meta.get_field(part)
+                    if field.many_to_many:
+                        self.many_to_many.add(field if field.concrete else field.remote_field)
+                    related = field.related_model
+                    dependency = (model, LOOKUP_SEP.join(parts[:i + 1]))
+                    if dependency not in self.dependencies[related]:
+                        self.dependencies[related].append(dependency)
+
+    def affected(self, model, pks):
+        """
+        :return: {document model: primary keys of its instances whose documents include the `model` instances}
+        """
+        affected = defaultdict(set)
+        pks = [pk for pk in pks if pk is not None]
+        for document_model, lookup in self.dependencies.get(model, ()) if pks else ():
+            if lookup == "pk":
+                affected[document_model].update(pks)
+            else:
+                affected[document_model].update(document_model._default_manager.filter(
+                    **{"{}__in".format(lookup): pks}).values_list("pk", flat=True))
+        return affected
+
+    def update_related(self, model, pks):
+        """
+        Refresh the documents that include the `model` instances with primary keys `pks`.
+        """
+        for document_model, document_pks in self.affected(model, pks).items():
+            self.refresh(document_model, document_pks)
+
+    def refresh(self, model, pks):
+        """
+        (Re)build the documents of the `model` instances with primary keys `pks`, deleting those of
+        instances that no longer exist.
+
+        The documents are upserted where the database supports it so that concurrent refreshes of the same
+        instances don't violate the `unique_search_document` constraint.
+        """
+        pks = list(pks)
+        documents = self.document_model._default_manager
+        features = connections[router.db_for_write(self.document_model)].features
+        for start in range(0, len(pks), self.chunk_size):
+            chunk = pks[start:start + self.chunk_size]
+            texts = defaultdict(dict)
+            for pk, *values in model._default_manager.filter(pk__in=chunk).values_list("pk", *self.paths[model]):
+                texts[pk].update(dict.fromkeys(str(v) for v in values if v not in (None, "")))
+            gone = set(chunk) - set(texts)
+            if gone:
+                documents.filter(resource_model=model._meta.label, object_id__in=gone).delete()
+            rebuilt = [self.document_model(resource_model=model._meta.label, object_id=pk, document=" ".join(text))
+                       for pk, text in texts.items()]
+            if not features.supports_update_conflicts:
+                documents.filter(resource_model=model._meta.label, object_id__in=texts).delete()
+                documents.bulk_create(rebuilt)
+            elif features.supports_update_conflicts_with_target:
+                documents.bulk_create(rebuilt, update_conflicts=True, unique_fields=["resource_model", "object_id"],
+                                      update_fields=["document"])
+            else:
+                documents.bulk_create(rebuilt, update_conflicts=True, update_fields=["document"])
+
+    def rebuild(self):
+        """
+        Rebuild all the documents.
+        """
+        for model in self.paths:
+            self.document_model._default_manager.filter(resource_model=model._meta.label).delete()
+            self.refresh(model, model._default_manager.values_list("pk", flat=True))
+
+    def covers(self, model, search_fields):
+        return model in self.paths and set(search_fields) == set(self.paths[model])
+
+    def search(self, queryset, words):
+        """
+        Filter `queryset` to the instances whose documents match all the `words`, annotated with their
+        `search_rank` (higher is more relevant).
+        """
+        documents = FULL_TEXT_INDEXES[self.document_model].search(
+            self.document_model._default_manager.using(queryset.db).filter(
+                resource_model=queryset.model._meta.label), words)
+        return queryset.filter(pk__in=documents.values("object_id")).annotate(
+            search_rank=Subquery(documents.filter(object_id=OuterRef("pk")).values("search_rank")[:1]))
+
+    def connect(self):
+        """
+        Connect the signal handlers that keep the documents up to date.
+        """
+        for model in self.dependencies:
+            pre_save.connect(self._pre_save, sender=model, dispatch_uid="myapp.search.pre_save")
+            post_save.connect(self._post_save, sender=model, dispatch_uid="myapp.search.post_save")
+            pre_delete.connect(self._pre_delete, sender=model, dispatch_uid="myapp.search.pre_delete")
+            post_delete.connect(self._post_delete, sender=model, dispatch_uid="myapp.search.post_delete")
+        for field in self.many_to_many:
+            m2m_changed.connect(self._m2m_changed, sender=field.remote_field.through, dispatch_uid="myapp.search.m2m")
+
+    def _pre_save(self, sender, instance, raw=False, **kwargs):
+        # what links to the instance may change if one of its own relationships does.
+        if not instance._state.adding and any(f.many_to_one or f.one_to_one for f in sender._meta.concrete_fields):
+            instance._search_affected = self.affected(sender, [instance.pk])
+
+    def _post_save(self, sender, instance, raw=False, **kwargs):
+        affected = instance.__dict__.pop("_search_affected", defaultdict(set))
+        for document_model, pks in self.affected(sender, [instance.pk]).items():
+            affected[document_model].update(pks)
+        for document_model, pks in affected.items():
+            self.refresh(document_model, pks)
+
+    def _pre_delete(self, sender, instance, **kwargs):
+        instance._search_affected = self.affected(sender, [instance.pk])
+
+    def _post_delete(self, sender, instance, **kwargs):
+        for document_model, pks in instance.__dict__.pop("_search_affected", {}).items():
+            self.refresh(document_model, pks)
+
+    def _m2m_changed(self, sender, instance, action, reverse, model, pk_set, **kwargs):
+        if action == "pre_clear":
+            # find out what's about to be cleared.
+            accessor = next(f.name if f.concrete else f.get_accessor_name() for f in instance._meta.get_fields()
+                            if f.many_to_many and (f.remote_field.through if f.concrete else f.through) is sender)
+            instance._search_cleared = set(getattr(instance, accessor).values_list("pk", flat=True))
+        elif action in ("post_add", "post_remove", "post_clear"):
+            if action == "post_clear":
+                pk_set = instance.__dict__.pop("_search_cleared", set())
+            self.update_related(type(instance), [instance.pk])
+            self.update_related(model, pk_set or ())
+
+
+#: the search documents of the models whose `search_fields` span relationships
+search_documents = SearchDocuments({
+    Person: ("name", "instructor__course_terms__course__course_name"),
+    Instructor: ("person__name", "course_terms__course__course_name", "course_terms__course__course_identifier"),
+    Grade: ("person__person__name", "course_term__course__course_name"),
+})
+search_documents.connect()
+
+
+def ensure_full_text_indexes(sender, using=DEFAULT_DB_ALIAS, **kwargs):
+    """
+    `post_migrate` handler for :py:meth:`FullTextIndex.ensure`
+    """
+    for index in FULL_TEXT_INDEXES.values():
+        index.ensure(connections[using])
+
+
+class FullTextSearchFilter(SearchFilter):
+    """
+    `filter[search]` keyword search that uses the view's model's :py:class:`FullTextIndex` when it covers
+    the view's `search_fields`, or else the model's :py:class:`SearchDocuments` when they do, with the results
+    ordered by relevance unless a `sort` is requested.
+    Otherwise (neither, or no full-text index for the database) it is `rest_framework.filters.SearchFilter`.
+    """
+
+    def get_search_backend(self, queryset, view, request):
+        """
+        :return: the :py:class:`FullTextIndex` or :py:class:`SearchDocuments` to search with, or None.
+        """
+        vendor = connections[queryset.db].vendor
+        search_fields = self.get_search_fields(view, request) or ()
+        index = FULL_TEXT_INDEXES.get(queryset.model)
+        if index is not None and vendor in index.vendors and set(search_fields) == set(index.columns):
+            return index
+        if vendor in FULL_TEXT_INDEXES[SearchDocument].vendors and search_documents.covers(queryset.model,
+                                                                                           search_fields):
+            return search_documents
+        return None
+
+    def filter_queryset(self, request, queryset, view):
+        backend = self.get_search_backend(queryset, view, request)
+        if backend is None:
+            return super().filter_queryset(request, queryset, view)
+        words = [word for term in self.get_search_terms(request) for word in re.findall(r"\w+", term)]
+        if not words:
+            return queryset
+        queryset = backend.search(queryset, words)
+        if not request.query_params.get(OrderingFilter.ordering_param):
+            queryset = queryset.order_by("-search_rank", *queryset.model._meta.ordering, "pk")
+        return queryset
@@ -1,9 +1,134 @@
 from datetime import datetime
 
+from django.db.models import Manager, prefetch_related_objects
+from django.utils import timezone
+from rest_framework.exceptions import ValidationError
+from rest_framework.serializers import ListSerializer
+from rest_framework.utils import model_meta
+from rest_framework.validators import UniqueValidator
 from rest_framework_json_api.relations import ResourceRelatedField
 from rest_framework_json_api.serializers import HyperlinkedModelSerializer
 
+from myapp.fragments import fragment_cache, invalidate_linked
 from myapp.models import Course, CourseTerm, Grade, Instructor, NonModel, Person
+from myapp.search import search_documents
+
+
+class ModelListSerializer(ListSerializer):
+    """
+    `many=True` serializer that:
+
+    - looks up the cached renderings of the whole list (page) at once before serializing its members.
+      See :py:class:`myapp.fragments.FragmentCache`.
+    - creates all its members in bulk.
+    """
+
+    def to_representation(self, data):
+        iterable = data.all() if isinstance(data, Manager) else data
+        if fragment_cache.cache_alias is not None:
+            iterable = list(iterable)
+            fragment_cache.prefetch(self.child, iterable)
+        return super().to_representation(iterable)
+
+    def to_internal_value(self, data):
+        """
+        Check the unique fields of all the members with one query per field (and against each other) rather
+        than a query per member by each one's `UniqueValidator`.
+        """
+        unique = {name: [v for v in field.validators if isinstance(v, UniqueValidator)]
+                  for name, field in self.child.fields.items() if not field.read_only}
+        unique = {name: validators for name, validators in unique.items() if validators}
+        for name in unique:
+            field = self.child.fields[name]
+            field.validators = [v for v in field.validators if not isinstance(v, UniqueValidator)]
+        try:
+            validated_data = super().to_internal_value(data)
+        finally:
+            for name, validators in unique.items():
+                self.child.fields[name].validators += validators
+        errors = [{} for _ in validated_data]
+        for name, validators in unique.items():
+            source = self.child.fields[name].source
+            values = [attrs.get(source) for attrs in validated_data]
+            for validator in validators:
+                taken = set(validator.queryset.filter(**{"{}__in".format(source): [v for v in values if v is not None]})
+                            .values_list(source, flat=True))
+                for i, value in enumerate(values):
+                    if value is not None and value in taken:
+                        errors[i].setdefault(name, []).append(validator.message)
+                    taken.add(value)
+        if any(errors):
+            raise ValidationError(errors)
+        return validated_data
+
+    def create(self, validated_data):
+        """
+        Create all the instances with one `bulk_create()` and then link their toMany (and reverse toOne)
+        relationships in bulk: one `bulk_create()` of the through rows per ManyToMany and one `bulk_update()`
+        of the related rows per reverse ForeignKey.
+
+        N.B. `bulk_create()` sends no signals so this does the fragment cache invalidation and search document
+        updates.
+        """
+        model = self.child.Meta.model
+        info = model_meta.get_field_info(model)
+        instances, links = [], []
+        for attrs in validated_data:
+            self.child._last_mod(attrs)
+            links.append({name: attrs.pop(name) for name, relation in info.relations.items()
+                          if (relation.to_many or relation.reverse) and name in attrs})
+            instances.append(model(**attrs))
+        model._default_manager.bulk_create(instances)
+        invalidate_linked(instances)
+        for name in sorted({name for link in links for name in link}):
+            self._link(model._meta.get_field(name), [
+                (instance, link[name]) for instance, link in zip(instances, links) if link.get(name) is not None])
+        search_documents.update_related(model, [instance.pk for instance in instances])
+        # one query per toMany relationship to render the linkage
+        prefetch_related_objects(instances, *[
+            name for name, relation in info.relations.items()
+            if (relation.to_many or relation.reverse) and name in self.child.fields])
+        return instances
+
+    def _link(self, field, pairs):
+        """
+        Link each instance to its related objects.
+        :param field: the toMany or reverse relation
+        :param pairs: (instance, related object or list of them)
+        """
+        pairs = [(instance, related if isinstance(related, (list, tuple)) else [related])
+                 for instance, related in pairs]
+        related_model = field.related_model
+        if field.many_to_many:
+            through = field.remote_field.through if field.concrete else field.through
+            forward = field if field.concrete else field.remote_field
+            source, target = forward.m2m_field_name(), forward.m2m_reverse_field_name()
+            if not field.concrete:
+                source, target = target, source
+            source = through._meta.get_field(source).attname
+            target = through._meta.get_field(target).attname
+            through._default_manager.bulk_create(
+                [through(**{source: instance.pk, target: obj.pk}) for instance, related in pairs for obj in related])
+            fragment_cache.invalidate(related_model, [obj.pk for _, related in pairs for obj in related])
+            search_documents.update_related(related_model, [obj.pk for _, related in pairs for obj in related])
+            return
+        # a reverse ForeignKey or OneToOne: point the related rows at the instance.
+        foreign_key = field.remote_field
+        fields = [foreign_key.name]
+        now = timezone.now()
+        objs, previous = [], []
+        for instance, related in pairs:
+            for obj in related:
+                previous.append(getattr(obj, foreign_key.attname))
+                setattr(obj, foreign_key.name, instance)
+                if hasattr(obj, "row_version"):
+                    obj.row_version = now
+                    fields = [foreign_key.name, "row_version"]
+                objs.append(obj)
+        related_model._default_manager.bulk_update(objs, fields)
+        fragment_cache.invalidate(related_model, [obj.pk for obj in objs])
+        search_documents.update_related(related_model, [obj.pk for obj in objs])
+        fragment_cache.invalidate(foreign_key.related_model, previous)
 
 
 class HyperlinkedModelSerializer(HyperlinkedModelSerializer):
@@ -28,6 +153,23 @@ class HyperlinkedModelSerializer(HyperlinkedModelSerializer):
         fields = "__all__"
         #: mark these fields as read-only
         read_only_fields = ("last_mod_user_name", "last_mod_date")
+        #: look up cached renderings a page at a time
+        list_serializer_class = ModelListSerializer
+
+    def get_field_names(self, declared_fields, info):
+        """
+        `row_version` is for HTTP validators, not a resource attribute.
+        """
+        return [name for name in super().get_field_names(declared_fields, info) if name != "row_version"]
+
+    def to_representation(self, instance):
+        """
+        Use the cached representation if there is one. See :py:class:`myapp.fragments.FragmentCache`.
+        """
+        _, fragment = fragment_cache.lookup(self, instance)
+        if fragment is not None:
+            return fragment["resource"]
+        return super().to_representation(instance)
 
     def _last_mod(self, validated_data):
         """
@@ -0,0 +1,189 @@
+import io
+import json
+import os
+import tempfile
+import uuid
+from unittest.mock import patch
+
+from django.core.management import CommandError, call_command
+from django.db import connection
+from django.test import TestCase
+from django.test.utils import CaptureQueriesContext
+
+from myapp.fixture_loader import FixtureLoader, FixtureLoaderMixIn
+from myapp.index_advisor import IndexAdvisor
+from myapp.management.commands import import_catalog
+from myapp.management.commands.import_catalog import iter_json_array
+from myapp.management.commands.index_advisor import Command
+from myapp.models import Course, CourseTerm, Instructor, SearchDocument
+from myapp.search import search_documents
+
+
+def ods_course(course, title="ROME BEYOND ROME", term="20181"):
+    return {"Course": course, "Term": term, "BulletinFlags": "CEFKGRUXI", "DepartmentCode": "AHIS",
+            "CallNumber": "61044", "CourseTitle": title, "CourseSubtitle": title.lower()}
+
+
+class ImportCatalogTestCase(TestCase):
+
+    def import_catalog(self, items, **options):
+        fd, path = tempfile.mkstemp(suffix=".json")
+        self.addCleanup(os.remove, path)
+        with os.fdopen(fd, "w") as fp:
+            json.dump(items, fp)
+        out = io.StringIO()
+        call_command("import_catalog", path, stdout=out, stderr=io.StringIO(), **options)
+        return out.getvalue()
+
+    def test_iter_json_array(self):
+        items = [ods_course("AHIS2321W001"), 12345, [1, "]"], None, {"s": "é, [x]"}]
+        document = json.dumps(items, indent=2)
+        for chunk_size in (1, 7, 1 << 16):
+            self.assertEqual(list(iter_json_array(io.StringIO(document), chunk_size=chunk_size)), items)
+        self.assertEqual(list(iter_json_array(io.StringIO("[]"))), [])
+        with self.assertRaises(ValueError):
+            list(iter_json_array(io.StringIO('{"not": "an array"}')))
+
+    def test_import_catalog(self):
+        items = [
+            ods_course("AHIS2321W001"),
+            ods_course("AHIS2321W002"),  # another section of the same course
+            ods_course("COMS1002W001", title="COMPUTING IN CONTEXT"),
+            ods_course("bad"),  # fails the course_identifier validators
+            {"Course": "ACCT8122B001"},  # missing attributes
+        ]
+        out = self.import_catalog(items, batch_size=2)
+        self.assertIn("2 courses and 2 course terms upserted, 2 skipped", out)
+        self.assertIn("rows/sec", out)
+        course = Course.objects.get(course_identifier="AHIS2321W")
+        self.assertEqual(course.last_mod_user_name, "loader")
+        self.assertEqual(list(course.course_terms.values_list("term_identifier", flat=True)), ["20181AHIS2321W"])
+        # upserting again updates the rows in place
+        self.import_catalog([ods_course("AHIS2321W001", title="RENAMED"), ods_course("AHIS2321W001", term="20183")])
+        self.assertEqual(Course.objects.filter(course_identifier="AHIS2321W").count(), 1)
+        course = Course.objects.get(course_identifier="AHIS2321W")
+        self.assertEqual(course.course_name, "RENAMED")
+        self.assertEqual(CourseTerm.objects.get(term_identifier="20181AHIS2321W").course_id, course.id)
+
+    def test_upsert_features(self):
+        """
+        MySQL's upsert has no conflict target and a database without one is refused
+        """
+        command = import_catalog.Command()
+        command.features = connection.features
+        with patch.object(connection.features, "supports_update_conflicts_with_target", False):
+            self.assertEqual(command.conflicts("course_identifier"), {"update_conflicts": True})
+        with patch.object(connection.features, "supports_update_conflicts", False):
+            with self.assertRaisesMessage(CommandError, "doesn't support upserts"):
+                self.import_catalog([ods_course("AHIS2321W001")])
+
+
+def table_rows():
+    rows = {model: list(model.objects.order_by("pk").values_list()) for model in (Course, CourseTerm, Instructor)}
+    # the ManyToMany rows' ids don't matter
+    rows["course_terms"] = sorted(Instructor.course_terms.through.objects.values_list("instructor", "courseterm"))
+    return rows
+
+
+class FixtureLoaderTestCase(FixtureLoaderMixIn, TestCase):
+    bulk_fixtures = ("testcases",)
+
+    def test_same_as_loaddata(self):
+        """
+        test myapp.fixture_loader.FixtureLoader: the same rows as loaddata, auto_now fields included.
+        """
+        loaded = table_rows()
+        self.assertEqual(len(loaded[Course]), 10)
+        self.assertEqual(len(loaded["course_terms"]), 5)
+        self.assertIsNone(Course.objects.first().row_version)
+        call_command("loaddata", "testcases", verbosity=0)
+        self.assertEqual(table_rows(), loaded)
+        # loading again replaces the rows
+        out = io.StringIO()
+        call_command("load_fixtures", "testcases", stdout=out)
+        self.assertIn("Installed 42 object(s) from 1 fixture(s)", out.getvalue())
+        self.assertEqual(table_rows(), loaded)
+
+    def test_snapshot(self):
+        """
+        test myapp.fixture_loader.FixtureLoader: the rows are restored from a SQLite snapshot.
+        """
+        loaded = table_rows()
+        with tempfile.TemporaryDirectory() as snapshot_dir:
+            loader = FixtureLoader(snapshot_dir=snapshot_dir)
+            loader.load("testcases")
+            self.assertEqual(len(os.listdir(snapshot_dir)), 1)
+            Instructor.course_terms.through.objects.all().delete()
+            Course.objects.all().delete()
+            self.assertEqual(loader.load("testcases"), 42 + 5)
+            self.assertEqual(table_rows(), loaded)
+
+
+class RebuildSearchDocumentsTestCase(FixtureLoaderMixIn, TestCase):
+    bulk_fixtures = ("testcases",)
+
+    def test_rebuild_search_documents(self):
+        """
+        test the bulk loaders' search documents are the same as a rebuild's.
+        """
+        documents = set(SearchDocument.objects.values_list("resource_model", "object_id", "document"))
+        self.assertIn("myapp.Instructor", {resource_model for resource_model, _, _ in documents})
+        out = io.StringIO()
+        call_command("rebuild_search_documents", stdout=out)
+        self.assertIn("Rebuilt {} search document(s)".format(len(documents)), out.getvalue())
+        self.assertEqual(set(SearchDocument.objects.values_list("resource_model", "object_id", "document")),
+                         documents)
+
+    def test_refresh_upserts(self):
+        """
+        test myapp.search.SearchDocuments.refresh upserts the documents and only deletes those of instances
+        that no longer exist, or deletes and recreates them where the database has no upserts.
+        """
+        documents = set(SearchDocument.objects.values_list("resource_model", "object_id", "document"))
+        pks = list(Instructor.objects.values_list("pk", flat=True))
+        gone = uuid.uuid4()
+        for supports_update_conflicts in (True, False):
+            SearchDocument.objects.filter(object_id=pks[0]).update(document="stale")
+            SearchDocument.objects.create(resource_model="myapp.Instructor", object_id=gone, document="gone")
+            with patch.object(connection.features, "supports_update_conflicts", supports_update_conflicts):
+                with CaptureQueriesContext(connection) as ctx:
+                    search_documents.refresh(Instructor, pks + [gone])
+            deletes = [q for q in ctx.captured_queries if q["sql"].startswith("DELETE")]
+            self.assertEqual(len(deletes), 1 if supports_update_conflicts else 2)
+            self.assertIn(gone.hex, deletes[0]["sql"])
+            self.assertNotIn(pks[0].hex, deletes[0]["sql"])
+            self.assertEqual(set(SearchDocument.objects.values_list("resource_model", "object_id", "document")),
+                             documents)
+
+
+class IndexAdvisorTestCase(TestCase):
+
+    def test_no_missing_indexes(self):
+        out = io.StringIO()
+        call_command("index_advisor", dry_run=True, stdout=out)
+        self.assertIn("ok myapp_course(subject_area_code, course_number)", out.getvalue())
+        self.assertIn("courses sort=subject_area_code: ", out.getvalue())
+        self.assertIn("No missing indexes.", out.getvalue())
+
+    def test_advise(self):
+        """
+        test myapp.index_advisor.IndexAdvisor: composite, case-insensitive and already covered indexes.
+        """
+        class ViewSet(object):
+            queryset = Course.objects.all()
+            filterset_fields = {"last_mod_user_name": ["exact", "iexact", "icontains"],
+                                "course_terms__course__course_number": ["gt"]}
+            ordering_fields = ["last_mod_user_name"]
+
+        advisor = IndexAdvisor([ViewSet])
+        needed, missing = advisor.advise()
+        self.assertEqual([str(r) for r in missing], ["myapp_course(last_mod_user_name, course_number)",
+                                                     "myapp_course(UPPER(last_mod_user_name))"])
+        self.assertEqual([str(r) for r in needed if r not in missing], ["myapp_course(course_number)"])
+        self.assertEqual(advisor.unindexable, [("courses", "filter[last_mod_user_name.icontains]",
+                                                "icontains can't use a b-tree index")])
+        self.assertEqual([parameter for _, parameter, _, _ in advisor.explain(missing[0])],
+                         ["filter[last_mod_user_name]", "sort=last_mod_user_name"])
+        operations = Command().migration("test", missing).operations
+        self.assertEqual([operation.index.name for operation in operations],
+                         [requirement.index().name for requirement in missing])
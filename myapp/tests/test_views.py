@@ -1,13 +1,23 @@
+import gzip
 import json
 import math
-from datetime import datetime, timedelta, timezone
+import uuid
+from datetime import date, datetime, timedelta, timezone
 from unittest import expectedFailure, skip
+from unittest.mock import patch
 
 from django.contrib.auth.models import Permission, User
+from django.core.cache import cache
+from django.db import connection
+from django.test.utils import CaptureQueriesContext
 from rest_framework.reverse import reverse
 from rest_framework.test import APITestCase
+from rest_framework_json_api.serializers import HyperlinkedModelSerializer
 
-from myapp.models import Course, CourseTerm
+from myapp.filters import effective_on
+from myapp.fragments import fragment_cache
+from myapp.models import Course, CourseTerm, Instructor, Person
+from myapp.pagination import JsonApiCountingPageNumberPagination
 from oauth import models as oauth_models
 
 HEADERS = {
@@ -228,6 +238,87 @@ class DJATestCase(APITestCase):
             'http://testserver/v1/courses/?page%5Bnumber%5D=3&page%5Bsize%5D=3'
         )
 
+    def test_page_count_strategy(self):
+        """
+        test myapp.pagination.JsonApiCountingPageNumberPagination: meta.pagination.count_strategy
+        """
+        cache.clear()
+        unfiltered = {"filter[effective_on]": "all"}
+        response = self.client.get(self.courses_url, data=unfiltered, **HEADERS)
+        pagination = response.json()['meta']['pagination']
+        self.assertEqual(pagination['count_strategy'], 'exact')
+        self.assertEqual(pagination['count'], len(self.courses))
+        # filtered counts are cached, with the filter parameters normalized
+        data = {"filter[subject_area_code.in]": "ANTB,BIOB", "filter[search]": "seminar "}
+        response = self.client.get(self.courses_url, data=data, **HEADERS)
+        pagination = response.json()['meta']['pagination']
+        self.assertEqual(pagination['count_strategy'], 'exact')
+        count = pagination['count']
+        data["filter[search]"] = "seminar"
+        data["page[size]"] = 2
+        with CaptureQueriesContext(connection) as ctx:
+            response = self.client.get(self.courses_url, data=data, **HEADERS)
+        pagination = response.json()['meta']['pagination']
+        self.assertEqual(pagination['count_strategy'], 'cached')
+        self.assertEqual(pagination['count'], count)
+        self.assertFalse([q for q in ctx.captured_queries if 'COUNT(' in q['sql']], msg="unexpected COUNT query")
+        # large unfiltered tables use the planner's estimate
+        with patch.object(JsonApiCountingPageNumberPagination, 'get_estimated_count', return_value=250000):
+            with CaptureQueriesContext(connection) as ctx:
+                response = self.client.get(self.courses_url, data=unfiltered, **HEADERS)
+        pagination = response.json()['meta']['pagination']
+        self.assertEqual(pagination['count_strategy'], 'estimated')
+        self.assertEqual(pagination['count'], 250000)
+        self.assertFalse([q for q in ctx.captured_queries if 'COUNT(' in q['sql']], msg="unexpected COUNT query")
+
+    def test_page_cursor(self):
+        """
+        test myapp.pagination.JsonApiPageNumberOrCursorPagination: page[cursor] and page[size]
+        """
+        ids = []
+        url = self.course_terms_url
+        data = {"page[cursor]": "", "page[size]": 4}
+        while url:
+            with CaptureQueriesContext(connection) as ctx:
+                response = self.client.get(url, data=data, **HEADERS)
+            self.assertEqual(response.status_code, 200, msg=response.content)
+            self.assertFalse([q for q in ctx.captured_queries if 'COUNT(' in q['sql']], msg="unexpected COUNT query")
+            j = response.json()
+            self.assertLessEqual(len(j['data']), 4)
+            self.assertNotIn('pagination', j.get('meta', {}))
+            ids += [t['id'] for t in j['data']]
+            url = j['links']['next']
+            data = {}
+        self.assertEqual(ids, [str(t.id) for t in self.course_terms.order_by('term_identifier')])
+        # go back from the last page
+        response = self.client.get(j['links']['prev'], **HEADERS)
+        self.assertEqual(response.status_code, 200, msg=response.content)
+        self.assertEqual([t['id'] for t in response.json()['data']], ids[-len(j['data']) - 4:-len(j['data'])])
+
+    def test_page_cursor_sort(self):
+        """
+        test that cursor pagination follows ?sort
+        """
+        response = self.client.get(self.courses_url,
+                                   data={"page[cursor]": "", "page[size]": 3, "sort": "-course_identifier"},
+                                   **HEADERS)
+        self.assertEqual(response.status_code, 200, msg=response.content)
+        j = response.json()
+        response = self.client.get(j['links']['next'], **HEADERS)
+        identifiers = [c['attributes']['course_identifier'] for c in j['data'] + response.json()['data']]
+        self.assertEqual(identifiers, [c.course_identifier for c in self.courses.order_by('-course_identifier')[:6]])
+
+    def test_page_cursor_not_queryset(self):
+        """
+        test that a list that isn't a QuerySet is paginated by page number even with page[cursor]
+        """
+        response = self.client.get(reverse('nonmodel-list'), data={"page[cursor]": "", "page[size]": 5},
+                                   **HEADERS)
+        self.assertEqual(response.status_code, 200, msg=response.content)
+        j = response.json()
+        self.assertEqual(len(j['data']), 5)
+        self.assertEqual(j['meta']['pagination']['count'], 100)
+
     def test_filter_search(self):
         """
         test keyword search (rest_framework.filters.SearchFilter): filter[all]=keywords
@@ -253,6 +344,140 @@ class DJATestCase(APITestCase):
         j = json.loads(response.content)
         self.assertEqual(len(j['data']), 0)
 
+    def test_full_text_search(self):
+        """
+        test myapp.search.FullTextSearchFilter: filter[search] uses the full-text index, ordered by relevance.
+        """
+        with CaptureQueriesContext(connection) as ctx:
+            response = self.client.get(self.courses_url, data={"filter[search]": "semi resea"}, **HEADERS)
+        self.assertEqual(response.status_code, 200, msg=response.content)
+        self.assertIn('MATCH', ' '.join(q['sql'] for q in ctx.captured_queries))
+        self.assertNotIn('LIKE', ' '.join(q['sql'] for q in ctx.captured_queries))
+        names = [c['attributes']['course_name'].lower() for c in response.json()['data']]
+        self.assertGreater(len(names), 0)
+        self.assertTrue(all('semi' in n and 'resea' in n for n in names))
+        # a new or changed course is indexed as it's written
+        response = self.client.post(self.courses_url, data=json.dumps(COURSE_POST), **HEADERS)
+        self.assertEqual(response.status_code, 201, msg=response.content)
+        course_id = response.json()['data']['id']
+        response = self.client.get(self.courses_url, data={"filter[search]": "rome beyond"}, **HEADERS)
+        self.assertEqual([c['id'] for c in response.json()['data']], [course_id])
+        Course.objects.filter(pk=course_id).update(course_name='Rome Beyond Rome Beyond Rome')
+        response = self.client.get(self.courses_url, data={"filter[search]": "rome"}, **HEADERS)
+        self.assertEqual(response.json()['data'][0]['id'], course_id)
+        Course.objects.filter(pk=course_id).update(course_name='Elsewhere', course_description='Elsewhere')
+        response = self.client.get(self.courses_url, data={"filter[search]": "rome"}, **HEADERS)
+        self.assertEqual(response.json()['data'], [])
+        # an explicit sort replaces relevance
+        response = self.client.get(self.courses_url, data={"filter[search]": "seminar", "sort": "-course_name"},
+                                   **HEADERS)
+        names = [c['attributes']['course_name'] for c in response.json()['data']]
+        self.assertGreater(len(names), 1)
+        self.assertEqual(names, sorted(names, reverse=True))
+
+    def test_search_documents(self):
+        """
+        test myapp.search.SearchDocuments: filter[search] of people and instructors matches their search
+        documents rather than joining courses, and the documents follow changes to what they were built from.
+        """
+        people_url, instructors_url = reverse('person-list'), reverse('instructor-list')
+        instructor = Instructor.objects.get(person__name="John Jay")
+        course = instructor.course_terms.first().course
+
+        def search(url, terms):
+            response = self.client.get(url, data={"filter[search]": terms}, **HEADERS)
+            self.assertEqual(response.status_code, 200, msg=response.content)
+            return [r['id'] for r in response.json()['data']]
+
+        with CaptureQueriesContext(connection) as ctx:
+            self.assertEqual(search(people_url, "jay"), [str(instructor.person_id)])
+        sql = ' '.join(q['sql'] for q in ctx.captured_queries)
+        self.assertIn('MATCH', sql)
+        self.assertNotIn('DISTINCT', sql)
+        # renaming the course is seen by the people and instructors who teach it
+        course.course_name = "Zymurgy"
+        course.save()
+        self.assertEqual(search(people_url, "zymurgy"), [str(instructor.person_id)])
+        self.assertEqual(search(instructors_url, "zymurgy jay"), [str(instructor.id)])
+        # as is unlinking their course terms
+        instructor.course_terms.clear()
+        self.assertEqual(search(people_url, "zymurgy"), [])
+        self.assertEqual(search(instructors_url, "zymurgy"), [])
+        # and renaming and deleting the person
+        instructor.person.name = "Johannes Jay"
+        instructor.person.save()
+        self.assertEqual(search(instructors_url, "johannes"), [str(instructor.id)])
+        instructor.person.delete()
+        self.assertEqual(search(people_url, "johannes"), [])
+        self.assertEqual(search(instructors_url, "johannes"), [])
+
+    def test_case_insensitive_filters(self):
+        """
+        test myapp.lookups.UpperIExact: iexact filters compare UPPER() so they can use the Upper() indexes.
+        """
+        instructor = Instructor.objects.get(person__name="John Jay")
+        course = instructor.course_terms.first().course
+        instructors_url = reverse('instructor-list')
+        for url, data, expected in (
+                (self.courses_url, {"filter[course_name.iexact]": course.course_name.lower()}, str(course.id)),
+                (instructors_url, {"filter[course_name]": course.course_name.swapcase()}, str(instructor.id)),
+                (instructors_url, {"filter[name]": "JOHN JAY"}, str(instructor.id))):
+            with CaptureQueriesContext(connection) as ctx:
+                response = self.client.get(url, data=data, **HEADERS)
+            self.assertEqual(response.status_code, 200, msg=response.content)
+            self.assertIn(expected, [r['id'] for r in response.json()['data']])
+            self.assertIn('UPPER(', ' '.join(q['sql'] for q in ctx.captured_queries))
+        # the value isn't a LIKE pattern
+        response = self.client.get(instructors_url, data={"filter[name]": "john_jay"}, **HEADERS)
+        self.assertEqual(response.json()['data'], [])
+        if connection.vendor == 'sqlite':
+            plan = Course.objects.filter(course_name__iexact=course.course_name).explain()
+            self.assertIn('USING INDEX myapp_cours_course__19ffd3_ci', plan)
+
+    def test_filter_effective_on(self):
+        """
+        test myapp.filters.EffectiveOnFilter: filter[effective_on]=<date>|today on every CommonModel resource
+        """
+        ended, future, current = self.courses[:3]
+        Course.objects.filter(pk=ended.pk).update(effective_start_date=date(2015, 1, 1),
+                                                  effective_end_date=date(2020, 1, 1))
+        Course.objects.filter(pk=future.pk).update(effective_start_date=date(2100, 1, 1))
+        Course.objects.filter(pk=current.pk).update(effective_start_date=date(2020, 1, 1))
+        for value, included, excluded in (("today", (current,), (ended, future)),
+                                          ("2019-06-01", (ended,), (current, future)),
+                                          ("2020-01-01", (current,), (ended, future))):
+            response = self.client.get(self.courses_url, data={"filter[effective_on]": value, "page[size]": 100},
+                                       **HEADERS)
+            self.assertEqual(response.status_code, 200, msg=response.content)
+            ids = [r['id'] for r in response.json()['data']]
+            for course in included:
+                self.assertIn(str(course.id), ids, msg=value)
+            for course in excluded:
+                self.assertNotIn(str(course.id), ids, msg=value)
+        # a list defaults to today's rows; all is all of them; other actions find any row.
+        ids = [r['id'] for r in self.client.get(self.courses_url, data={"page[size]": 100}, **HEADERS).json()['data']]
+        self.assertIn(str(current.id), ids)
+        self.assertNotIn(str(ended.id), ids)
+        response = self.client.get(self.courses_url, data={"filter[effective_on]": "all", "page[size]": 100},
+                                   **HEADERS)
+        self.assertIn(str(ended.id), [r['id'] for r in response.json()['data']])
+        response = self.client.get(self.courses_url + "{}/".format(ended.id), **HEADERS)
+        self.assertEqual(response.status_code, 200)
+        # viewsets with a filterset_class and with no filterset_fields get it too.
+        person = Person.objects.create(name="Former Person", effective_end_date=date(2001, 1, 1))
+        for url in (reverse('instructor-list'), reverse('person-list')):
+            response = self.client.get(url, data={"filter[effective_on]": "today"}, **HEADERS)
+            self.assertEqual(response.status_code, 200, msg=response.content)
+            self.assertNotIn(str(person.id), [r['id'] for r in response.json()['data']])
+        response = self.client.get(self.courses_url, data={"filter[effective_on]": "someday"}, **HEADERS)
+        self.assertEqual(response.status_code, 400, msg=response.content)
+        if connection.vendor == 'sqlite':
+            Course.objects.update(effective_start_date=date(2015, 1, 1), effective_end_date=date(2020, 1, 1))
+            with connection.cursor() as cursor:
+                cursor.execute("ANALYZE")
+            plan = Course.objects.filter(effective_on(date.today())).order_by().explain()
+            self.assertIn('USING INDEX myapp_course_effective', plan)
+
     def test_filter_fields(self):
         """
         test field search (django_filters.rest_framework.DjangoFilterBackend): filter[<field>]=values
@@ -322,6 +547,29 @@ class DJATestCase(APITestCase):
         self.assertIn('course_name', j['data']['attributes'])
         self.assertIn('course_description', j['data']['attributes'])
 
+    def test_sparse_fieldsets_columns(self):
+        """
+        test that sparse fieldsets only select the needed columns, including for included resources
+        """
+        with CaptureQueriesContext(connection) as ctx:
+            response = self.client.get(self.courses_url,
+                                       data={"fields[courses]": "course_name,course_terms",
+                                             "fields[course_terms]": "term_identifier,course",
+                                             "include": "course_terms"},
+                                       **HEADERS)
+        self.assertEqual(response.status_code, 200, msg=response.content)
+        j = response.json()
+        self.assertEqual(set(j['data'][0]['attributes']), {'course_name'})
+        self.assertIn('course_terms', j['data'][0]['relationships'])
+        self.assertEqual(set(j['included'][0]['attributes']), {'term_identifier'})
+        self.assertIn(j['included'][0]['relationships']['course']['data']['id'], [c['id'] for c in j['data']])
+        # deferred columns must not be lazily loaded per row
+        self.assertLessEqual(len(ctx.captured_queries), 5)
+        sql = " ".join(q['sql'] for q in ctx.captured_queries)
+        self.assertIn('"myapp_course"."course_name"', sql)
+        self.assertNotIn('"myapp_course"."course_description"', sql)
+        self.assertNotIn('"myapp_courseterm"."audit_permitted_code"', sql)
+
     def test_sort(self):
         """
         test sort
@@ -369,6 +617,440 @@ class DJATestCase(APITestCase):
         for i in j['included']:
             self.assertIn(i['relationships']['course']['data']['id'], kids)
 
+    def _count_queries(self, url, data):
+        """
+        Return the number of SQL queries done to GET the url.
+        """
+        with CaptureQueriesContext(connection) as ctx:
+            response = self.client.get(url, data=data, **HEADERS)
+        self.assertEqual(response.status_code, 200, msg=response.content)
+        return len(ctx.captured_queries)
+
+    def test_include_query_count(self):
+        """
+        Resource linkage and included resources must not cost a query per row (N+1).
+        The expected counts are: token lookup, validators, page count, primary data and then one per relationship.
+        """
+        for url, include, expected in ((self.courses_url, "course_terms.instructors.person", 8),
+                                       (self.courses_url, None, 5),
+                                       (self.course_terms_url, "course,instructors", 8),
+                                       (self.course_terms_url, None, 5),
+                                       (reverse('instructor-list'), "person,course_terms.course", 8),
+                                       (reverse('person-list'), "instructor", 5)):
+            data = {"include": include} if include else {}
+            self.assertLessEqual(self._count_queries(url, data), expected, msg="{}?include={}".format(url, include))
+
+    def test_conditional_get(self):
+        """
+        test myapp.views.ConditionalGetMixIn: ETag/Last-Modified and 304 Not Modified for list, detail,
+        related and relationship GETs.
+        """
+        course = next(c for c in self.courses if c.course_terms.count() > 1)
+        term = course.course_terms.first()
+        for url in (self.courses_url,
+                    self.courses_url + "{}/".format(course.id),
+                    self.courses_url + "{}/course_terms/".format(course.id),
+                    self.courses_url + "{}/relationships/course_terms/".format(course.id)):
+            with CaptureQueriesContext(connection) as fetched:
+                response = self.client.get(url, **HEADERS)
+            self.assertEqual(response.status_code, 200, msg=url)
+            etag = response['ETag']
+            self.assertTrue(etag.startswith('"'), msg=url)
+            # 304 without serializing: no more queries than fetching the page.
+            with CaptureQueriesContext(connection) as ctx:
+                response = self.client.get(url, HTTP_IF_NONE_MATCH=etag, **HEADERS)
+            self.assertEqual(response.status_code, 304, msg=url)
+            self.assertEqual(response['ETag'], etag)
+            self.assertEqual(response.content, b'')
+            self.assertLessEqual(len(ctx.captured_queries), len(fetched.captured_queries), msg=url)
+            self.assertFalse([q for q in ctx.captured_queries if 'MAX(' in q['sql']], msg=url)
+            # a different query is a different representation
+            response = self.client.get(url, data={"page[size]": 1}, HTTP_IF_NONE_MATCH=etag, **HEADERS)
+            self.assertEqual(response.status_code, 200, msg=url)
+        included = {"include": "course_terms"}
+        etag = self.client.get(self.courses_url, data=included, **HEADERS)['ETag']
+        # changing an included resource changes the validators
+        response = self.client.patch(
+            self.course_terms_url + "{}/".format(term.id),
+            data=json.dumps({"data": {"type": "course_terms", "id": str(term.id),
+                                      "attributes": {"audit_permitted_code": 1}}}),
+            **HEADERS)
+        self.assertEqual(response.status_code, 200, msg=response.content)
+        response = self.client.get(self.courses_url, data=included, HTTP_IF_NONE_MATCH=etag, **HEADERS)
+        self.assertEqual(response.status_code, 200)
+        response = self.client.get(self.courses_url, data=included,
+                                   HTTP_IF_MODIFIED_SINCE=response['Last-Modified'], **HEADERS)
+        self.assertEqual(response.status_code, 304)
+        # changing the relationship changes its validator
+        url = self.courses_url + "{}/relationships/course_terms/".format(course.id)
+        etag = self.client.get(url, **HEADERS)['ETag']
+        response = self.client.patch(url, data=json.dumps({"data": [{"type": "course_terms", "id": str(term.id)}]}),
+                                     **HEADERS)
+        self.assertEqual(response.status_code, 200, msg=response.content)
+        response = self.client.get(url, HTTP_IF_NONE_MATCH=etag, **HEADERS)
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(len(response.json()['data']), 1)
+        # not found is still not found
+        response = self.client.get(self.courses_url + "00000000-0000-0000-0000-000000000000/",
+                                   HTTP_IF_NONE_MATCH=etag, **HEADERS)
+        self.assertEqual(response.status_code, 404)
+        response = self.client.get(self.courses_url + "not-a-uuid/", **HEADERS)
+        self.assertEqual(response.status_code, 404)
+        # adding a ManyToMany link changes neither side's row_version but does change the validators,
+        instructor = Instructor.objects.get(person__name="John Jay")
+        url = reverse('instructor-list') + "{}/".format(instructor.id)
+        etag = self.client.get(url, **HEADERS)['ETag']
+        other = CourseTerm.objects.exclude(instructors=instructor).first()
+        response = self.client.post(url + "relationships/course_terms/",
+                                    data=json.dumps({"data": [{"type": "course_terms", "id": str(other.id)}]}),
+                                    **HEADERS)
+        self.assertIn(response.status_code, (200, 204), msg=response.content)
+        response = self.client.get(url, HTTP_IF_NONE_MATCH=etag, **HEADERS)
+        self.assertEqual(response.status_code, 200)
+        # as does a bulk update of an included row,
+        etag = self.client.get(url, data=included, **HEADERS)['ETag']
+        CourseTerm.objects.filter(pk=other.pk).update(audit_permitted_code=2)
+        response = self.client.get(url, data=included, HTTP_IF_NONE_MATCH=etag, **HEADERS)
+        self.assertEqual(response.status_code, 200)
+        # but not a change to a row that is only linked, whose linkage is the same,
+        etag = self.client.get(url, **HEADERS)['ETag']
+        CourseTerm.objects.filter(pk=other.pk).update(audit_permitted_code=3)
+        response = self.client.get(url, HTTP_IF_NONE_MATCH=etag, **HEADERS)
+        self.assertEqual(response.status_code, 304)
+        # nor to a row that isn't linked.
+        etag = self.client.get(url, data=included, **HEADERS)['ETag']
+        unlinked = CourseTerm.objects.exclude(instructors=instructor).first()
+        CourseTerm.objects.filter(pk=unlinked.pk).update(audit_permitted_code=2)
+        response = self.client.get(url, data=included, HTTP_IF_NONE_MATCH=etag, **HEADERS)
+        self.assertEqual(response.status_code, 304)
+
+    def _backend_headers(self):
+        """
+        Headers for a backend (client credentials) client: no user.
+        """
+        oauth_models.MyAccessToken(  # nosec B106
+            token='BackendToken',
+            expires=datetime.isoformat(datetime.now(tz=timezone.utc)+timedelta(seconds=3600)),
+            scope='auth-none demo-djt-sla-bronze read',
+        ).save()
+        return {**HEADERS, 'Authorization': 'Bearer BackendToken'}
+
+    def test_stream(self):
+        """
+        test myapp.views.StreamingListMixIn: `page[size]=all` streams the whole collection to backend clients.
+        """
+        backend = self._backend_headers()
+        data = {"page[size]": "all", "sort": "term_identifier", "fields[course_terms]": "term_identifier,course"}
+        with patch('myapp.views.StreamingListMixIn.stream_chunk_size', 4):
+            with CaptureQueriesContext(connection) as ctx:
+                response = self.client.get(self.course_terms_url, data=data, **backend)
+                self.assertEqual(response.status_code, 200)
+                self.assertTrue(response.streaming)
+                document = json.loads(b"".join(response.streaming_content))
+        count = self.course_terms.count()
+        self.assertGreater(count, 4)
+        # a query per chunk of 4 plus the prefetch of each chunk's instructors linkage.
+        chunks = math.ceil(count / 4)
+        self.assertLessEqual(len(ctx.captured_queries), 2 + 2 * chunks)
+        self.assertEqual(document['meta'], {'count': count})
+        self.assertEqual(len(document['data']), count)
+        self.assertEqual([r['attributes']['term_identifier'] for r in document['data']],
+                         sorted(self.course_terms.values_list('term_identifier', flat=True)))
+        # the same resource objects as a page
+        page = self.client.get(self.course_terms_url, data={**data, "page[size]": count}, **backend).json()
+        self.assertEqual(document['data'], page['data'])
+        # an authenticated user can't
+        response = self.client.get(self.course_terms_url, data=data, **HEADERS)
+        self.assertEqual(response.status_code, 403)
+        # include isn't supported
+        response = self.client.get(self.course_terms_url, data={**data, "include": "course"}, **backend)
+        self.assertEqual(response.status_code, 400)
+
+    def test_export(self):
+        """
+        test myapp.views.StreamingListMixIn.export: NDJSON, filtered, gzipped and resumable.
+        """
+        backend = {**self._backend_headers(), 'HTTP_ACCEPT': 'application/x-ndjson'}
+        url = reverse('courseterm-export')
+        with patch('myapp.views.StreamingListMixIn.stream_chunk_size', 4):
+            response = self.client.get(url, **backend)
+            self.assertEqual(response.status_code, 200)
+            self.assertEqual(response['Content-Type'], 'application/x-ndjson')
+            content = b"".join(response.streaming_content)
+        lines = [json.loads(line) for line in content.splitlines()]
+        self.assertEqual(len(lines), self.course_terms.count())
+        self.assertEqual({r['id'] for r in lines}, {str(pk) for pk in self.course_terms.values_list('pk', flat=True)})
+        self.assertEqual(lines[0]['type'], 'course_terms')
+        # filter[]
+        term = self.course_terms.first()
+        response = self.client.get(url, data={"filter[term_identifier]": term.term_identifier}, **backend)
+        self.assertEqual([json.loads(line)['id'] for line in b"".join(response.streaming_content).splitlines()],
+                         [str(term.id)])
+        # gzip
+        response = self.client.get(url, HTTP_ACCEPT_ENCODING='gzip, deflate', **backend)
+        self.assertEqual(response['Content-Encoding'], 'gzip')
+        self.assertEqual(gzip.decompress(b"".join(response.streaming_content)), content)
+        # resume from the watermark: only what changed since.
+
+        def patch_and_export(term, since):
+            response = self.client.patch(
+                self.course_terms_url + "{}/".format(term.id),
+                data=json.dumps({"data": {"type": "course_terms", "id": str(term.id),
+                                          "attributes": {"audit_permitted_code": 1}}}), **HEADERS)
+            self.assertEqual(response.status_code, 200, msg=response.content)
+            response = self.client.get(url, data={"page[since]": since} if since else {}, **backend)
+            return [json.loads(line) for line in b"".join(response.streaming_content).splitlines()]
+
+        first, second = self.course_terms[:2]
+        exported = patch_and_export(first, None)
+        # the changed resource is last
+        self.assertEqual(exported[-1]['id'], str(first.id))
+        watermark = exported[-1]['meta']['row_version']
+        exported = patch_and_export(second, watermark)
+        self.assertEqual([r['id'] for r in exported], [str(first.id), str(second.id)])
+        self.assertGreater(exported[-1]['meta']['row_version'], watermark)
+        response = self.client.get(url, data={"page[since]": "yesterday"}, **backend)
+        self.assertEqual(response.status_code, 400)
+        # backend clients only
+        response = self.client.get(url, **{**HEADERS, 'HTTP_ACCEPT': 'application/x-ndjson'})
+        self.assertEqual(response.status_code, 403)
+
+    def test_operations(self):
+        """
+        test myapp.views.OperationsView: the {json:api} Atomic Operations extension.
+        """
+        atomic = 'application/vnd.api+json; ext="https://jsonapi.org/ext/atomic"'
+        headers = {**HEADERS, 'HTTP_ACCEPT': atomic, 'content_type': atomic}
+        url = reverse('operations')
+        self.user1_token.scope += ' delete'
+        self.user1_token.save()
+        course = COURSE_POST['data']
+        term = COURSE_TERM_POST['data']
+        existing = self.courses[0]
+        operations = [
+            {"op": "add", "data": {**course, "lid": "c1"}},
+            {"op": "add", "data": {**term, "lid": "t1",
+                                   "relationships": {"course": {"data": {"type": "courses", "lid": "c1"}}}}},
+            {"op": "update", "data": {"type": "courses", "id": str(existing.id),
+                                      "attributes": {"course_name": "Renamed"}}},
+            {"op": "add", "ref": {"type": "instructors", "id": str(Instructor.objects.first().id),
+                                  "relationship": "course_terms"},
+             "data": [{"type": "course_terms", "lid": "t1"}]},
+        ]
+        with CaptureQueriesContext(connection) as ctx:
+            response = self.client.post(url, data=json.dumps({"atomic:operations": operations}), **headers)
+        self.assertEqual(response.status_code, 200, msg=response.content)
+        self.assertEqual(response['Content-Type'], atomic)
+        # one transaction
+        self.assertEqual(len([q for q in ctx.captured_queries if q['sql'].startswith('SAVEPOINT')]), 1)
+        results = response.json()['atomic:results']
+        self.assertEqual([list(r) for r in results], [['data'], ['data'], ['data'], []])
+        course_id, term_id = results[0]['data']['id'], results[1]['data']['id']
+        self.assertEqual(results[1]['data']['relationships']['course']['data'], {"type": "courses", "id": course_id})
+        self.assertEqual(results[2]['data']['attributes']['course_name'], 'Renamed')
+        self.assertEqual(CourseTerm.objects.get(pk=term_id).course_id, uuid.UUID(course_id))
+        self.assertTrue(Instructor.objects.first().course_terms.filter(pk=term_id).exists())
+        # consecutive adds of the same type are created with one INSERT, up to one that refers to their lids
+        operations = [
+            {"op": "add", "data": {**course, "lid": "c{}".format(i), "attributes": {
+                **course["attributes"], "course_identifier": "BULK{:04d}W".format(i), "course_number": str(i)}}}
+            for i in range(3)
+        ] + [
+            {"op": "add", "data": {**course, "attributes": {
+                **course["attributes"], "course_identifier": "BULK0003W", "course_number": "3"}}},
+        ] + [
+            {"op": "add", "data": {
+                **term, "attributes": {**term["attributes"], "term_identifier": "20301BULK{:04d}W".format(i)},
+                "relationships": {"course": {"data": {"type": "courses", "lid": lid}}}}}
+            for i, lid in enumerate(("c2", "c1", "c1"))
+        ]
+        with CaptureQueriesContext(connection) as ctx:
+            response = self.client.post(url, data=json.dumps({"atomic:operations": operations}), **headers)
+        self.assertEqual(response.status_code, 200, msg=response.content)
+        results = response.json()['atomic:results']
+        self.assertEqual([r['data']['type'] for r in results], ['courses'] * 4 + ['course_terms'] * 3)
+        self.assertEqual([r['data']['attributes']['course_identifier'] for r in results[:4]],
+                         ["BULK{:04d}W".format(i) for i in range(4)])
+        self.assertEqual(results[4]['data']['relationships']['course']['data']['id'], results[2]['data']['id'])
+        self.assertEqual(results[6]['data']['relationships']['course']['data']['id'], results[1]['data']['id'])
+        inserts = [q['sql'] for q in ctx.captured_queries if q['sql'].startswith('INSERT')]
+        self.assertEqual(len([q for q in inserts if 'myapp_course"' in q]), 1)
+        self.assertEqual(len([q for q in inserts if 'myapp_courseterm"' in q]), 1)
+        # a bulk add's errors point at its operation
+        operations = [{"op": "add", "data": {**course, "attributes": {**course["attributes"],
+                                                                      "course_identifier": "BULK0009W"}}},
+                      {"op": "add", "data": {"type": "courses", "attributes": {"course_name": "incomplete"}}}]
+        response = self.client.post(url, data=json.dumps({"atomic:operations": operations}), **headers)
+        self.assertEqual(response.status_code, 400, msg=response.content)
+        pointers = {e['source']['pointer'] for e in response.json()['errors']}
+        self.assertIn('/atomic:operations/1/data/attributes/course_identifier', pointers)
+        self.assertFalse(Course.objects.filter(course_identifier="BULK0009W").exists())
+        # any failure rolls them all back
+        operations = [
+            {"op": "remove", "ref": {"type": "course_terms", "id": term_id}},
+            {"op": "add", "data": {"type": "courses", "attributes": {"course_name": "missing required attributes"}}},
+        ]
+        response = self.client.post(url, data=json.dumps({"atomic:operations": operations}), **headers)
+        self.assertEqual(response.status_code, 400, msg=response.content)
+        pointers = {e['source']['pointer'] for e in response.json()['errors']}
+        self.assertIn('/atomic:operations/1/data/attributes/course_identifier', pointers)
+        self.assertTrue(CourseTerm.objects.filter(pk=term_id).exists())
+        # an unknown lid
+        operations = [{"op": "update", "data": {"type": "courses", "lid": "nope", "attributes": {}}}]
+        response = self.client.post(url, data=json.dumps({"atomic:operations": operations}), **headers)
+        self.assertEqual(response.status_code, 400, msg=response.content)
+        # no results
+        operations = [{"op": "remove", "ref": {"type": "course_terms", "id": term_id}}]
+        response = self.client.post(url, data=json.dumps({"atomic:operations": operations}), **headers)
+        self.assertEqual(response.status_code, 204, msg=response.content)
+        self.assertFalse(CourseTerm.objects.filter(pk=term_id).exists())
+        # each operation is authorized with its own method's scopes
+        self.user1_token.scope = self.user1_token.scope.replace(' delete', '')
+        self.user1_token.save()
+        response = self.client.post(url, data=json.dumps({"atomic:operations": operations}), **headers)
+        self.assertEqual(response.status_code, 403, msg=response.content)
+        self.assertEqual(response.json()['errors'][0]['source']['pointer'], '/atomic:operations/0/data')
+        # not the atomic extension media type
+        response = self.client.post(url, data=json.dumps({"atomic:operations": operations}),
+                                    **{**HEADERS, 'HTTP_ACCEPT': atomic})
+        self.assertEqual(response.status_code, 415)
+        response = self.client.post(url, data=json.dumps({"atomic:operations": operations}), **HEADERS)
+        self.assertEqual(response.status_code, 406)
+
+    def test_bulk_create(self):
+        """
+        test myapp.views.BulkCreateMixIn: POST a list of resource objects, created in bulk in one transaction.
+        """
+        def courses(n, start=0):
+            return [{**COURSE_POST['data'], "attributes": {
+                **COURSE_POST['data']['attributes'], "course_identifier": "BULK{:04d}X".format(i)}}
+                for i in range(start, start + n)]
+
+        existing_term = CourseTerm.objects.filter(course__isnull=False).first()
+        old_course = existing_term.course
+        data = courses(3)
+        data[0] = {**data[0], "relationships": {
+            "course_terms": {"data": [{"type": "course_terms", "id": str(existing_term.id)}]}}}
+        with CaptureQueriesContext(connection) as ctx:
+            response = self.client.post(self.courses_url, data=json.dumps({"data": data}), **HEADERS)
+        self.assertEqual(response.status_code, 201, msg=response.content)
+        created = response.json()['data']
+        self.assertEqual([c['attributes']['course_identifier'] for c in created],
+                         ['BULK0000X', 'BULK0001X', 'BULK0002X'])
+        self.assertEqual(created[0]['relationships']['course_terms']['data'],
+                         [{"type": "course_terms", "id": str(existing_term.id)}])
+        self.assertEqual(CourseTerm.objects.get(pk=existing_term.id).course_id, uuid.UUID(created[0]['id']))
+        self.assertFalse(old_course.course_terms.filter(pk=existing_term.id).exists())
+        # last_mod_user_name is still overridden
+        self.assertEqual(set(Course.objects.filter(course_identifier__startswith='BULK').values_list(
+            'last_mod_user_name', flat=True)), {'user1'})
+        # the number of queries doesn't grow with the number of resources
+        queries = len(ctx.captured_queries)
+        with CaptureQueriesContext(connection) as ctx:
+            response = self.client.post(self.courses_url, data=json.dumps({"data": courses(9, 3)}), **HEADERS)
+        self.assertEqual(response.status_code, 201, msg=response.content)
+        self.assertLessEqual(len(ctx.captured_queries), queries)
+        # toMany: reverse ManyToMany
+        instructor = Instructor.objects.first()
+        term = {**COURSE_TERM_POST['data'], "relationships": {
+            "course": {"data": {"type": "courses", "id": created[1]['id']}},
+            "instructors": {"data": [{"type": "instructors", "id": str(instructor.id)}]}}}
+        data = [{**term, "attributes": {**term['attributes'], "term_identifier": "20181BULK000{}X".format(i)}}
+                for i in range(2)]
+        response = self.client.post(self.course_terms_url, data=json.dumps({"data": data}), **HEADERS)
+        self.assertEqual(response.status_code, 201, msg=response.content)
+        self.assertEqual(instructor.course_terms.filter(term_identifier__startswith='20181BULK').count(), 2)
+        self.assertEqual(Course.objects.get(pk=created[1]['id']).course_terms.count(), 2)
+        # a validation error in any of them creates none of them
+        data = courses(2, 20)
+        data[1] = {**data[1], "attributes": {"course_name": "missing required attributes"}}
+        response = self.client.post(self.courses_url, data=json.dumps({"data": data}), **HEADERS)
+        self.assertEqual(response.status_code, 400, msg=response.content)
+        self.assertFalse(Course.objects.filter(course_identifier='BULK0020X').exists())
+        # unique fields are checked against the database and each other
+        data = courses(2, 40) + courses(1, 40) + courses(1, 0)
+        response = self.client.post(self.courses_url, data=json.dumps({"data": data}), **HEADERS)
+        self.assertEqual(response.status_code, 400, msg=response.content)
+        self.assertEqual({e['source']['pointer'] for e in response.json()['errors']},
+                         {'/data/2/attributes/course_identifier', '/data/3/attributes/course_identifier'})
+        # each resource object is still checked for its type
+        data = courses(1, 30) + [{**COURSE_TERM_POST['data']}]
+        response = self.client.post(self.courses_url, data=json.dumps({"data": data}), **HEADERS)
+        self.assertEqual(response.status_code, 409, msg=response.content)
+
+    def test_orjson(self):
+        """
+        test myapp.renderers.ORJSONRenderer and myapp.parsers.ORJSONParser: the same document as the stdlib json.
+        """
+        data = {"include": "course_terms", "page[size]": 5}
+        response = self.client.get(self.courses_url, data=data, **HEADERS)
+        self.assertEqual(response.status_code, 200)
+        # indented output falls back to the stdlib json
+        stdlib = self.client.get(self.courses_url, data=data,
+                                 **{**HEADERS, 'HTTP_ACCEPT': 'application/vnd.api+json; indent=2'})
+        self.assertEqual(stdlib.status_code, 200)
+        self.assertIn(b'\n  ', stdlib.content)
+        self.assertNotIn(b'\n', response.content)
+        self.assertEqual(json.loads(response.content), json.loads(stdlib.content))
+        response = self.client.post(self.courses_url, data='{"data": {"type": "courses",', **HEADERS)
+        self.assertEqual(response.status_code, 400)
+        self.assertIn("JSON parse error", response.json()['errors'][0]['detail'])
+        response = self.client.post(self.courses_url, data=json.dumps(COURSE_POST), **HEADERS)
+        self.assertEqual(response.status_code, 201, msg=response.content)
+
+    @patch.object(fragment_cache, 'cache_alias', 'default')
+    def test_fragment_cache(self):
+        """
+        test myapp.fragments.FragmentCache: cached resource objects are reused and invalidated when they
+        or their linkage change.
+        """
+        cache.clear()
+        to_representation = HyperlinkedModelSerializer.to_representation
+        # unfiltered, so the pagination counts are the same.
+        data = {"include": "course_terms.instructors", "filter[effective_on]": "all"}
+        first = self.client.get(self.courses_url, data=data, **HEADERS).json()
+        with patch.object(HyperlinkedModelSerializer, 'to_representation', autospec=True,
+                          side_effect=to_representation) as serialized:
+            second = self.client.get(self.courses_url, data=data, **HEADERS).json()
+            self.assertEqual(serialized.call_count, 0)
+            self.assertEqual(first, second)
+            # a different sparse fieldset is a different rendering
+            response = self.client.get(self.courses_url, data={"fields[courses]": "course_name"}, **HEADERS)
+            self.assertEqual(list(response.json()['data'][0]['attributes']), ['course_name'])
+            self.assertGreater(serialized.call_count, 0)
+        # changing an attribute
+        course = next(c for c in self.courses if c.course_terms.count() > 1)
+        url = self.courses_url + "{}/".format(course.id)
+        self.client.get(url, **HEADERS)
+        response = self.client.patch(url, data=json.dumps({"data": {"type": "courses", "id": str(course.id),
+                                                                    "attributes": {"course_name": "Renamed"}}}),
+                                     **HEADERS)
+        self.assertEqual(response.status_code, 200, msg=response.content)
+        self.assertEqual(self.client.get(url, **HEADERS).json()['data']['attributes']['course_name'], 'Renamed')
+        # changing a foreign key invalidates the old and new targets of the reverse relationship
+        term = course.course_terms.first()
+        other = next(c for c in self.courses if c.id != course.id)
+        other_url = self.courses_url + "{}/".format(other.id)
+        self.client.get(other_url, **HEADERS)
+        response = self.client.patch(
+            self.course_terms_url + "{}/relationships/course/".format(term.id),
+            data=json.dumps({"data": {"type": "courses", "id": str(other.id)}}), **HEADERS)
+        self.assertEqual(response.status_code, 200, msg=response.content)
+        linked = self.client.get(url, **HEADERS).json()['data']['relationships']['course_terms']['data']
+        self.assertNotIn(str(term.id), [r['id'] for r in linked])
+        linked = self.client.get(other_url, **HEADERS).json()['data']['relationships']['course_terms']['data']
+        self.assertIn(str(term.id), [r['id'] for r in linked])
+        # changing a many-to-many invalidates both sides
+        instructor = Instructor.objects.exclude(course_terms=term).first()
+        term_url = self.course_terms_url + "{}/".format(term.id)
+        self.client.get(term_url, **HEADERS)
+        response = self.client.post(
+            reverse('instructor-relationships', kwargs={'pk': instructor.id, 'related_field': 'course_terms'}),
+            data=json.dumps({"data": [{"type": "course_terms", "id": str(term.id)}]}), **HEADERS)
+        self.assertEqual(response.status_code, 200, msg=response.content)
+        linked = self.client.get(term_url, **HEADERS).json()['data']['relationships']['instructors']['data']
+        self.assertIn(str(instructor.id), [r['id'] for r in linked])
+
     def test_related_course_course_terms(self):
         """
         test toMany relationship and related links for courses.related.course_terms
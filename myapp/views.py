@@ -1,16 +1,47 @@
+import copy
+import hashlib
+import itertools
+import json
 import logging
 import re
-
+from datetime import datetime
+from datetime import timezone as dt_timezone
+
+import inflection
+from django.core.exceptions import FieldDoesNotExist
+from django.core.exceptions import PermissionDenied as DjangoPermissionDenied
+from django.db import transaction
+from django.db.models import F, Manager, Model, Prefetch, QuerySet
+from django.http import Http404, StreamingHttpResponse
+from django.utils import timezone
+from django.utils.cache import get_conditional_response, patch_vary_headers
+from django.utils.dateparse import parse_datetime
+from django.utils.http import http_date, quote_etag
+from django.utils.text import compress_sequence
 from django_filters import rest_framework as filters
+from drf_spectacular.types import OpenApiTypes
+from drf_spectacular.utils import OpenApiResponse, extend_schema
 # mypass my Oauth2 schema hack for the time being:
 # from myapp.schemas import MyOAuth2Auth
 from oauth2_provider.contrib.rest_framework import OAuth2Authentication as MyOAuth2Auth
 from oauth2_provider.contrib.rest_framework import TokenMatchesOASRequirements
-from rest_framework.permissions import DjangoModelPermissions, IsAuthenticated
+from rest_framework import status
+from rest_framework.decorators import action
+from rest_framework.exceptions import APIException, NotAcceptable, PermissionDenied, ValidationError
+from rest_framework.permissions import SAFE_METHODS, DjangoModelPermissions, IsAuthenticated
+from rest_framework.relations import HyperlinkedIdentityField
 from rest_framework.response import Response
+from rest_framework.views import APIView
+from rest_framework_json_api.parsers import JSONParser
+from rest_framework_json_api.relations import ResourceRelatedField
+from rest_framework_json_api.utils import (get_included_resources, get_resource_type_from_model,
+                                           get_resource_type_from_serializer, get_serializer_fields)
 from rest_framework_json_api.views import ModelViewSet, RelationshipView
 
+from myapp.filters import EffectiveDateFilterSet
 from myapp.models import Course, CourseTerm, Grade, Instructor, NonModel, Person
+from myapp.parsers import AtomicOperationsParser
+from myapp.renderers import AtomicOperationsRenderer, NDJSONRenderer
 from myapp.serializers import (CourseSerializer, CourseTermSerializer, GradeSerializer, InstructorSerializer,
                                NonModelSerializer, PersonSerializer)
 from oauth.oauth2_introspection import HasClaim
@@ -167,11 +198,432 @@ class AuthnAuthzMixIn(object):
     }
 
 
-class CourseBaseViewSet(AuthnAuthzMixIn, ModelViewSet):
+class QueryPlanMixIn(object):
+    """
+    Avoid N+1 queries by deriving `select_related()` and `prefetch_related()` lookups from the serializer's
+    `ResourceRelatedField` declarations (resource linkage) and `included_serializers` (`?include=`).
+
+    Only the relationships that the request will actually render are added:
+
+    - toMany linkage is always prefetched (just the ids).
+    - toOne linkage is only joined when the related id can't be had from the local FK column.
+    - Included resources are joined (or prefetched once a toMany is in the path) and then their own
+      linkage and nested includes are planned the same way.
+
+    For GET/HEAD, {json:api} sparse fieldsets (`fields[type]=...`) become `only()` column projections for the
+    primary data and for each joined or prefetched resource type, always keeping the pk, the `row_version`
+    and the FK columns needed to render linkage or to traverse to included resources.
+    """
+
+    def get_queryset(self):
+        qs = super().get_queryset()
+        # related views fetch a single parent object; the related queryset is planned in get_related_instance().
+        if getattr(self, "request", None) is None or "related_field" in self.kwargs:
+            return qs
+        # the plan supersedes the include prefetching done by DJA's AutoPrefetchMixin.
+        return self.plan_queryset(qs.prefetch_related(None), self.get_serializer_class())
+
+    def get_related_instance(self):
+        instance = super().get_related_instance()
+        if isinstance(instance, (Manager, QuerySet)):
+            instance = self.plan_queryset(instance.all(), self.get_related_serializer_class())
+        return instance
+
+    def plan_queryset(self, queryset, serializer_class):
+        """
+        Apply the select/prefetch/only plan for `serializer_class` to `queryset`.
+        """
+        plan = {"select_related": set(), "prefetch_related": {}, "only": {}}
+        includes = [inflection.underscore(i) for i in get_included_resources(self.request, serializer_class)]
+        self._plan_relations(queryset.model, serializer_class, includes, "", False, set(), plan)
+        if plan["select_related"]:
+            queryset = queryset.select_related(*sorted(plan["select_related"]))
+        if any(columns is not None for _, columns in plan["only"].values()):
+            only = set(plan["select_related"])
+            for lookup, (model, columns) in plan["only"].items():
+                prefix = lookup + "__" if lookup else ""
+                only.update(prefix + column for column in columns or [f.name for f in model._meta.concrete_fields])
+            queryset = queryset.only(*sorted(only))
+        # sorted so that a Prefetch() with a queryset precedes the lookups that traverse it.
+        prefetch_related = [
+            Prefetch(lookup, queryset=model._default_manager.only(*sorted(columns))) if columns is not None else lookup
+            for lookup, (model, columns) in sorted(plan["prefetch_related"].items())
+        ]
+        if prefetch_related:
+            queryset = queryset.prefetch_related(*prefetch_related)
+        return queryset
+
+    def _sparse_columns(self, model, serializer):
+        """
+        Return the set of `model` columns needed to render `serializer` with the requested sparse fieldset,
+        or None if all columns are needed (no sparse fieldset, unsafe method, or non-model attributes).
+        """
+        if self.request.method not in SAFE_METHODS:
+            return None
+        try:
+            resource_type = get_resource_type_from_serializer(serializer)
+        except AttributeError:
+            return None
+        if "fields[{}]".format(resource_type) not in self.request.query_params:
+            return None
+        columns = {model._meta.pk.name}
+        if hasattr(model, "row_version"):  # for the conditional GET validators
+            columns.add("row_version")
+        for field in serializer._readable_fields:
+            if isinstance(field, HyperlinkedIdentityField):
+                continue  # the self link is built from the pk
+            try:
+                model_field = model._meta.get_field(field.source)
+            except FieldDoesNotExist:
+                return None
+            if model_field.concrete:
+                columns.add(model_field.name)
+        return columns
+
+    def _plan_relations(self, model, serializer_class, includes, lookup, many, required, plan):
+        """
+        Recursively walk the relationship fields of `serializer_class` adding ORM lookups to `plan`.
+
+        :param model: Model that `serializer_class` serializes.
+        :param serializer_class: serializer that will render the resources.
+        :param includes: include paths relative to this serializer.
+        :param lookup: ORM lookup path from the primary queryset's model to `model` ("" for the primary model).
+        :param many: whether `model` is reached through a toMany relationship (so is loaded by a prefetch query).
+        :param required: columns of `model` that must be loaded to connect it to its parent.
+        :param plan: dict of `select_related` lookups, `prefetch_related` and `only` (model, columns) by lookup.
+        """
+        serializer = serializer_class(context=self.get_serializer_context())
+        columns = self._sparse_columns(model, serializer)
+        if columns is not None:
+            columns |= required
+        included_serializers = getattr(serializer_class, "included_serializers", {})
+        prefix = lookup + "__" if lookup else ""
+        # fields left out of a sparse fieldset are neither linked nor included.
+        for field in serializer._readable_fields:
+            relation = getattr(field, "child_relation", field)
+            if not isinstance(relation, ResourceRelatedField):
+                continue
+            included = [i for i in includes if i.split(".")[0] == field.field_name]
+            try:
+                model_field = model._meta.get_field(field.source)
+            except FieldDoesNotExist:
+                continue
+            if not model_field.is_relation:
+                continue
+            is_many = model_field.many_to_many or model_field.one_to_many
+            to_many = many or is_many
+            # a forward toOne's linkage is rendered from its `<field>_id` column without fetching the related row.
+            needs_fetch = included or is_many or not model_field.concrete or not relation.use_pk_only_optimization()
+            if columns is not None and (model_field.concrete or not to_many):
+                columns.add(model_field.name)
+            if not needs_fetch:
+                continue
+            related_lookup = prefix + field.source
+            if not to_many:
+                plan["select_related"].add(related_lookup)
+            # a reverse FK/OneToOne is connected back to this model by the related model's FK column.
+            back = {model_field.field.name} if not (model_field.concrete or model_field.many_to_many) else set()
+            if included and field.field_name in included_serializers:
+                nested = [i.split(".", 1)[1] for i in included if "." in i]
+                self._plan_relations(model_field.related_model, included_serializers[field.field_name], nested,
+                                     related_lookup, to_many, back, plan)
+            elif to_many:
+                # linkage only needs the ids, but only project for GET/HEAD like the sparse fieldsets.
+                ids = {model_field.related_model._meta.pk.name} | back
+                plan["prefetch_related"][related_lookup] = (
+                    model_field.related_model, ids if self.request.method in SAFE_METHODS else None)
+        (plan["prefetch_related"] if many else plan["only"])[lookup] = (model, columns)
+
+
+class ConditionalGetMixIn(object):
+    """
+    Conditional GET for detail, list and related resources.
+
+    Strong `ETag` and `Last-Modified` validators are computed from the rows that were fetched to render the
+    response rather than by rendering them: the primary key and `row_version` (modification timestamp) of each
+    resource on the page and of each included resource, the resource linkage of their relationships and any
+    pagination `meta` and `links`, plus a signature of the request path, query parameters and media type.
+    A list's rows are just the page that the paginator fetches so the validators cost no more than the page.
+    A request whose `If-None-Match` (or else `If-Modified-Since`) matches gets a 304 before anything is
+    serialized.
+
+    N.B. `If-Modified-Since` can't notice deletions; `If-None-Match` can.
+    """
+
+    def list(self, request, *args, **kwargs):
+        queryset = self.filter_queryset(self.get_queryset())
+        page = self.paginate_queryset(queryset)
+        if page is None:
+            rows = list(queryset)
+            return self.conditional_response(
+                request, rows, self.get_serializer_class(),
+                lambda: Response(self.get_serializer(rows, many=True).data))
+        # the pagination meta and links without the page's resources,
+        pagination = {key: value for key, value in self.get_paginated_response([]).data.items() if key != "results"}
+        # where how the count was had doesn't change what it is.
+        pagination.get("meta", {}).get("pagination", {}).pop("count_strategy", None)
+        return self.conditional_response(
+            request, page, self.get_serializer_class(),
+            lambda: self.get_paginated_response(self.get_serializer(page, many=True).data), pagination)
+
+    def retrieve(self, request, *args, **kwargs):
+        instance = self.get_object()
+        return self.conditional_response(
+            request, [instance], self.get_serializer_class(), lambda: Response(self.get_serializer(instance).data))
+
+    def retrieve_related(self, request, *args, **kwargs):
+        instance = self.get_related_instance()
+        if isinstance(instance, (Manager, QuerySet)):
+            rows = list(instance.all())
+            return self.conditional_response(
+                request, rows, self.get_related_serializer_class(),
+                lambda: Response(self.get_related_serializer(rows, many=True).data))
+        if isinstance(instance, Model):
+            return self.conditional_response(
+                request, [instance], self.get_related_serializer_class(),
+                lambda: Response(self.get_related_serializer(instance).data))
+        return super().retrieve_related(request, *args, **kwargs)
+
+    def get_related_instance(self):
+        # retrieve_related() falls back to DJA's, which gets it again.
+        if not hasattr(self, "_related_instance"):
+            self._related_instance = super().get_related_instance()
+        return self._related_instance
+
+    def conditional_response(self, request, instances, serializer_class, render, pagination=None):
+        """
+        Return a 304 (or 412) response if the request's preconditions say so, else the response that `render()`
+        serializes. Either way add the `ETag` and `Last-Modified` headers.
+        """
+        etag, last_modified = self.get_validators(instances, serializer_class, pagination)
+        response = get_conditional_response(request, etag=etag, last_modified=last_modified)
+        if response is None:
+            response = render()
+        if response.status_code in (200, 304):
+            response["ETag"] = etag
+            if last_modified is not None:
+                response["Last-Modified"] = http_date(last_modified)
+        return response
+
+    def get_validators(self, instances, serializer_class, pagination=None):
+        """
+        Compute the validators for rendering the already fetched `instances` with `serializer_class` for this
+        request.
+
+        :return: (etag, last_modified timestamp)
+        """
+        includes = [inflection.underscore(i) for i in get_included_resources(self.request, serializer_class)]
+        versions = self._versions(instances, serializer_class, includes, [])
+        signature = [self.request.get_full_path(), self.request.accepted_media_type, pagination, versions]
+        etag = quote_etag(hashlib.sha256(json.dumps(signature, default=str).encode()).hexdigest())
+        last_mods = [version for _, _, version, _ in versions if isinstance(version, datetime)]
+        return etag, int(max(last_mods).timestamp()) if last_mods else None
+
+    def _versions(self, instances, serializer_class, includes, versions):
+        """
+        Recursively append the (label, pk, `row_version`, linkage) of each of `instances` and of the resources
+        that they include to `versions`. Only rows and relationships that the query plan has already loaded are
+        looked at: see :py:class:`QueryPlanMixIn`.
+
+        :return: versions
+        """
+        if not instances:
+            return versions
+        model = type(instances[0])
+        serializer = serializer_class(context=self.get_serializer_context())
+        included_serializers = getattr(serializer_class, "included_serializers", {})
+        linkage = {instance.pk: [] for instance in instances}
+        for field in serializer._readable_fields:
+            relation = getattr(field, "child_relation", field)
+            if not isinstance(relation, ResourceRelatedField):
+                continue
+            try:
+                model_field = model._meta.get_field(field.source)
+            except FieldDoesNotExist:
+                continue
+            if not model_field.is_relation or model_field.related_model is None:
+                continue
+            included = [i for i in includes if i.split(".")[0] == field.field_name]
+            related = {}
+            for instance in instances:
+                if not included and model_field.concrete and not model_field.many_to_many and (
+                        relation.use_pk_only_optimization()):
+                    # the linkage is rendered from the `<field>_id` column.
+                    ids = [getattr(instance, model_field.attname)]
+                else:
+                    value = getattr(instance, field.source, None)
+                    rows = list(value.all()) if isinstance(value, Manager) else [value]
+                    related.update((row.pk, row) for row in rows if row is not None)
+                    ids = [row.pk for row in rows if row is not None]
+                linkage[instance.pk].append((field.field_name, sorted(str(pk) for pk in ids if pk is not None)))
+            if included and field.field_name in included_serializers:
+                nested = [i.split(".", 1)[1] for i in included if "." in i]
+                self._versions(list(related.values()), included_serializers[field.field_name], nested, versions)
+        versions.extend((model._meta.label, str(instance.pk), getattr(instance, "row_version", None),
+                         linkage[instance.pk]) for instance in instances)
+        return versions
+
+
+class ConditionalRelationshipMixIn(object):
+    """
+    Conditional GET for relationship views: the strong `ETag` is a digest of the request path and
+    the linked resource ids so a 304 is returned without serializing anything.
+    """
+
+    def get(self, request, *args, **kwargs):
+        related = self.get_related_instance()
+        if isinstance(related, Manager):
+            ids = sorted(str(pk) for pk in related.values_list("pk", flat=True))
+        else:
+            ids = None if related is None else str(related.pk)
+        signature = [request.get_full_path(), request.accepted_media_type, ids]
+        etag = quote_etag(hashlib.sha256(json.dumps(signature).encode()).hexdigest())
+        response = get_conditional_response(request, etag=etag)
+        if response is None:
+            response = super().get(request, *args, **kwargs)
+        if response.status_code in (200, 304):
+            response["ETag"] = etag
+        return response
+
+    def get_related_instance(self):
+        # get() needs it twice.
+        if not hasattr(self, "_related_instance"):
+            self._related_instance = super().get_related_instance()
+        return self._related_instance
+
+
+class StreamingListMixIn(object):
+    """
+    Streaming of whole collections for backend (client credentials) clients:
+
+    - `page[size]=all` streams the collection as a single {json:api} document. It has no pagination links
+      and its `meta.count` comes at the end.
+    - `<type>/export/` streams newline-delimited resource objects (`application/x-ndjson`), gzipped if the
+      client accepts it. They are ordered by, and each has in its `meta`, the `row_version` modification
+      timestamp so a sync can resume (or pick up changes) with `page[since]=<the last one seen>`. The resource
+      objects with that `row_version` are sent again so clients should upsert by id.
+
+    Either way the `filter[]`ed queryset is iterated (with a server-side cursor where the database has them)
+    `stream_chunk_size` rows at a time and each chunk is serialized and rendered as it is sent in a
+    `StreamingHttpResponse`, so memory stays flat regardless of the number of rows. `include` isn't supported.
+    """
+
+    #: `page[size]` value that requests streaming
+    stream_page_size = "all"
+    #: rows fetched, serialized and rendered at a time
+    stream_chunk_size = 500
+    #: token scopes a client (with no authenticated user) must have to stream
+    stream_required_scopes = AuthnAuthzMixIn.BACKEND_SCOPES
+    #: export resumption query parameter
+    export_since_query_param = "page[since]"
+
+    def list(self, request, *args, **kwargs):
+        page_size_query_param = getattr(self.paginator, "page_size_query_param", None)
+        if not page_size_query_param or request.query_params.get(page_size_query_param) != self.stream_page_size:
+            return super().list(request, *args, **kwargs)
+        self.check_streaming(request, "{}={}".format(page_size_query_param, self.stream_page_size))
+        return self.streaming_response(request, self.filter_queryset(self.get_queryset()))
+
+    @action(detail=False, methods=["get"], renderer_classes=[NDJSONRenderer])
+    def export(self, request, *args, **kwargs):
+        """
+        Stream all the resources, or those changed since `page[since]`, as newline-delimited JSON.
+        """
+        self.check_streaming(request, "export")
+        queryset = self.filter_queryset(self.get_queryset())
+        since = request.query_params.get(self.export_since_query_param)
+        if since:
+            watermark = parse_datetime(since)
+            if watermark is None:
+                raise ValidationError("{} must be a date-time".format(self.export_since_query_param))
+            if timezone.is_naive(watermark):
+                watermark = timezone.make_aware(watermark, dt_timezone.utc)
+            queryset = queryset.filter(row_version__gte=watermark)
+        response = self.streaming_response(
+            request, queryset.order_by(F("row_version").asc(nulls_first=True), "pk"))
+        if "gzip" in request.headers.get("Accept-Encoding", ""):
+            response.streaming_content = compress_sequence(response.streaming_content)
+            response["Content-Encoding"] = "gzip"
+        patch_vary_headers(response, ("Accept-Encoding",))
+        return response
+
+    def check_streaming(self, request, what):
+        """
+        :raises PermissionDenied: unless a backend client
+        :raises ValidationError: if included resources are requested
+        """
+        user = request.user
+        if (user and user.is_authenticated) or not (request.auth and request.auth.allow_scopes(
+                self.stream_required_scopes)):
+            raise PermissionDenied("{} is only available to backend clients".format(what))
+        if get_included_resources(request, self.get_serializer_class()):
+            raise ValidationError("include is not supported with {}".format(what))
+
+    def streaming_response(self, request, queryset):
+        renderer = request.accepted_renderer
+        if not hasattr(renderer, "stream"):
+            raise NotAcceptable("Streaming is only available as {}".format(self.renderer_classes[0].media_type))
+        return StreamingHttpResponse(
+            renderer.stream(self._stream_chunks(queryset), request.accepted_media_type, self.get_renderer_context()),
+            content_type=renderer.media_type)
+
+    def _stream_chunks(self, queryset):
+        rows = queryset.iterator(chunk_size=self.stream_chunk_size)
+        while True:
+            chunk = list(itertools.islice(rows, self.stream_chunk_size))
+            if not chunk:
+                return
+            yield self.get_serializer(chunk, many=True).data
+
+
+class BulkCreateMixIn(object):
+    """
+    POSTing a list of resource objects to a collection creates them all in one transaction: they are all
+    validated (with the errors' `source.pointer`s indexing into `data`) and then saved with a single
+    `bulk_create()` plus one bulk insert per toMany relationship. See
+    :py:class:`myapp.serializers.ModelListSerializer` and :py:class:`myapp.parsers.JSONParser`.
+    """
+
+    def create(self, request, *args, **kwargs):
+        if not isinstance(request.data, list):
+            return super().create(request, *args, **kwargs)
+        serializer = self.get_serializer(data=request.data, many=True)
+        if not serializer.is_valid():
+            return self.bulk_error_response(serializer.errors)
+        with transaction.atomic():
+            serializer.save()
+        return Response(serializer.data, status=status.HTTP_201_CREATED)
+
+    def bulk_error_response(self, errors):
+        """
+        Format each resource object's errors with their `source.pointer`s relative to `/data/<index>`.
+        """
+        if isinstance(errors, dict):  # not about any one of them
+            raise ValidationError(errors)
+        response, formatted = None, []
+        for index, item_errors in enumerate(errors):
+            if not item_errors:
+                continue
+            response = self.get_exception_handler()(ValidationError(item_errors), self.get_exception_handler_context())
+            for error in response.data:
+                source = error.setdefault("source", {})
+                source["pointer"] = re.sub(r"^(/data)?", "/data/{}".format(index), source.get("pointer") or "", 1)
+            formatted.extend(response.data)
+        response.data = formatted
+        return response
+
+
+class CourseBaseViewSet(AuthnAuthzMixIn, StreamingListMixIn, ConditionalGetMixIn, BulkCreateMixIn, QueryPlanMixIn,
+                        ModelViewSet):
     """
     Base ViewSet for all our ViewSets:
 
     - Adds Authn/Authz
+    - Adds streaming of whole collections with `page[size]=all` and `<type>/export/` for backend clients
+    - Adds conditional GET (`ETag` and `Last-Modified`) for everything else
+    - Adds bulk creation by POSTing a list of resource objects
+    - Adds automatic `select_related`/`prefetch_related` for resource linkage and `?include=`
+    - Adds `only()` column projection for sparse fieldsets
     """
 
 
@@ -252,9 +704,9 @@ class PersonViewSet(CourseBaseViewSet):
         }
 
 
-class InstructorFilterSet(filters.FilterSet):
+class InstructorFilterSet(EffectiveDateFilterSet):
     """
-    Extend class `django_filters.rest_framework.FilterSet` for the Instructor model
+    Extend class :py:class:`myapp.filters.EffectiveDateFilterSet` for the Instructor model
 
     Includes a filter "alias" for a chained search from instructor->course_term->course
     """
@@ -276,22 +728,22 @@ class InstructorFilterSet(filters.FilterSet):
     course_name__lte = filters.CharFilter(
         field_name="course_terms__course__course_name", lookup_expr="lte"
     )
-    #: `filter[name]` is an alias for the path `course_terms.instructor.person.name`
+    #: `filter[name]` is an alias for the path `person.name`
     name = filters.CharFilter(
-        field_name="course_terms__instructor__person__name", lookup_expr="iexact"
+        field_name="person__name", lookup_expr="iexact"
     )
     #: `filter[name_gt]` for greater-than, etc.
     name__gt = filters.CharFilter(
-        field_name="course_terms__instructor__person__name", lookup_expr="gt"
+        field_name="person__name", lookup_expr="gt"
     )
     name__gte = filters.CharFilter(
-        field_name="course_terms__instructor__person__name", lookup_expr="gte"
+        field_name="person__name", lookup_expr="gte"
     )
     name__lt = filters.CharFilter(
-        field_name="course_terms__instructor__person__name", lookup_expr="lt"
+        field_name="person__name", lookup_expr="lt"
     )
     name__lte = filters.CharFilter(
-        field_name="course_terms__instructor__person__name", lookup_expr="lte"
+        field_name="person__name", lookup_expr="lte"
     )
 
     class Meta:
@@ -328,7 +780,7 @@ class GradeViewSet(CourseBaseViewSet):
         # 'exam_credit_flag': ['exact'],
         # 'course__id': usual_rels,
     }
-    search_fields = ("person__name", "course_terms__course__course_name")
+    search_fields = ("person__person__name", "course_term__course__course_name")
 
 
 # class NonModelViewSet(GenericViewSet, AuthnAuthzMixIn):
@@ -342,6 +794,8 @@ class NonModelViewSet(CourseBaseViewSet):
     http_method_names = ["get", "head", "options"]
     description = "this is a demo"
     queryset = NonModel.objects
+    #: there's nothing in the database to export
+    export = None
 
     def retrieve(self, request, pk, *args, **kwargs):
         foo = NonModel(id="123", field1="hi there")
@@ -368,7 +822,7 @@ class NonModelViewSet(CourseBaseViewSet):
 # Relationship views:
 
 
-class CourseRelationshipView(AuthnAuthzMixIn, RelationshipView):
+class CourseRelationshipView(AuthnAuthzMixIn, ConditionalRelationshipMixIn, RelationshipView):
     """
     View for courses.relationships
     """
@@ -377,7 +831,7 @@ class CourseRelationshipView(AuthnAuthzMixIn, RelationshipView):
     self_link_view_name = "course-relationships"
 
 
-class CourseTermRelationshipView(AuthnAuthzMixIn, RelationshipView):
+class CourseTermRelationshipView(AuthnAuthzMixIn, ConditionalRelationshipMixIn, RelationshipView):
     """
     View for course_terms.relationships
     """
@@ -386,7 +840,7 @@ class CourseTermRelationshipView(AuthnAuthzMixIn, RelationshipView):
     self_link_view_name = "course_term-relationships"
 
 
-class InstructorRelationshipView(AuthnAuthzMixIn, RelationshipView):
+class InstructorRelationshipView(AuthnAuthzMixIn, ConditionalRelationshipMixIn, RelationshipView):
     """
     View for instructors.relationships
     """
@@ -395,7 +849,7 @@ class InstructorRelationshipView(AuthnAuthzMixIn, RelationshipView):
     self_link_view_name = "instructor-relationships"
 
 
-class PersonRelationshipView(AuthnAuthzMixIn, RelationshipView):
+class PersonRelationshipView(AuthnAuthzMixIn, ConditionalRelationshipMixIn, RelationshipView):
     """
     View for people.relationships
     """
@@ -404,10 +858,264 @@ class PersonRelationshipView(AuthnAuthzMixIn, RelationshipView):
     self_link_view_name = "person-relationships"
 
 
-class GradeRelationshipView(AuthnAuthzMixIn, RelationshipView):
+class GradeRelationshipView(AuthnAuthzMixIn, ConditionalRelationshipMixIn, RelationshipView):
     """
     View for grades.relationships
     """
 
     queryset = Grade.objects
     self_link_view_name = "grade-relationships"
+
+
+class OperationFailed(Exception):
+    """
+    An atomic operation failed: roll back and respond with its (formatted) errors.
+    """
+
+    def __init__(self, response):
+        super().__init__(response.data)
+        self.response = response
+
+
+class OperationsView(AuthnAuthzMixIn, APIView):
+    """
+    {json:api} [Atomic Operations](https://jsonapi.org/ext/atomic/) extension: `POST /v1/operations` a list
+    of `add`, `update` and `remove` operations on resources and their relationships, which are all performed
+    in a single transaction, and get back all their results in one response.
+
+    Each operation is performed by the resource's ViewSet (or RelationshipView) as if it had been requested
+    on its own, so the same scopes, claims and validation apply. Resources added with a local id (`lid`) can
+    be referred to by that `lid` in the operations that follow.
+
+    Consecutive `add`s of resources of the same type, none of which refers to another's `lid`, are created
+    together with one bulk insert (as for a POST of a list of resource objects to the collection).
+
+    If an operation fails, none are performed and its errors are returned, with their `source.pointer`s
+    relative to `/atomic:operations/<index>`.
+    """
+
+    parser_classes = [AtomicOperationsParser]
+    renderer_classes = [AtomicOperationsRenderer]
+    #: render results as-is
+    resource_name = False
+    #: each operation's own method requires its own scopes.
+    required_alternate_scopes = {
+        "OPTIONS": [["read"]],
+        "POST": [AuthnAuthzMixIn.USER_SCOPES, AuthnAuthzMixIn.BACKEND_SCOPES],
+    }
+    #: the ViewSets that perform operations on resources
+    viewsets = (CourseViewSet, CourseTermViewSet, PersonViewSet, InstructorViewSet, GradeViewSet)
+    #: the RelationshipViews that perform operations on resources' relationships
+    relationship_views = (CourseRelationshipView, CourseTermRelationshipView, PersonRelationshipView,
+                          InstructorRelationshipView, GradeRelationshipView)
+    #: the method and ViewSet action of each op.
+    ops = {"add": ("POST", "create"), "update": ("PATCH", "partial_update"), "remove": ("DELETE", "destroy")}
+
+    @extend_schema(request=OpenApiTypes.OBJECT, tags=["operations"], responses={
+        200: OpenApiResponse(description="`atomic:results`: the result of each operation"),
+        204: OpenApiResponse(description="no operation has a result")})
+    def post(self, request, *args, **kwargs):
+        operations = request.data["atomic:operations"]
+        lids = {}
+        results = []
+        try:
+            with transaction.atomic():
+                index = 0
+                while index < len(operations):
+                    batch = self._batch(operations, index)
+                    if len(batch) > 1:
+                        results.extend(self.perform_adds(request, index, batch, lids))
+                    else:
+                        results.append(self.perform_operation(request, index, operations[index], lids))
+                    index += len(batch)
+        except OperationFailed as failed:
+            return failed.response
+        if not any(results):
+            return Response(status=204)
+        return Response({"atomic:results": results})
+
+    def perform_operation(self, request, index, operation, lids):
+        """
+        Perform one operation.
+
+        :return: its result: the resource object for an `add` or `update` of a resource, else empty.
+        :raises OperationFailed: with the formatted errors.
+        """
+        view = self
+        try:
+            if not isinstance(operation, dict) or operation.get("op") not in self.ops:
+                raise ValidationError("op must be one of {}".format(", ".join(self.ops)))
+            if "href" in operation:
+                raise ValidationError("href is not supported: use ref")
+            method, action = self.ops[operation["op"]]
+            ref = self._resolve(operation.get("ref") or {}, lids)
+            data = operation.get("data")
+            resource_type = ref.get("type") or (data.get("type") if isinstance(data, dict) else None)
+            if "relationship" in ref:
+                data = self._resolve_identifiers(data, lids)
+                view = self._operation_view(self.relationship_views, resource_type, request, method, action,
+                                            {"pk": ref.get("id"), "related_field": ref["relationship"]}, data)
+                getattr(view, method.lower())(view.request, **view.kwargs)
+                return {}
+            data = self._resolve_resource(data, lids)
+            if operation["op"] == "add":
+                kwargs = {}
+            elif "id" in ref or isinstance(data, dict) and "id" in data:
+                kwargs = {"pk": ref["id"] if "id" in ref else data["id"]}
+            else:
+                raise ValidationError("ref or data must identify the resource to {}".format(operation["op"]))
+            view = self._operation_view(self.viewsets, resource_type, request, method, action, kwargs, None)
+            if operation["op"] == "remove":
+                view.destroy(view.request, **kwargs)
+                return {}
+            if not isinstance(data, dict):
+                raise ValidationError("data must be a resource object")
+            lid = data.pop("lid", None)
+            view.request._full_data = JSONParser().parse_data(
+                {"data": data}, {"view": view, "request": view.request})
+            handler = view.create if operation["op"] == "add" else view.partial_update
+            serializer = handler(view.request, **kwargs).data.serializer
+            if lid is not None:
+                lids[(resource_type, lid)] = str(serializer.instance.pk)
+            return {"data": AtomicOperationsRenderer.build_json_resource_obj(
+                get_serializer_fields(serializer), serializer.data, serializer.instance,
+                get_resource_type_from_serializer(serializer), serializer)}
+        except (APIException, Http404, DjangoPermissionDenied) as exc:
+            raise self._failed(view, exc, index)
+
+    def perform_adds(self, request, start, operations, lids):
+        """
+        Perform consecutive `add` operations of resources of the same type, starting at index `start`, with one
+        bulk create as for a POST of a list of them (see :py:class:`BulkCreateMixIn`).
+
+        :return: their results: each one's resource object.
+        :raises OperationFailed: with the formatted errors of each operation that failed.
+        """
+        view = self
+        try:
+            resource_type = operations[0]["data"].get("type")
+            view = self._operation_view(self.viewsets, resource_type, request, "POST", "create", {}, None)
+            local_ids, items = [], []
+            for operation in operations:
+                data = dict(self._resolve_resource(operation["data"], lids))
+                local_ids.append(data.pop("lid", None))
+                items.append(JSONParser().parse_data({"data": data}, {"view": view, "request": view.request}))
+            serializer = view.get_serializer(data=items, many=True)
+            if not serializer.is_valid():
+                response = view.bulk_error_response(serializer.errors)
+                for error in response.data:
+                    source = error["source"]
+                    source["pointer"] = re.sub(r"^/data/(\d+)", lambda m: "/atomic:operations/{}/data".format(
+                        start + int(m.group(1))), source["pointer"], 1)
+                raise OperationFailed(response)
+            serializer.save()
+        except (APIException, Http404, DjangoPermissionDenied) as exc:
+            raise self._failed(view, exc, start)
+        for lid, instance in zip(local_ids, serializer.instance):
+            if lid is not None:
+                lids[(resource_type, lid)] = str(instance.pk)
+        fields = get_serializer_fields(serializer)
+        return [{"data": AtomicOperationsRenderer.build_json_resource_obj(
+            fields, resource, instance, resource_type, serializer)}
+            for resource, instance in zip(serializer.data, serializer.instance)]
+
+    def _failed(self, view, exc, index):
+        """
+        :return: :py:class:`OperationFailed` with the errors of operation `index`, their `source.pointer`s
+            relative to `/atomic:operations/<index>`.
+        """
+        response = self.get_exception_handler()(exc, view.get_exception_handler_context())
+        if response is None:
+            raise exc
+        prefix = "/atomic:operations/{}".format(index)
+        for error in response.data:
+            source = error.setdefault("source", {})
+            source["pointer"] = prefix + (source.get("pointer") or "")
+        return OperationFailed(response)
+
+    def _batch(self, operations, start):
+        """
+        :return: the consecutive operations, from index `start` on, that can be performed together: `add`s of
+            resources of the same type none of which refers to another's `lid`. Else just the one at `start`.
+        """
+        batch, added = [], set()
+        for operation in operations[start:]:
+            data = operation.get("data") if isinstance(operation, dict) else None
+            if (not isinstance(data, dict) or operation.get("op") != "add" or "ref" in operation
+                    or "href" in operation or batch and data.get("type") != batch[0]["data"].get("type")):
+                break
+            lid = (data.get("type"), data["lid"]) if "lid" in data else None
+            if lid in added or added & self._lid_references(data):
+                break
+            batch.append(operation)
+            if lid is not None:
+                added.add(lid)
+        return batch or operations[start:start + 1]
+
+    def _lid_references(self, data):
+        """
+        :return: the (type, lid)s that a resource object's relationships refer to.
+        """
+        references = set()
+        relationships = data.get("relationships")
+        for relationship in relationships.values() if isinstance(relationships, dict) else ():
+            linkage = relationship.get("data") if isinstance(relationship, dict) else None
+            for identifier in linkage if isinstance(linkage, list) else [linkage]:
+                if isinstance(identifier, dict) and "lid" in identifier:
+                    references.add((identifier.get("type"), identifier["lid"]))
+        return references
+
+    def _operation_view(self, view_classes, resource_type, request, method, action, kwargs, data):
+        """
+        Instantiate the view for `resource_type` to perform an operation, with a copy of the request that
+        has the operation's method (and data) and check its permissions.
+        """
+        view_class = next((v for v in view_classes if get_resource_type_from_model(v.queryset.model) == resource_type),
+                          None)
+        if view_class is None:
+            raise ValidationError("unknown type: {}".format(resource_type))
+        operation_request = copy.copy(request)
+        operation_request._request = copy.copy(request._request)
+        operation_request._request.method = method
+        if data is not None:
+            operation_request._full_data = data
+        view = view_class(request=operation_request, args=(), kwargs=kwargs, format_kwarg=None, headers={})
+        view.action = action
+        view.check_permissions(operation_request)
+        return view
+
+    def _resolve(self, identifier, lids):
+        """
+        Replace a `lid` in a resource identifier with the id of the resource added with it.
+        """
+        if not isinstance(identifier, dict) or "lid" not in identifier or "id" in identifier:
+            return identifier
+        key = (identifier.get("type"), identifier["lid"])
+        if key not in lids:
+            raise ValidationError("unknown lid: {}".format(identifier["lid"]))
+        return {**{k: v for k, v in identifier.items() if k != "lid"}, "id": lids[key]}
+
+    def _resolve_identifiers(self, data, lids):
+        """
+        Resolve the `lid`s in relationship data: a resource identifier, a list of them or null.
+        """
+        if isinstance(data, list):
+            return [self._resolve(identifier, lids) for identifier in data]
+        return self._resolve(data, lids)
+
+    def _resolve_resource(self, data, lids):
+        """
+        Resolve the `lid`s in a resource object's relationships and, unless it's being added with it, its own.
+        """
+        if not isinstance(data, dict):
+            return data
+        if "lid" in data and (data.get("type"), data["lid"]) in lids:
+            data = self._resolve(data, lids)
+        relationships = data.get("relationships")
+        if isinstance(relationships, dict):
+            data = {**data, "relationships": {
+                name: {**relationship, "data": self._resolve_identifiers(relationship.get("data"), lids)}
+                if isinstance(relationship, dict) else relationship
+                for name, relationship in relationships.items()
+            }}
+        return data
@@ -0,0 +1,56 @@
+import logging
+
+import requests
+from django.conf import settings
+from requests.adapters import HTTPAdapter
+from urllib3.util.retry import Retry
+
+log = logging.getLogger(__name__)
+
+
+class PooledSession(requests.Session):
+    """
+    A keep-alive :py:class:`requests.Session` for calls to the OAuth2/OIDC AS (e.g. the userinfo endpoint):
+
+    - connections (and their TLS sessions) are pooled and reused, up to `pool_size` per host.
+    - every request gets a default `(connect_timeout, read_timeout)` unless it provides its own.
+    - idempotent requests are retried up to `retries` times with exponential backoff on connection errors
+      and 429/5xx responses.
+
+    Configure with `settings.OAUTH2_HTTP_SESSION`.
+    """
+
+    #: response status codes that are retried
+    retry_status = (429, 500, 502, 503, 504)
+
+    def __init__(self, pool_size=10, connect_timeout=3.05, read_timeout=5, retries=2, backoff=0.2):
+        super().__init__()
+        self.timeout = (connect_timeout, read_timeout)
+        retry = Retry(
+            total=retries,
+            backoff_factor=backoff,
+            status_forcelist=self.retry_status,
+            allowed_methods=Retry.DEFAULT_ALLOWED_METHODS,
+            raise_on_status=False,
+        )
+        adapter = HTTPAdapter(pool_connections=pool_size, pool_maxsize=pool_size, max_retries=retry)
+        self.mount("https://", adapter)
+        self.mount("http://", adapter)
+
+    @classmethod
+    def from_settings(cls):
+        """
+        Instantiate from `settings.OAUTH2_HTTP_SESSION`
+        """
+        conf = getattr(settings, "OAUTH2_HTTP_SESSION", {})
+        return cls(
+            pool_size=conf.get("POOL_SIZE", 10),
+            connect_timeout=conf.get("CONNECT_TIMEOUT", 3.05),
+            read_timeout=conf.get("READ_TIMEOUT", 5),
+            retries=conf.get("RETRIES", 2),
+            backoff=conf.get("BACKOFF", 0.2),
+        )
+
+    def request(self, method, url, **kwargs):
+        kwargs.setdefault("timeout", self.timeout)
+        return super().request(method, url, **kwargs)
@@ -0,0 +1,86 @@
+import logging
+import threading
+import time
+
+from django.conf import settings
+from jwcrypto.jwk import JWKSet
+
+from oauth.http_session import PooledSession
+
+log = logging.getLogger(__name__)
+
+
+class JWKSCache(object):
+    """
+    The OAuth2 AS's JSON Web Key Set (keyed by `kid`), used to validate JWT access tokens locally.
+
+    The key set is fetched on first use and then refreshed every `refresh_interval` seconds by a background
+    thread so that validation never waits on the network. A token signed with an unknown `kid` (the AS rotated
+    its keys) triggers an immediate refresh, but no more often than every `min_refresh_interval` seconds.
+    If a refresh fails the previous key set is kept.
+    Configure with `settings.OAUTH2_JWT_VALIDATION`.
+    """
+
+    def __init__(self, url, refresh_interval=300, min_refresh_interval=30, session=None):
+        self.url = url
+        self.refresh_interval = refresh_interval
+        self.min_refresh_interval = min_refresh_interval
+        self.session = session or PooledSession.from_settings()
+        self.keyset = None
+        self.refreshed_at = None
+        self._lock = threading.Lock()
+        self._thread = None
+
+    @classmethod
+    def from_settings(cls):
+        """
+        Instantiate from `settings.OAUTH2_JWT_VALIDATION`
+        """
+        conf = getattr(settings, "OAUTH2_JWT_VALIDATION", {})
+        return cls(
+            url=conf.get("JWKS_URL", None),
+            refresh_interval=conf.get("REFRESH_INTERVAL", 300),
+            min_refresh_interval=conf.get("MIN_REFRESH_INTERVAL", 30),
+        )
+
+    def get(self):
+        """
+        :return: the :py:class:`jwcrypto.jwk.JWKSet` or None if it has never been fetched successfully.
+        """
+        if self.keyset is None:
+            self.refresh()
+        if self._thread is None and self.refresh_interval:
+            with self._lock:
+                if self._thread is None:
+                    self._thread = threading.Thread(target=self._run, name="jwks-refresh", daemon=True)
+                    self._thread.start()
+        return self.keyset
+
+    def refresh(self, force=True):
+        """
+        Fetch the key set from `url`.
+        :param force: if False, don't refresh if that was done within the last `min_refresh_interval` seconds.
+        :return: True if refreshed.
+        """
+        if not self.url:
+            return False
+        if not force and self.refreshed_at and time.monotonic() - self.refreshed_at < self.min_refresh_interval:
+            return False
+        self.refreshed_at = time.monotonic()
+        try:
+            response = self.session.get(self.url)
+            response.raise_for_status()
+            self.keyset = JWKSet.from_json(response.text)
+        except Exception:
+            log.exception("JWKS: failed to refresh from %r", self.url)
+            return False
+        return True
+
+    def _run(self):
+        while True:
+            time.sleep(self.refresh_interval)
+            self.refresh()
+
+
+#: the process-wide JWKS cache
+jwks_cache = JWKSCache.from_settings()
@@ -1,20 +1,32 @@
 import json
 import logging
-from typing.re import Pattern
+import re
 
 import requests
 from django.contrib.auth import get_user_model
 from django.core.exceptions import ImproperlyConfigured
+from django.db import DatabaseError
 from oauth2_provider.models import get_access_token_model
 from oauth2_provider.settings import oauth2_settings
 from oauth2_provider.views.mixins import OAuthLibMixin
 from rest_framework.permissions import BasePermission
 
+from oauth.http_session import PooledSession
+from oauth.singleflight import SingleFlight
+from oauth.userinfo_cache import userinfo_cache
+
 log = logging.getLogger(__name__)
 
 UserModel = get_user_model()
 AccessToken = get_access_token_model()
 
+#: coalesces concurrent userinfo fetches for the same access token
+userinfo_flight = SingleFlight.from_settings()
+#: coalesces concurrent introspection calls for the same access token
+introspection_flight = SingleFlight.from_settings()
+#: keep-alive connection pool to the userinfo endpoint
+userinfo_session = PooledSession.from_settings()
+
 
 class HasClaim(BasePermission, OAuthLibMixin):
     """
@@ -36,6 +48,8 @@ class HasClaim(BasePermission, OAuthLibMixin):
         "PATCH": None,
         "DELETE": None,
     }
+    #: `claims_map` compiled by :py:meth:`compile_claim`
+    claim_matchers = {}
 
     def __init__(self):
         """
@@ -48,28 +62,82 @@ class HasClaim(BasePermission, OAuthLibMixin):
         #     )
         # )
 
-    def _get_claims_from_authentication_server(self, request):
+    def _get_access_token(self, request):
         """
-        get the external userinfo response for the given access token
+        The access token for the request. The authentication class has usually already loaded it so avoid
+        going back to the database.
         :param request: request.auth has the access token
-        :return: :string: serialized userinfo response or None
+        :return: :class:`AccessToken` or None
         """
+        if isinstance(request.auth, AccessToken):
+            return request.auth
         try:
-            access_token = AccessToken.objects.select_related(
+            return AccessToken.objects.select_related(
                 "application", "user"
             ).get(token=request.auth)
         except Exception as e:
             log.error(e)
             return None
 
+    def _save_userinfo(self, access_token, userinfo):
+        """
+        Stash the userinfo response with the access token. Only the userinfo column is written and only
+        if it hasn't already been: a concurrent request that got there first wins and nothing else in the
+        access token row is touched.
+        :param access_token: :class:`AccessToken`
+        :param userinfo: serialized userinfo response
+        """
+        access_token.userinfo = userinfo
+        if access_token.pk is None:
+            return
+        try:
+            AccessToken.objects.filter(pk=access_token.pk, userinfo__isnull=True).update(userinfo=userinfo)
+        except DatabaseError:
+            log.exception("Userinfo: failed to save for access token %s", access_token.pk)
+
+    def _get_userinfo(self, request):
+        """
+        Get the userinfo response for the request's access token from the cache or else fetch it.
+        :param request: request.auth has the access token
+        :return: :string: serialized userinfo response or None
+        """
+        userinfo = userinfo_cache.get(request.auth)
+        if userinfo is None:
+            if self.userinfo_url:
+                userinfo = self._get_claims_from_authentication_server(request)
+            else:
+                userinfo = self._get_claims_from_oauthlib(request)
+            userinfo_cache.set(request.auth, userinfo)
+        return userinfo
+
+    def _peek_userinfo(self, request):
+        """
+        Look for a userinfo response that another worker has fetched for the request's access token.
+        :param request: request.auth has the access token
+        :return: :string: serialized userinfo response or None
+        """
+        userinfo = userinfo_cache.get(request.auth)
+        if userinfo is None and getattr(request.auth, "pk", None) is not None:
+            userinfo = AccessToken.objects.filter(pk=request.auth.pk).values_list("userinfo", flat=True).first()
+        return userinfo
+
+    def _get_claims_from_authentication_server(self, request):
+        """
+        get the external userinfo response for the given access token
+        :param request: request.auth has the access token
+        :return: :string: serialized userinfo response or None
+        """
+        access_token = self._get_access_token(request)
+        if access_token is None:
+            return None
+
         if access_token.userinfo:  # already stashed it.
             return access_token.userinfo
 
         try:
-            response = requests.get(
+            response = userinfo_session.get(
                 self.userinfo_url,
                 headers={"authorization": "Bearer {}".format(request.auth)},
-                timeout=30,
             )
         except requests.exceptions.RequestException:
             log.exception(
@@ -78,8 +146,7 @@ class HasClaim(BasePermission, OAuthLibMixin):
             return None
 
         if response.status_code == 200:
-            access_token.userinfo = response.content.decode("utf-8")
-            access_token.save()
+            self._save_userinfo(access_token, response.content.decode("utf-8"))
         return access_token.userinfo
 
     def _get_claims_from_oauthlib(self, request):
@@ -92,12 +159,8 @@ class HasClaim(BasePermission, OAuthLibMixin):
         """
         if not oauth2_settings.OIDC_ENABLED:
             return None
-        try:
-            access_token = AccessToken.objects.select_related(
-                "application", "user"
-            ).get(token=request.auth)
-        except Exception as e:
-            log.error(e)
+        access_token = self._get_access_token(request)
+        if access_token is None:
             return None
 
         if access_token.userinfo:  # already stashed it.
@@ -106,8 +169,7 @@ class HasClaim(BasePermission, OAuthLibMixin):
         core = self.get_oauthlib_core()
         _, _, userinfo, status = core.create_userinfo_response(request)
         if status == 200:
-            access_token.userinfo = userinfo
-            access_token.save()
+            self._save_userinfo(access_token, userinfo)
             return access_token.userinfo
         else:
             log.error("userinfo error {}".format(status))
@@ -118,77 +180,106 @@ class HasClaim(BasePermission, OAuthLibMixin):
         then return true if the claim value is present in the userinfo response.
         If the mapping is None then return False.
         If the mapping is the empty string then return True.
+
+        The userinfo response is parsed once per request into :py:class:`Claims` which is shared by every
+        HasClaim permission evaluated for the request.
         """
         if self.claim is None:
             raise ImproperlyConfigured("HasClaim called but not configured.")
 
-        if request.method in self.claims_map:
-            log.debug(
-                'HasClaim: looking for {} claim {} value "{}"'.format(
-                    request.method, self.claim, self.claims_map[request.method]
-                )
+        if request.method not in self.claim_matchers:
+            return False
+        matcher = self.claim_matchers[request.method]
+        log.debug('HasClaim: looking for %s claim %s value "%s"', request.method, self.claim,
+                  self.claims_map[request.method])
+        if not (hasattr(request, "auth") and hasattr(request.auth, "userinfo")):
+            return False
+        if matcher is True or matcher is False:
+            # None means False and the empty string means True: no need for the userinfo.
+            log.debug("Claim %s (%r)", "approved" if matcher else "denied", self.claims_map[request.method])
+            return matcher
+
+        if request.auth.userinfo is None:
+            request.auth.userinfo = userinfo_flight.do(
+                userinfo_cache.key(request.auth),
+                lambda: self._get_userinfo(request),
+                peek=lambda: self._peek_userinfo(request),
             )
+        log.debug("userinfo result >>%s<<", request.auth.userinfo)
+        try:
+            result = matcher(Claims.for_request(request))
+        except Exception as e:
+            log.error(e)
+            return False
+        log.debug("Claim %s (%s %r)", "approved" if result else "denied", self.claim, self.claims_map[request.method])
+        return result
 
-        if (
-            request.method in self.claims_map
-            and hasattr(request, "auth")
-            and hasattr(request.auth, "userinfo")
-        ):
-            if request.auth.userinfo is None:
-                if self.userinfo_url:
-                    request.auth.userinfo = self._get_claims_from_authentication_server(
-                        request
-                    )
-                else:
-                    request.auth.userinfo = self._get_claims_from_oauthlib(request)
-            log.debug("userinfo result >>{}<<".format(request.auth.userinfo))
-            try:
-                claims_map_entry = self.claims_map[request.method]
-                if claims_map_entry is None:
-                    log.debug(
-                        "Claim denied (None means False)"
-                    )  # TODO: change up to use True/False?
-                    return False
-                if claims_map_entry == "":
-                    log.debug("Claim approved (empty string means True)")
-                    return True
-                claim_value = json.loads(request.auth.userinfo)[self.claim]
-                if isinstance(claims_map_entry, str):
-                    claims = claim_value.split()
-                    if claims_map_entry in claims:
-                        log.debug(
-                            'Claim approved ("{}" is in {})'.format(
-                                claims_map_entry, claims
-                            )
-                        )
-                        return True
-                    else:
-                        log.debug(
-                            'Claim denied ("{}" not in {})'.format(
-                                claims_map_entry, claims
-                            )
-                        )
-                        return False
-                elif isinstance(claims_map_entry, Pattern):
-                    if claims_map_entry.match(claim_value):
-                        log.debug(
-                            'Claim approved ("{}" matches {})'.format(
-                                claim_value, claims_map_entry
-                            )
-                        )
-                        return True
-                    else:
-                        log.debug(
-                            'Claim denied ("{}" does not match {})'.format(
-                                claim_value, claims_map_entry
-                            )
-                        )
-                        return False
-                else:
-                    log.error("claim value must be of type str or re")
-                    return False
-            except Exception as e:
-                log.error(e)
-                return False
-        else:
+    def __init_subclass__(cls, **kwargs):
+        super().__init_subclass__(**kwargs)
+        cls.claim_matchers = {
+            method: cls.compile_claim(cls.claim, entry) for method, entry in cls.claims_map.items()
+        }
+
+    @staticmethod
+    def compile_claim(claim, claims_map_entry):
+        """
+        Compile a `claims_map` entry once, when the permission class is defined.
+        :param claim: the claim name
+        :param claims_map_entry: None, "", a word that must be in the claim value or an RE it must match.
+        :return: True, False or a callable that takes :py:class:`Claims` and returns a bool.
+        """
+        if claims_map_entry is None:
             return False
+        if claims_map_entry == "":
+            return True
+        if isinstance(claims_map_entry, str):
+            return lambda claims: claims_map_entry in claims.words(claim)
+        if isinstance(claims_map_entry, re.Pattern):
+            return lambda claims: claims.matches(claim, claims_map_entry)
+        log.error("claim value must be of type str or re")
+        return False
+
+
+class Claims(object):
+    """
+    The userinfo claims for a request, parsed once and then shared by every HasClaim permission
+    evaluated for the request. Each string claim value is pre-split into a set of words so that
+    group membership is a set lookup and RE matches are remembered per claim.
+    """
+
+    def __init__(self, userinfo):
+        #: the userinfo response string these claims were parsed from
+        self.userinfo = userinfo
+        #: the parsed userinfo response
+        self.claims = json.loads(userinfo) if userinfo else {}
+        self._words = {
+            claim: frozenset(value.split()) for claim, value in self.claims.items() if isinstance(value, str)
+        }
+        self._matches = {}
+
+    @classmethod
+    def for_request(cls, request):
+        """
+        The Claims for the request's userinfo, parsing it only if not already done for this request.
+        """
+        claims = getattr(request, "oidc_claims", None)
+        if claims is None or claims.userinfo is not request.auth.userinfo:
+            claims = cls(request.auth.userinfo)
+            request.oidc_claims = claims
+        return claims
+
+    def words(self, claim):
+        """
+        :return: the set of words in the claim's value.
+        """
+        return self._words.get(claim, frozenset())
+
+    def matches(self, claim, pattern):
+        """
+        :return: True if the claim's value matches the RE pattern.
+        """
+        key = (claim, pattern)
+        if key not in self._matches:
+            value = self.claims.get(claim)
+            self._matches[key] = isinstance(value, str) and pattern.match(value) is not None
+        return self._matches[key]
@@ -0,0 +1,121 @@
+import logging
+import threading
+import time
+
+from django.conf import settings
+from django.core.cache import caches
+
+log = logging.getLogger(__name__)
+
+
+class _Call(object):
+    """
+    An in-flight call that other threads can wait on.
+    """
+
+    def __init__(self):
+        self.done = threading.Event()
+        self.result = None
+        self.error = None
+
+
+class SingleFlight(object):
+    """
+    Coalesce concurrent calls for the same key so that only one is in flight:
+
+    1. Per process, the first caller (the leader) runs the function and the others wait for, and share, its result.
+    2. Across processes (e.g. gunicorn workers), if a `cache_alias` is configured, the leader must also
+       hold a lease in that shared Django cache. A leader that can't get the lease polls the `peek` function
+       for the result the lease holder stores elsewhere (the shared userinfo cache, the database, ...)
+       until it appears or the lease expires.
+
+    A waiter that doesn't hear back within `timeout` seconds gives up waiting and runs the function itself.
+    Configure with `settings.OAUTH2_SINGLE_FLIGHT`.
+    """
+
+    def __init__(self, timeout=30, cache_alias=None, lease_timeout=10, poll_interval=0.05):
+        self.timeout = timeout
+        self.cache_alias = cache_alias
+        self.lease_timeout = lease_timeout
+        self.poll_interval = poll_interval
+        self._lock = threading.Lock()
+        self._calls = {}
+        #: number of :py:meth:`do` requests served
+        self.requests = 0
+        #: number of times the function was actually called
+        self.calls = 0
+
+    @classmethod
+    def from_settings(cls):
+        """
+        Instantiate from `settings.OAUTH2_SINGLE_FLIGHT`
+        """
+        conf = getattr(settings, "OAUTH2_SINGLE_FLIGHT", {})
+        return cls(
+            timeout=conf.get("TIMEOUT", 30),
+            cache_alias=conf.get("CACHE_ALIAS", None),
+            lease_timeout=conf.get("LEASE_TIMEOUT", 10),
+            poll_interval=conf.get("POLL_INTERVAL", 0.05),
+        )
+
+    def do(self, key, fn, peek=None):
+        """
+        Call `fn()` unless a call for `key` is already in flight, in which case wait for its result.
+        :param key: identifies the call, e.g. a cache key.
+        :param fn: function of no arguments.
+        :param peek: function of no arguments that returns another process's result or None if not there (yet).
+        :return: the result of `fn()`
+        """
+        with self._lock:
+            self.requests += 1
+            call = self._calls.get(key)
+            leader = call is None
+            if leader:
+                call = self._calls[key] = _Call()
+        if not leader:
+            if call.done.wait(self.timeout):
+                if call.error is not None:
+                    raise call.error
+                return call.result
+            log.warning("SingleFlight: timed out waiting for %s", key)
+            return self._call(fn)
+        try:
+            call.result = self._leased(key, fn, peek)
+            return call.result
+        except Exception as e:
+            call.error = e
+            raise
+        finally:
+            with self._lock:
+                del self._calls[key]
+            call.done.set()
+
+    def _call(self, fn):
+        with self._lock:
+            self.calls += 1
+        return fn()
+
+    def _leased(self, key, fn, peek):
+        """
+        Call `fn()` while holding the shared cache lease for `key`, if configured.
+        """
+        if not self.cache_alias or peek is None:
+            return self._call(fn)
+        cache = caches[self.cache_alias]
+        lease = "singleflight:{}".format(key)
+        deadline = time.monotonic() + self.lease_timeout
+        acquired = cache.add(lease, 1, self.lease_timeout)
+        while not acquired:
+            result = peek()
+            if result is not None:
+                return result
+            if time.monotonic() >= deadline:
+                log.warning("SingleFlight: lease for %s expired", key)
+                break
+            time.sleep(self.poll_interval)
+            acquired = cache.add(lease, 1, self.lease_timeout)
+        try:
+            return self._call(fn)
+        finally:
+            if acquired:
+                cache.delete(lease)
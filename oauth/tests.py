@@ -1,3 +1,404 @@
-# from django.test import TestCase
+import json
+import re
+import threading
+import time
+from datetime import timedelta
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from types import SimpleNamespace
+from unittest.mock import patch
 
-# Create your tests here.
+from django.contrib.auth.models import User
+from django.core.cache import cache
+from django.core.exceptions import ImproperlyConfigured
+from django.db import connection
+from django.test import TestCase, override_settings
+from django.test.utils import CaptureQueriesContext
+from django.utils import timezone
+from jwcrypto import jwk, jwt
+from oauth2_provider.oauth2_validators import OAuth2Validator
+
+from myapp.oauth2_validator import CustomOAuth2Validator, jwt_user_cache
+from oauth import models as oauth_models
+from oauth.http_session import PooledSession
+from oauth.jwks import JWKSCache
+from oauth.oauth2_introspection import Claims, HasClaim
+from oauth.singleflight import SingleFlight
+from oauth.userinfo_cache import UserinfoCache, userinfo_cache
+
+USERINFO = json.dumps({"sub": "user1", "https://api.columbia.edu/claim/group": "team-a team-c"})
+
+
+class SubClaimPermission(HasClaim):
+    claim = "sub"
+    claims_map = {"GET": re.compile("^user1$")}
+
+
+class GroupClaimPermission(HasClaim):
+    claim = "https://api.columbia.edu/claim/group"
+    claims_map = {"GET": "team-c", "POST": "team-b", "DELETE": None, "OPTIONS": ""}
+
+
+class UserinfoCacheTestCase(TestCase):
+    """
+    test the two-tier userinfo cache
+    """
+
+    def setUp(self):
+        self.user = User.objects.create_user('user1')
+        self.token = oauth_models.MyAccessToken.objects.create(  # nosec B106
+            token='CacheToken',
+            user=self.user,
+            expires=timezone.now() + timedelta(seconds=3600),
+            scope='read',
+        )
+        userinfo_cache.clear()
+
+    def test_lru(self):
+        """
+        least recently used entries are evicted
+        """
+        cache = UserinfoCache(maxsize=2)
+        tokens = [SimpleNamespace(token=t, expires=None) for t in ('a', 'b', 'c')]
+        cache.set(tokens[0], 'A')
+        cache.set(tokens[1], 'B')
+        self.assertEqual(cache.get(tokens[0]), 'A')
+        cache.set(tokens[2], 'C')
+        self.assertIsNone(cache.get(tokens[1]))
+        self.assertEqual(cache.get(tokens[0]), 'A')
+        self.assertEqual(cache.get(tokens[2]), 'C')
+
+    def test_expiry(self):
+        """
+        entries never outlive the access token
+        """
+        cache = UserinfoCache(timeout=300)
+        self.token.expires = timezone.now() - timedelta(seconds=1)
+        cache.set(self.token, USERINFO)
+        self.assertIsNone(cache.get(self.token))
+        self.token.expires = timezone.now() + timedelta(seconds=10)
+        self.assertLessEqual(cache.lifetime(self.token), 10)
+
+    def test_shared_tier(self):
+        """
+        a second process (a new UserinfoCache) finds the entry in the shared Django cache
+        """
+        UserinfoCache(cache_alias='default').set(self.token, USERINFO)
+        self.assertEqual(UserinfoCache(cache_alias='default').get(self.token), USERINFO)
+        self.assertIsNone(UserinfoCache().get(self.token))
+
+    def test_has_claim_cached(self):
+        """
+        once cached, HasClaim needs neither the database nor the userinfo endpoint
+        """
+        userinfo_cache.set(self.token, USERINFO)
+        request = SimpleNamespace(method="GET", auth=self.token)
+        with patch('oauth.oauth2_introspection.userinfo_session.get') as get, self.assertNumQueries(0):
+            permission = SubClaimPermission()
+            permission.userinfo_url = 'https://example.com/userinfo'
+            self.assertTrue(permission.has_permission(request, None))
+        get.assert_not_called()
+
+    def test_has_claim_fetch(self):
+        """
+        the first fetch from the userinfo endpoint populates the cache
+        """
+        request = SimpleNamespace(method="GET", auth=self.token)
+        with patch('oauth.oauth2_introspection.userinfo_session.get') as get:
+            get.return_value = SimpleNamespace(status_code=200, content=USERINFO.encode())
+            permission = SubClaimPermission()
+            permission.userinfo_url = 'https://example.com/userinfo'
+            self.assertTrue(permission.has_permission(request, None))
+        get.assert_called_once()
+        self.assertEqual(userinfo_cache.get(self.token), USERINFO)
+        self.token.refresh_from_db()
+        self.assertEqual(self.token.userinfo, USERINFO)
+
+    def test_save_userinfo(self):
+        """
+        the userinfo is stashed with a single UPDATE of just that column and only once
+        """
+        permission = SubClaimPermission()
+        with CaptureQueriesContext(connection) as ctx:
+            permission._save_userinfo(self.token, USERINFO)
+        self.assertEqual(len(ctx.captured_queries), 1)
+        sql = ctx.captured_queries[0]["sql"]
+        self.assertTrue(sql.startswith("UPDATE"))
+        self.assertNotIn('"token"', sql)
+        permission._save_userinfo(oauth_models.MyAccessToken.objects.get(pk=self.token.pk), '{"sub": "other"}')
+        self.token.refresh_from_db()
+        self.assertEqual(self.token.userinfo, USERINFO)
+
+
+class SingleFlightTestCase(TestCase):
+    """
+    test coalescing of concurrent calls
+    """
+
+    def test_coalesce(self):
+        """
+        concurrent callers for the same key share one call
+        """
+        flight = SingleFlight()
+        calls = []
+
+        def fetch():
+            calls.append(1)
+            time.sleep(0.2)
+            return "result"
+
+        results = []
+        threads = [threading.Thread(target=lambda: results.append(flight.do("key", fetch))) for _ in range(8)]
+        for t in threads:
+            t.start()
+        for t in threads:
+            t.join()
+        self.assertEqual(len(calls), 1)
+        self.assertEqual(results, ["result"] * 8)
+        flight.do("key", fetch)
+        self.assertEqual(len(calls), 2)
+
+    def test_error(self):
+        """
+        the leader's exception is raised and the key is released
+        """
+        flight = SingleFlight()
+        with self.assertRaises(ValueError):
+            flight.do("key", lambda: int("x"))
+        self.assertEqual(flight.do("key", lambda: 1), 1)
+
+
+class ClaimsTestCase(TestCase):
+    """
+    test the per-request parsed claims and compiled claim matchers
+    """
+
+    def test_compiled_matchers(self):
+        """
+        claims_map entries are compiled when the permission class is defined
+        """
+        self.assertIs(GroupClaimPermission.claim_matchers["DELETE"], False)
+        self.assertIs(GroupClaimPermission.claim_matchers["OPTIONS"], True)
+        self.assertTrue(callable(GroupClaimPermission.claim_matchers["GET"]))
+        self.assertTrue(callable(SubClaimPermission.claim_matchers["GET"]))
+
+    def test_parsed_once(self):
+        """
+        the userinfo is parsed once per request no matter how many HasClaim permissions are evaluated
+        """
+        request = SimpleNamespace(method="GET", auth=SimpleNamespace(userinfo=USERINFO))
+        with patch('oauth.oauth2_introspection.json.loads', wraps=json.loads) as loads:
+            self.assertTrue(GroupClaimPermission().has_permission(request, None))
+            self.assertTrue(SubClaimPermission().has_permission(request, None))
+            self.assertTrue(GroupClaimPermission().has_permission(request, None))
+        loads.assert_called_once()
+        self.assertEqual(request.oidc_claims.words("https://api.columbia.edu/claim/group"), {"team-a", "team-c"})
+
+    def test_claims(self):
+        """
+        word membership, RE matches and the None/empty string entries
+        """
+        auth = SimpleNamespace(userinfo=USERINFO)
+        for method, expected in (("GET", True), ("POST", False), ("DELETE", False), ("OPTIONS", True),
+                                 ("PUT", False)):
+            request = SimpleNamespace(method=method, auth=auth)
+            self.assertEqual(GroupClaimPermission().has_permission(request, None), expected, method)
+        claims = Claims(json.dumps({"sub": "user2", "groups": ["a"]}))
+        self.assertFalse(claims.matches("sub", re.compile("^user1$")))
+        self.assertFalse(claims.matches("missing", re.compile(".*")))
+        self.assertEqual(claims.words("groups"), frozenset())
+
+    def test_lease(self):
+        """
+        a leader in another process holding the lease is waited on via peek
+        """
+        cache.add("singleflight:key", 1, 10)
+        flight = SingleFlight(cache_alias="default", lease_timeout=1, poll_interval=0.01)
+        peeks = iter([None, None, "other"])
+        self.assertEqual(flight.do("key", lambda: "mine", peek=lambda: next(peeks)), "other")
+        self.assertEqual((flight.requests, flight.calls), (1, 0))
+        # the lease holder died:
+        flight = SingleFlight(cache_alias="default", lease_timeout=0.05, poll_interval=0.01)
+        self.assertEqual(flight.do("key", lambda: "mine", peek=lambda: None), "mine")
+        cache.delete("singleflight:key")
+        self.assertEqual(flight.do("key", lambda: "mine", peek=lambda: "other"), "mine")
+        self.assertIsNone(cache.get("singleflight:key"))
+
+    def test_introspection(self):
+        """
+        concurrent introspections of the same token are coalesced and each gets its own AccessToken instance
+        """
+        token = oauth_models.MyAccessToken(token="IntrospectedToken")  # nosec B106
+
+        def introspect(self, *args, **kwargs):
+            time.sleep(0.2)
+            return token
+
+        results = []
+        validator = CustomOAuth2Validator()
+        with patch.object(OAuth2Validator, "_get_token_from_authentication_server", autospec=True,
+                          side_effect=introspect) as mock:
+            threads = [
+                threading.Thread(target=lambda: results.append(validator._get_token_from_authentication_server(
+                    "IntrospectedToken", "https://example.com/introspect", None, None)))
+                for _ in range(4)
+            ]
+            for t in threads:
+                t.start()
+            for t in threads:
+                t.join()
+        mock.assert_called_once()
+        self.assertEqual([r.token for r in results], ["IntrospectedToken"] * 4)
+        self.assertEqual(len({id(r) for r in results}), 4)
+
+    def test_introspection_peek(self):
+        """
+        while another worker holds the lease, the stale stored token isn't taken as its result
+        """
+        validator = CustomOAuth2Validator()
+        token = oauth_models.MyAccessToken.objects.create(  # nosec B106
+            token="StaleToken", scope="read", expires=timezone.now() - timedelta(minutes=1))
+        self.assertIsNone(validator._peek_access_token("StaleToken"))
+        self.assertIsNone(validator._peek_access_token("MissingToken"))
+        token.expires = timezone.now() + timedelta(minutes=5)
+        token.save()
+        self.assertEqual(validator._peek_access_token("StaleToken").pk, token.pk)
+
+
+class UserinfoHandler(BaseHTTPRequestHandler):
+    """
+    a userinfo endpoint that fails the first time
+    """
+    protocol_version = "HTTP/1.1"
+    requests = []
+
+    def do_GET(self):
+        self.requests.append(self.client_address)
+        status = 503 if len(self.requests) == 1 else 200
+        body = USERINFO.encode()
+        self.send_response(status)
+        self.send_header("Content-Length", str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+    def log_message(self, *args):
+        pass
+
+
+class PooledSessionTestCase(TestCase):
+    """
+    test the keep-alive userinfo session
+    """
+
+    def setUp(self):
+        UserinfoHandler.requests = []
+        self.server = ThreadingHTTPServer(("127.0.0.1", 0), UserinfoHandler)
+        threading.Thread(target=self.server.serve_forever, daemon=True).start()
+        self.url = "http://127.0.0.1:{}/userinfo".format(self.server.server_address[1])
+
+    def tearDown(self):
+        self.server.shutdown()
+        self.server.server_close()
+
+    def test_retry_keepalive(self):
+        """
+        a 503 is retried and the connection is reused
+        """
+        session = PooledSession(retries=2, backoff=0)
+        for _ in range(3):
+            response = session.get(self.url)
+            self.assertEqual(response.status_code, 200)
+            self.assertEqual(response.content.decode(), USERINFO)
+        self.assertEqual(len(UserinfoHandler.requests), 4)
+        self.assertEqual(len(set(UserinfoHandler.requests)), 1)
+
+    def test_timeout(self):
+        """
+        requests get the default timeouts
+        """
+        session = PooledSession(connect_timeout=1, read_timeout=2)
+        with patch("requests.Session.send") as send:
+            session.get(self.url)
+        self.assertEqual(send.call_args.kwargs["timeout"], (1, 2))
+
+
+@override_settings(OAUTH2_JWT_VALIDATION={"ENABLED": True, "ISSUER": "https://as.example.com",
+                                          "AUDIENCE": "https://api.example.com", "ALGORITHMS": ["RS256"]})
+class JWTValidationTestCase(TestCase):
+    """
+    test offline validation of JWT access tokens
+    """
+
+    def setUp(self):
+        self.key = jwk.JWK.generate(kty="RSA", size=2048, kid="key1")
+        self.jwks = JWKSCache(url=None, refresh_interval=0)
+        self.jwks.keyset = jwk.JWKSet()
+        self.jwks.keyset.add(self.key)
+        patcher = patch("oauth.jwks.jwks_cache", self.jwks)
+        patcher.start()
+        self.addCleanup(patcher.stop)
+        jwt_user_cache.clear()
+        self.addCleanup(jwt_user_cache.clear)
+
+    def token(self, key=None, typ="at+jwt", **claims):
+        key = key or self.key
+        claims = {"iss": "https://as.example.com", "aud": "https://api.example.com", "exp": int(time.time()) + 300,
+                  **claims}
+        token = jwt.JWT(header={"alg": "RS256", "kid": key.key_id, "typ": typ}, claims=claims)
+        token.make_signed_token(key)
+        return token.serialize()
+
+    def test_valid(self):
+        """
+        a valid JWT becomes an unsaved access token with its claims as the userinfo
+        """
+        token = self.token(username="user1", sub="user1", scope="read auth-none")
+        access_token = CustomOAuth2Validator()._load_access_token(token)
+        self.assertIsNone(access_token.pk)
+        self.assertEqual(access_token.user.username, "user1")
+        self.assertTrue(access_token.is_valid(["read"]))
+        self.assertEqual(json.loads(access_token.userinfo)["sub"], "user1")
+        self.assertEqual(Claims(access_token.userinfo).words("scope"), {"read", "auth-none"})
+
+    def test_user_cached(self):
+        """
+        the token's user is looked up (or created) once, not on every request
+        """
+        validator = CustomOAuth2Validator()
+        first = validator._load_access_token(self.token(username="user1"))
+        with self.assertNumQueries(0):
+            second = validator._load_access_token(self.token(username="user1"))
+        self.assertEqual(second.user.pk, first.user.pk)
+        self.assertIsNot(second.user, first.user)
+
+    def test_invalid(self):
+        """
+        expired, wrong issuer or unknown key tokens aren't valid
+        """
+        validator = CustomOAuth2Validator()
+        self.assertIsNone(validator._load_access_token(self.token(exp=int(time.time()) - 3600)))
+        self.assertIsNone(validator._load_access_token(self.token(iss="https://evil.example.com")))
+        self.assertIsNone(validator._load_access_token(self.token(aud="https://other.example.com")))
+        # an ID token signed by the same AS isn't an access token
+        self.assertIsNone(validator._load_access_token(self.token(typ="JWT")))
+        self.assertIsNotNone(validator._load_access_token(self.token(typ="application/at+jwt")))
+        other = jwk.JWK.generate(kty="RSA", size=2048, kid="key2")
+        self.assertIsNone(validator._load_access_token(self.token(key=other)))
+        self.assertIsNone(validator._load_access_token("not.a.jwt"))
+
+    def test_audience_required(self):
+        """
+        without an audience any token that the AS signed would be accepted
+        """
+        with override_settings(OAUTH2_JWT_VALIDATION={"ENABLED": True, "ISSUER": "https://as.example.com"}):
+            with self.assertRaises(ImproperlyConfigured):
+                CustomOAuth2Validator()._load_access_token(self.token())
+
+    def test_request(self):
+        """
+        a client credentials JWT is authenticated and authorized without any database lookup of the token
+        """
+        token = self.token(scope="auth-none demo-djt-sla-bronze read")
+        cache.clear()
+        with self.assertNumQueries(1):  # just the (zero) count of courses
+            response = self.client.get("/v1/courses/", HTTP_AUTHORIZATION="Bearer {}".format(token))
+        self.assertEqual(response.status_code, 200)
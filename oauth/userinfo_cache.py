@@ -0,0 +1,114 @@
+import hashlib
+import logging
+import threading
+import time
+from collections import OrderedDict
+from datetime import datetime
+
+from django.conf import settings
+from django.core.cache import caches
+from django.utils import timezone
+
+log = logging.getLogger(__name__)
+
+
+class UserinfoCache(object):
+    """
+    Two-tier cache of OIDC userinfo responses keyed by the access token's checksum:
+
+    1. A per-process LRU of up to `maxsize` entries.
+    2. An optional shared Django cache (`settings.CACHES[cache_alias]`) so that gunicorn workers
+       (or other hosts) don't each have to fetch the userinfo for the same token.
+
+    An entry lives for at most `timeout` seconds and never outlives the access token it belongs to.
+    Configure with `settings.OAUTH2_USERINFO_CACHE`.
+    """
+
+    def __init__(self, maxsize=1024, timeout=300, cache_alias=None):
+        self.maxsize = maxsize
+        self.timeout = timeout
+        self.cache_alias = cache_alias
+        self._lock = threading.Lock()
+        self._entries = OrderedDict()
+
+    @classmethod
+    def from_settings(cls):
+        """
+        Instantiate from `settings.OAUTH2_USERINFO_CACHE`
+        """
+        conf = getattr(settings, "OAUTH2_USERINFO_CACHE", {})
+        return cls(
+            maxsize=conf.get("MAXSIZE", 1024),
+            timeout=conf.get("TIMEOUT", 300),
+            cache_alias=conf.get("CACHE_ALIAS", None),
+        )
+
+    @staticmethod
+    def key(access_token):
+        """
+        Cache key for the access token: never the token itself.
+        """
+        checksum = getattr(access_token, "token_checksum", None)
+        if not checksum:
+            checksum = hashlib.sha256(str(access_token.token).encode("utf-8")).hexdigest()
+        return "oauth.userinfo:{}".format(checksum)
+
+    def lifetime(self, access_token):
+        """
+        Seconds that a userinfo for this access token may be cached.
+        """
+        ttl = self.timeout
+        expires = getattr(access_token, "expires", None)
+        if isinstance(expires, datetime):
+            ttl = min(ttl, (expires - timezone.now()).total_seconds())
+        return ttl
+
+    def get(self, access_token):
+        """
+        :return: the cached userinfo response string for the access token or None
+        """
+        key = self.key(access_token)
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is not None:
+                userinfo, expires_at = entry
+                if expires_at > time.monotonic():
+                    self._entries.move_to_end(key)
+                    return userinfo
+                del self._entries[key]
+        if self.cache_alias:
+            userinfo = caches[self.cache_alias].get(key)
+            if userinfo is not None:
+                self._set_local(key, userinfo, self.lifetime(access_token))
+                return userinfo
+        return None
+
+    def set(self, access_token, userinfo):
+        """
+        Cache the userinfo response string for the access token.
+        """
+        ttl = self.lifetime(access_token)
+        if userinfo is None or ttl <= 0:
+            return
+        key = self.key(access_token)
+        self._set_local(key, userinfo, ttl)
+        if self.cache_alias:
+            caches[self.cache_alias].set(key, userinfo, max(int(ttl), 1))
+
+    def clear(self):
+        """
+        Empty the per-process tier.
+        """
+        with self._lock:
+            self._entries.clear()
+
+    def _set_local(self, key, userinfo, ttl):
+        with self._lock:
+            self._entries[key] = (userinfo, time.monotonic() + ttl)
+            self._entries.move_to_end(key)
+            while len(self._entries) > self.maxsize:
+                self._entries.popitem(last=False)
+
+
+#: the process-wide userinfo cache
+userinfo_cache = UserinfoCache.from_settings()
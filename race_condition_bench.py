@@ -0,0 +1,95 @@
+#!/usr/bin/env python3
+"""
+Benchmark the single-flight coalescing of userinfo fetches for the race condition in race_condition.py:
+a burst of parallel requests all carrying the same new access token that isn't cached yet.
+
+Rather than needing a running server and an external AS, this drives HasClaim in-process with a simulated
+userinfo endpoint that takes --latency seconds and reports the number of userinfo calls issued vs. the
+number of requests served. Compare with --no-coalesce to see the uncoalesced behavior:
+
+$ ./race_condition_bench.py --tokens 4 --requests 16 --latency 0.2
+$ ./race_condition_bench.py --tokens 4 --requests 16 --latency 0.2 --no-coalesce
+"""
+import argparse
+import json
+import os
+import time
+from queue import Queue
+from threading import Lock, Thread
+from types import SimpleNamespace
+
+import django
+
+os.environ.setdefault("DJANGO_SETTINGS_MODULE", "training.settings")
+django.setup()
+
+from oauth import oauth2_introspection  # noqa: E402
+from oauth.oauth2_introspection import HasClaim  # noqa: E402
+from oauth.singleflight import SingleFlight  # noqa: E402
+from oauth.userinfo_cache import userinfo_cache  # noqa: E402
+
+parser = argparse.ArgumentParser(description=__doc__.split("\n")[1])
+parser.add_argument("--tokens", type=int, default=4, help="number of distinct new access tokens")
+parser.add_argument("--requests", type=int, default=16, help="parallel requests per access token")
+parser.add_argument("--latency", type=float, default=0.2, help="simulated userinfo endpoint latency (seconds)")
+parser.add_argument("--no-coalesce", action="store_true", help="disable single-flight coalescing")
+args = parser.parse_args()
+
+issued = 0
+issued_lock = Lock()
+
+
+class NoFlight(object):
+    """
+    Just make the call: what HasClaim did before single-flight coalescing.
+    """
+    requests = calls = 0
+
+    def do(self, key, fn, peek=None):
+        return fn()
+
+
+class BenchClaimPermission(HasClaim):
+    claim = "sub"
+    claims_map = {"GET": "user1"}
+
+    def _get_claims_from_authentication_server(self, request):
+        global issued
+        with issued_lock:
+            issued += 1
+        time.sleep(args.latency)
+        return json.dumps({"sub": "user1"})
+
+
+def send_request():
+    request = q.get()
+    results.append(permission.has_permission(request, None))
+    q.task_done()
+
+
+oauth2_introspection.userinfo_flight = NoFlight() if args.no_coalesce else SingleFlight()
+userinfo_cache.clear()
+permission = BenchClaimPermission()
+permission.userinfo_url = "https://example.com/userinfo"
+results = []
+requests = [
+    SimpleNamespace(method="GET", auth=SimpleNamespace(token="BenchToken{}".format(t), expires=None, userinfo=None))
+    for t in range(args.tokens)
+    for _ in range(args.requests)
+]
+
+q = Queue(len(requests))
+start = time.monotonic()
+for i in range(len(requests)):
+    t = Thread(target=send_request)
+    t.daemon = True
+    t.start()
+for request in requests:
+    q.put(request)
+q.join()
+elapsed = time.monotonic() - start
+
+print("coalescing:         {}".format("off" if args.no_coalesce else "on"))
+print("requests served:    {} ({} permitted)".format(len(results), results.count(True)))
+print("userinfo calls:     {} for {} tokens".format(issued, args.tokens))
+print("elapsed:            {:.3f}s".format(elapsed))
@@ -0,0 +1,89 @@
+#!/usr/bin/env python3
+"""
+Benchmark the stdlib json vs. orjson {json:api} renderers and parsers on a page of --courses courses.
+
+The courses are created in a throwaway test database and serialized once; then each renderer encodes
+the page and each parser decodes it (just the JSON: a page isn't a valid request document) --repeat times,
+reporting the bytes/sec. "render" includes building the {json:api} document from the serializer data
+while "encode" is just the JSON encoding of the built document:
+
+$ ./renderer_bench.py --courses 1000 --repeat 20
+"""
+import argparse
+import io
+import json
+import os
+import time
+import uuid
+from datetime import date
+
+import django
+
+os.environ.setdefault("DJANGO_SETTINGS_MODULE", "training.settings")
+django.setup()
+
+from django.db import connection  # noqa: E402
+from django.test.utils import setup_test_environment  # noqa: E402
+from rest_framework.parsers import JSONParser  # noqa: E402
+from rest_framework.renderers import JSONRenderer as DRFJSONRenderer  # noqa: E402
+from rest_framework.request import Request  # noqa: E402
+from rest_framework.response import Response  # noqa: E402
+from rest_framework.test import APIRequestFactory  # noqa: E402
+
+from myapp.models import Course  # noqa: E402
+from myapp.parsers import ORJSONBaseParser  # noqa: E402
+from myapp.renderers import JSONRenderer, ORJSONBaseRenderer, ORJSONRenderer  # noqa: E402
+from myapp.views import CourseViewSet  # noqa: E402
+
+parser = argparse.ArgumentParser(description=__doc__.split("\n")[1])
+parser.add_argument("--courses", type=int, default=1000, help="number of courses in the page")
+parser.add_argument("--repeat", type=int, default=20, help="number of times to render and parse the page")
+args = parser.parse_args()
+
+MEDIA_TYPE = "application/vnd.api+json"
+
+
+def timed(fn):
+    start = time.perf_counter()
+    for _ in range(args.repeat):
+        result = fn()
+    return time.perf_counter() - start, result
+
+
+setup_test_environment()
+connection.creation.create_test_db(verbosity=0)
+Course.objects.bulk_create(
+    Course(
+        id=uuid.uuid4(),
+        school_bulletin_prefix_code="BENCH",
+        suffix_two="00",
+        subject_area_code="BENCH",
+        course_number="{:05d}".format(i),
+        course_identifier="BENCH{:05d}".format(i),
+        course_name="Benchmark course é #{}".format(i),
+        course_description="A course description that is long enough to be typical. " * 4,
+        effective_start_date=date(2024, 1, 1),
+        last_mod_user_name="bench",
+        last_mod_date=date(2024, 1, 1),
+    )
+    for i in range(args.courses)
+)
+
+# serialize a page of all the courses, just as CourseViewSet.list() would.
+view = CourseViewSet(action="list", format_kwarg=None, kwargs={})
+view.request = Request(APIRequestFactory().get("/v1/courses/"))
+data = view.get_serializer(view.get_queryset(), many=True).data
+context = {"view": view, "request": view.request, "response": Response(data)}
+
+print("courses:            {}".format(args.courses))
+for renderer, encoder, json_parser in ((JSONRenderer(), DRFJSONRenderer(), JSONParser()),
+                                       (ORJSONRenderer(), ORJSONBaseRenderer(), ORJSONBaseParser())):
+    elapsed, content = timed(lambda: renderer.render(data, MEDIA_TYPE, context))
+    rendered = len(content) * args.repeat / elapsed
+    document = json.loads(content)
+    elapsed, _ = timed(lambda: encoder.render(document, MEDIA_TYPE, {}))
+    encoded = len(content) * args.repeat / elapsed
+    elapsed, _ = timed(lambda: json_parser.parse(io.BytesIO(content), MEDIA_TYPE))
+    parsed = len(content) * args.repeat / elapsed
+    print("{:20}{:,} bytes: render {:,.1f} MB/s, encode {:,.1f} MB/s, parse {:,.1f} MB/s".format(
+        renderer.__class__.__name__ + ":", len(content), rendered / 1e6, encoded / 1e6, parsed / 1e6))
@@ -188,27 +188,33 @@ USE_TZ = True
 STATIC_URL = '/static/'
 STATIC_ROOT = '/var/www/html'
 
+# Encode and decode {json:api} documents with orjson (faster) rather than the stdlib json.
+ORJSON = strtobool(os.environ.get('DJANGO_ORJSON', 'true'))
+
 # DRF and DJA settings
 REST_FRAMEWORK = {
     'PAGE_SIZE': 10,
     'EXCEPTION_HANDLER': 'rest_framework_json_api.exceptions.exception_handler',
     # 'DEFAULT_PAGINATION_CLASS': 'rest_framework_json_api.pagination.JsonApiPageNumberPagination',
     # 'DEFAULT_PAGINATION_CLASS': 'rest_framework_json_api.pagination.JsonApiLimitOffsetPagination',
-    "DEFAULT_PAGINATION_CLASS": "drf_spectacular_jsonapi.schemas.pagination.JsonApiPageNumberPagination",
+    # "DEFAULT_PAGINATION_CLASS": "drf_spectacular_jsonapi.schemas.pagination.JsonApiPageNumberPagination",
+    # page[number] pagination unless page[cursor] is requested:
+    "DEFAULT_PAGINATION_CLASS": "myapp.pagination.JsonApiPageNumberOrCursorPagination",
     'DEFAULT_PARSER_CLASSES': (
-        'rest_framework_json_api.parsers.JSONParser',
+        'myapp.parsers.ORJSONParser' if ORJSON else 'myapp.parsers.JSONParser',
         'rest_framework.parsers.FormParser',
         'rest_framework.parsers.MultiPartParser',
     ),
     'DEFAULT_RENDERER_CLASSES': (
-        'rest_framework_json_api.renderers.JSONRenderer',  # application/vnd.api+json
+        # application/vnd.api+json:
+        'myapp.renderers.ORJSONRenderer' if ORJSON else 'myapp.renderers.JSONRenderer',
         'rest_framework.renderers.BrowsableAPIRenderer',  # text/html: ?format=api
     ),
     'DEFAULT_FILTER_BACKENDS': (
         'rest_framework_json_api.filters.QueryParameterValidationFilter',  # for query parameter validation
         'rest_framework_json_api.filters.OrderingFilter',  # for sort
-        'rest_framework_json_api.django_filters.DjangoFilterBackend',    # for `filter[field]` filtering
-        'rest_framework.filters.SearchFilter',    # for keyword filtering across multiple fields
+        'myapp.filters.DjangoFilterBackend',    # for `filter[field]` and `filter[effective_on]` filtering
+        'myapp.search.FullTextSearchFilter',    # for keyword filtering across multiple fields
     ),
     'SEARCH_PARAM': 'filter[search]',
     'DEFAULT_METADATA_CLASS': 'rest_framework_json_api.metadata.JSONAPIMetadata',
@@ -273,6 +279,79 @@ OAUTH2_PROVIDER = {
     'ALLOWED_SCHEMES': ['https','http'],
 }
 
+# Cache userinfo responses (by access token checksum) so that HasClaim doesn't refetch them.
+# See oauth.userinfo_cache.UserinfoCache.
+OAUTH2_USERINFO_CACHE = {
+    # per-process LRU size:
+    'MAXSIZE': int(os.environ.get('OAUTH2_USERINFO_CACHE_MAXSIZE', '1024')),
+    # seconds; an entry never outlives its access token:
+    'TIMEOUT': int(os.environ.get('OAUTH2_USERINFO_CACHE_TIMEOUT', '300')),
+    # optional CACHES alias to share userinfo across workers:
+    'CACHE_ALIAS': os.environ.get('OAUTH2_USERINFO_CACHE_ALIAS', None),
+}
+
+# Optionally validate JWT-format access tokens from an external AS locally, against its cached JWKS,
+# rather than introspecting them. The token's claims stand in for the userinfo response.
+# See myapp.oauth2_validator.CustomOAuth2Validator and oauth.jwks.JWKSCache.
+OAUTH2_JWT_VALIDATION = {
+    'ENABLED': os.environ.get('OAUTH2_JWT_VALIDATION', 'false').lower() == 'true',
+    'JWKS_URL': os.environ.get('OAUTH2_JWKS_URL', None if OAUTH2_SERVER == 'self' else OAUTH2_SERVER + '/pf/JWKS'),
+    # required `iss` claim, if any, and `aud` claim (this resource server's identifier; required when ENABLED):
+    'ISSUER': os.environ.get('OAUTH2_JWT_ISSUER', None if OAUTH2_SERVER == 'self' else OAUTH2_SERVER),
+    'AUDIENCE': os.environ.get('OAUTH2_JWT_AUDIENCE', None),
+    # required `typ` header (RFC 9068 access token):
+    'TYPE': os.environ.get('OAUTH2_JWT_TYPE', 'at+jwt'),
+    'ALGORITHMS': ['RS256', 'ES256'],
+    # claim that identifies the user, if any:
+    'USERNAME_CLAIM': os.environ.get('OAUTH2_JWT_USERNAME_CLAIM', 'username'),
+    # per-process LRU size and seconds that the claimed users are cached for:
+    'USER_CACHE_MAXSIZE': int(os.environ.get('OAUTH2_JWT_USER_CACHE_MAXSIZE', '1024')),
+    'USER_CACHE_TIMEOUT': int(os.environ.get('OAUTH2_JWT_USER_CACHE_TIMEOUT', '300')),
+    # seconds between background JWKS refreshes and minimum seconds between refreshes for an unknown `kid`:
+    'REFRESH_INTERVAL': int(os.environ.get('OAUTH2_JWKS_REFRESH_INTERVAL', '300')),
+    'MIN_REFRESH_INTERVAL': int(os.environ.get('OAUTH2_JWKS_MIN_REFRESH_INTERVAL', '30')),
+}
+
+# Cache rendered {json:api} resource objects. Disabled unless a CACHES alias is given, which must
+# be shared by all workers (e.g. redis or memcached) so that they all see the invalidations.
+# See myapp.fragments.FragmentCache.
+JSONAPI_FRAGMENT_CACHE = {
+    'CACHE_ALIAS': os.environ.get('JSONAPI_FRAGMENT_CACHE_ALIAS', None),
+    # seconds:
+    'TIMEOUT': int(os.environ.get('JSONAPI_FRAGMENT_CACHE_TIMEOUT', '300')),
+}
+
+# `load_fixtures` and myapp.fixture_loader.FixtureLoaderMixIn: optionally snapshot the loaded rows in this
+# directory so later SQLite test runs restore them instead of deserializing the fixtures again.
+# See myapp.fixture_loader.FixtureLoader.
+FIXTURE_LOADER = {
+    'SNAPSHOT_DIR': os.environ.get('DJANGO_FIXTURE_SNAPSHOT_DIR', None),
+}
+
+# Coalesce concurrent userinfo and introspection calls for the same access token.
+# See oauth.singleflight.SingleFlight.
+OAUTH2_SINGLE_FLIGHT = {
+    # seconds a request waits on another thread's in-flight call before making its own:
+    'TIMEOUT': int(os.environ.get('OAUTH2_SINGLE_FLIGHT_TIMEOUT', '30')),
+    # optional CACHES alias for a lease that coalesces calls across workers:
+    'CACHE_ALIAS': os.environ.get('OAUTH2_SINGLE_FLIGHT_CACHE_ALIAS', None),
+    # seconds a worker holds the lease:
+    'LEASE_TIMEOUT': int(os.environ.get('OAUTH2_SINGLE_FLIGHT_LEASE_TIMEOUT', '10')),
+}
+
+# Keep-alive connection pool for calls to the external OIDC userinfo endpoint.
+# See oauth.http_session.PooledSession.
+OAUTH2_HTTP_SESSION = {
+    # connections kept alive per host; should be at least the number of threads per worker:
+    'POOL_SIZE': int(os.environ.get('OAUTH2_HTTP_POOL_SIZE', '10')),
+    # seconds:
+    'CONNECT_TIMEOUT': float(os.environ.get('OAUTH2_HTTP_CONNECT_TIMEOUT', '3.05')),
+    'READ_TIMEOUT': float(os.environ.get('OAUTH2_HTTP_READ_TIMEOUT', '5')),
+    # retries with exponential backoff (BACKOFF * 2**n seconds) on connection errors and 429/5xx:
+    'RETRIES': int(os.environ.get('OAUTH2_HTTP_RETRIES', '2')),
+    'BACKOFF': float(os.environ.get('OAUTH2_HTTP_BACKOFF', '0.2')),
+}
+
 # Use swappable models to extend the Access Token to include the userinfo claims.
 # N.B. Through trial and error I've found that I had to extend all the models that are related to AccessToken.
 # OAUTH2_PROVIDER_APPLICATION_MODEL = "oauth.MyApplication"
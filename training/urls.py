@@ -19,7 +19,7 @@ from django.contrib import admin
 from django.contrib.auth import views as auth_views
 from django.contrib.staticfiles.urls import staticfiles_urlpatterns
 from django.contrib.staticfiles.views import serve
-from django.urls import include, path
+from django.urls import include, path, re_path
 from django.views.generic.base import RedirectView, TemplateView
 from rest_framework import routers
 from drf_spectacular.views import SpectacularAPIView, SpectacularRedocView, SpectacularSwaggerView, SpectacularSwaggerOauthRedirectView
@@ -74,6 +74,8 @@ urlpatterns = [
     path('v1/instructors/<pk>/relationships/<related_field>/',
         views.InstructorRelationshipView.as_view(),
         name='instructor-relationships'),
+    # {json:api} Atomic Operations extension:
+    re_path(r'^v1/operations/?$', views.OperationsView.as_view(), name='operations'),
     # OpenAPI schema using drf-spectacular and drf-spectacular-json-api:
     path('api/schema/', SpectacularAPIView.as_view(), name='schema'),
     # Optional UI: